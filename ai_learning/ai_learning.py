@@ -1,16 +1,30 @@
-from speech_to_text import transcribe_audio_file
+from speech_to_text import TranscriptionPool, transcribe_audio_file
 import asyncio
+import functools
 import os
-from ollama import AsyncClient
-from typing import Optional
+from ollama_client import OllamaClient, get_client, close_client
+from summary_tree import reduce_text
+from tracing import get_tracer, close_tracer
+from batch_scheduler import StageLimits, run_batch
+from job_manifest import JobManifest, MANIFEST_FILE, pending_runs, run_dir_for
+from audio_fingerprint import SKIP_DUPLICATE_AUDIO, get_fingerprint_index
+from transcript_store import STORE_FILE, TranscriptStore
+from lecture_index import INDEX_LECTURES, close_lecture_index, get_lecture_index
+from typing import Callable, Dict, List, Optional, Tuple
 import logging
 import time
 from datetime import timedelta
-import json
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Chunk summaries sent to Ollama at the same time; match the server's OLLAMA_NUM_PARALLEL
+MAX_PARALLEL_REQUESTS = max(1, int(os.environ.get("OLLAMA_NUM_PARALLEL", "4")))
+MAX_CHUNK_RETRIES = 3
+RETRY_BACKOFF_SECONDS = 2.0
+# Transcribed chunks allowed to wait for the summarizer before transcription pauses
+STT_MAX_AHEAD = 4
+
 SYSTEM_PROMPT = """
 Sei un assistente virtuale esperto nel riassumere testi lunghi in modo chiaro, accurato e informativo.
 
@@ -33,135 +47,292 @@ Sei un assistente virtuale esperto nel riassumere testi lunghi in modo chiaro, a
 9. Concludi con una frase che sintetizzi l'importanza, l'impatto o lo stato attuale dell'argomento.
 """
 
-def get_audio_files(audio_dir='ai_learning/audio'):
-    """Get all WAV files from audio directory"""
-    return [os.path.join(audio_dir, f) for f in os.listdir(audio_dir) if f.lower().endswith('.wav')]
+def get_audio_files(audio_dir='ai_learning/audio', skip_duplicates: bool = SKIP_DUPLICATE_AUDIO):
+    """Get all WAV files from audio directory, leaving out copies of lectures already seen.
 
-def split_text_into_chunks(text: str, max_chars: int = 4000) -> list[str]:
-    """Split text into chunks while preserving sentence structure."""
-    paragraphs = text.split('\n\n')
-    chunks = []
-    current_chunk = []
-    current_length = 0
-    
-    for para in paragraphs:
-        if current_length + len(para) > max_chars and current_chunk:
-            chunks.append('\n\n'.join(current_chunk))
-            current_chunk = []
-            current_length = 0
-        
-        current_chunk.append(para)
-        current_length += len(para) + 2
-    if current_chunk:
-        chunks.append('\n\n'.join(current_chunk))
-    
-    return chunks
+    Each file is checked against the fingerprint index (see audio_fingerprint);
+    files checked before are answered from the index without reading them.
+    """
+    files = sorted(os.path.join(audio_dir, f) for f in os.listdir(audio_dir) if f.lower().endswith('.wav'))
+    if not skip_duplicates:
+        return files
+    index = get_fingerprint_index()
+    unique = []
+    for audio_file in files:
+        try:
+            original = index.check(audio_file)
+        except Exception as e:
+            logger.warning(f"Could not fingerprint {os.path.basename(audio_file)}, keeping it: {e}")
+            original = None
+        if original is None or os.path.abspath(original) == os.path.abspath(audio_file):
+            unique.append(audio_file)
+        else:
+            logger.info(f"{os.path.basename(audio_file)} duplicates {os.path.basename(original)}, skipping")
+    return unique
 
-async def summarize_chunk(chunk_file: str, chunk_num: int, total_chunks: int) -> str:
-    """Summarize a single chunk of text."""
-    with open(chunk_file, 'r', encoding='utf-8') as f:
-        chunk_text = f.read()
-    
+async def summarize_chunk(chunk_text: str, chunk_num: int, total_chunks: int,
+                          client: Optional[OllamaClient] = None, store: Optional[TranscriptStore] = None,
+                          on_event: Optional[Callable[[str, Dict], None]] = None) -> str:
+    """Summarize a single chunk of text. Errors are raised so the caller can retry.
+
+    The summary is added to `store` when one is given. `on_event` gets a
+    'summary_token' event for every streamed piece, see `process_audio_file`.
+    """
     messages = [
         {'role': 'system', 'content': SYSTEM_PROMPT},
         {'role': 'user', 'content': f'Questo è il chunk {chunk_num}/{total_chunks}. '
                                   f'Raccogli le informazioni chiave: {chunk_text}'}
     ]
     
+    logger.info(f"Summarizing chunk {chunk_num}/{total_chunks}")
+    start = time.perf_counter()
+    parts = []
+    async for content in (client or get_client()).chat_stream(messages):
+        parts.append(content)
+        if on_event is not None and content:
+            on_event('summary_token', {'chunk': chunk_num, 'text': content})
+    summary_text = ''.join(parts)
+    if store is not None:
+        with get_tracer().span('file_io', op='write_summary', chunk=chunk_num):
+            store.add_summary(chunk_num, summary_text, time.perf_counter() - start)
+
+    # Chunks finish out of order, so print each summary whole instead of streaming tokens
+    print(f"\nChunk {chunk_num}/{total_chunks}:")
+    print("-" * 50)
+    print(summary_text, flush=True)
+    return summary_text
+
+async def summarize_chunk_with_retry(semaphore: asyncio.Semaphore, chunk_text: str, chunk_num: int,
+                                     total_chunks: int, client: Optional[OllamaClient] = None,
+                                     max_retries: int = MAX_CHUNK_RETRIES,
+                                     store: Optional[TranscriptStore] = None,
+                                     on_event: Optional[Callable[[str, Dict], None]] = None) -> str:
+    """Summarize a chunk under the shared in-flight limit, retrying only this chunk on failure."""
+    for attempt in range(1, max_retries + 1):
+        try:
+            with get_tracer().span('llm_queue_wait', chunk=chunk_num):
+                await semaphore.acquire()
+            try:
+                return await summarize_chunk(chunk_text, chunk_num, total_chunks, client, store, on_event)
+            finally:
+                semaphore.release()
+        except Exception as e:
+            logger.warning(f"Chunk {chunk_num}: attempt {attempt}/{max_retries} failed - {e}")
+            if on_event is not None:
+                # Tokens streamed by the failed attempt are to be discarded
+                on_event('chunk_retry', {'chunk': chunk_num, 'attempt': attempt, 'error': str(e)})
+            if attempt < max_retries:
+                await asyncio.sleep(RETRY_BACKOFF_SECONDS * attempt)
+    logger.error(f"Summarization error for chunk {chunk_num}: giving up after {max_retries} attempts")
+    return ""
+
+def write_final_summary(summaries: List[str], work_dir: str = "text",
+                        manifest: Optional[JobManifest] = None) -> None:
+    """Write the combined chunk summaries and remove temporary files.
+
+    The transcript store stays with the run: it is the lecture's transcript.
+    """
+    print("\n\nFinal Combined Summary:")
+    print("=" * 80)
+    print('\n\n'.join(summaries))
+    
+    with open(os.path.join(work_dir, "final_summary.txt"), 'w', encoding='utf-8') as f:
+        f.write('\n\n'.join(summaries))
+    if manifest is not None:
+        manifest.mark_done('summarized')
+    print("\nCleaning up temporary files...")
     try:
-        print(f"\nProcessing chunk {chunk_num}/{total_chunks}:")
-        print("-" * 50)
-        
-        summary = []
-        async for part in await AsyncClient().chat(
-            model='llama3.2:latest',
-            messages=messages,
-            stream=True
-        ):
-            content = part['message']['content']
-            summary.append(content)
-            print(content, end='', flush=True)
-        summary_text = ''.join(summary)
-        summary_file = f"text/summary_{chunk_num:03d}.txt"
-        with open(summary_file, 'w', encoding='utf-8') as f:
-            f.write(summary_text)
+        keep_files = {'final_summary.txt', 'refined_summary.txt', MANIFEST_FILE, STORE_FILE}
+        for file in os.listdir(work_dir):
+            if file not in keep_files:
+                file_path = os.path.join(work_dir, file)
+                if os.path.isfile(file_path):
+                    os.remove(file_path)
         
-        return summary_text
+        logger.info("Temporary files cleaned up successfully")
     except Exception as e:
-        logger.error(f"Summarization error for chunk {chunk_num}: {e}")
-        return ""
+        logger.error(f"Error cleaning up temporary files: {e}")
 
-async def summarize_text(text: str) -> None:
-    """Generate summary using Ollama API, processing text chunks sequentially."""
+async def summarize_text(text: str, max_parallel: int = MAX_PARALLEL_REQUESTS,
+                         client: Optional[OllamaClient] = None, work_dir: str = "text") -> None:
+    """Summarize every chunk in the transcript store of `work_dir`, up to `max_parallel` at once."""
     try:
-        with open("text/chunks_metadata.json", 'r') as f:
-            metadata = json.load(f)
-        summaries = []
-        for i, chunk_file in enumerate(metadata['chunk_files'], 1):
-            summary = await summarize_chunk(chunk_file, i, metadata['total_chunks'])
-            summaries.append(summary)
-        print("\n\nFinal Combined Summary:")
-        print("=" * 80)
-        print('\n\n'.join(summaries))
-        
-        with open("text/final_summary.txt", 'w', encoding='utf-8') as f:
-            f.write('\n\n'.join(summaries))
-        print("\nCleaning up temporary files...")
-        try:
-            for chunk_file in metadata['chunk_files']:
-                if os.path.exists(chunk_file):
-                    os.remove(chunk_file)
-            os.remove("text/chunks_metadata.json")
-            keep_files = {'final_summary.txt', 'refined_summary.txt'}
-            for file in os.listdir("text"):
-                if file not in keep_files:
-                    file_path = os.path.join("text", file)
-                    if os.path.isfile(file_path):
-                        os.remove(file_path)
-            
-            logger.info("Temporary files cleaned up successfully")
-        except Exception as e:
-            logger.error(f"Error cleaning up temporary files: {e}")
-            
+        with TranscriptStore.open(work_dir) as store:
+            chunks = store.chunks()
+            total_chunks = store.total_chunks or len(chunks)
+            semaphore = asyncio.Semaphore(max_parallel)
+            summaries = await asyncio.gather(*(
+                summarize_chunk_with_retry(semaphore, chunk['text'], chunk['chunk_num'], total_chunks, client,
+                                           store=store)
+                for chunk in chunks
+            ))
+        write_final_summary(summaries, work_dir)
     except Exception as e:
         logger.error(f"Error in summarization process: {e}")
 
-async def refine_final_summary(summary_file: str = "text/final_summary.txt") -> None:
-    """Refine the final summary by processing it in smaller chunks."""
+async def summarize_stream(queue: asyncio.Queue, max_parallel: int = MAX_PARALLEL_REQUESTS,
+                           client: Optional[OllamaClient] = None, store: Optional[TranscriptStore] = None,
+                           semaphore: Optional[asyncio.Semaphore] = None,
+                           on_event: Optional[Callable[[str, Dict], None]] = None) -> List[Tuple[int, str, str]]:
+    """Summarize chunks as the transcription stage puts them on `queue`, until `None` arrives.
+
+    A chunk is only taken off the queue when a request slot is free, so a busy
+    LLM lets the queue fill up and holds the transcription side back. Chunks
+    `store` already holds a summary for are not sent again, and new
+    summaries are added to it. Pass a shared `semaphore` to bound requests
+    in flight across several files.
+    Returns `(chunk_num, chunk_text, summary)` in chunk order.
+    """
+    semaphore = semaphore or asyncio.Semaphore(max_parallel)
+    free_slots = asyncio.Semaphore(max_parallel)
+
+    async def summarize_one(chunk_num: int, total_chunks: int, chunk_text: str) -> str:
+        try:
+            stored = store.chunk(chunk_num) if store is not None else None
+        except Exception as e:
+            # An unreadable store only costs a new request for this chunk
+            logger.warning(f"Chunk {chunk_num}: could not look up a stored summary - {e}")
+            stored = None
+        if stored is not None and stored['summary']:
+            summary = stored['summary']
+        else:
+            summary = await summarize_chunk_with_retry(
+                semaphore, chunk_text, chunk_num, total_chunks, client, store=store, on_event=on_event
+            )
+        if summary and on_event is not None:
+            on_event('chunk_summarized', {'chunk': chunk_num, 'total_chunks': total_chunks, 'text': summary})
+        return summary
+
+    tasks = {}
+    while True:
+        await free_slots.acquire()
+        item = await queue.get()
+        if item is None:
+            free_slots.release()
+            break
+        chunk_num, total_chunks, chunk_text = item
+        task = asyncio.create_task(summarize_one(chunk_num, total_chunks, chunk_text))
+        task.add_done_callback(lambda _: free_slots.release())
+        tasks[chunk_num] = (chunk_text, task)
+    await asyncio.gather(*(task for _, task in tasks.values()))
+    return [(num, tasks[num][0], tasks[num][1].result()) for num in sorted(tasks)]
+
+async def transcribe_and_summarize(audio_path: str, max_ahead: int = STT_MAX_AHEAD,
+                                   client: Optional[OllamaClient] = None, work_dir: str = "text",
+                                   manifest: Optional[JobManifest] = None,
+                                   limits: Optional[StageLimits] = None,
+                                   stt_pool: Optional[TranscriptionPool] = None,
+                                   on_event: Optional[Callable[[str, Dict], None]] = None) -> bool:
+    """Run transcription and chunk summarization as overlapping stages.
+
+    At most `max_ahead` transcribed chunks wait for the summarizer before the
+    transcription side is paused. Transcripts and summaries go to the
+    transcript store of `work_dir`. With a manifest, chunks the store already
+    holds are not transcribed or summarized again, and the source audio is
+    only deleted once the transcription stage is recorded as done.
+    `limits` are the batch-wide decode/STT/LLM slots, see `batch_scheduler`,
+    and `stt_pool` the warm worker pool shared by the batch. `on_event`
+    gets the progress events listed in `process_audio_file`. If the
+    summarizer fails, the transcription is cancelled rather than left
+    blocked on the full queue, and the summarizer's error is raised.
+    """
+    queue = asyncio.Queue(maxsize=max_ahead)
+    store = TranscriptStore.open(work_dir)
+    if manifest is None:
+        store.clear()
+    summarizer = asyncio.create_task(summarize_stream(
+        queue, client=client, store=store,
+        semaphore=limits.llm if limits is not None else None, on_event=on_event
+    ))
+
+    async def transcribe() -> bool:
+        done_chunks = {chunk['chunk_num']: chunk['text'] for chunk in store.chunks()}
+        total_chunks = store.total_chunks
+        if total_chunks is None and manifest is not None and manifest.data.get('total_chunks'):
+            # Runs started before the transcript store kept the total in their manifest
+            total_chunks = manifest.data['total_chunks']
+            store.set_info(total_chunks=total_chunks)
+        for chunk_num, chunk_text in sorted(done_chunks.items()):
+            await queue.put((chunk_num, total_chunks, chunk_text))
+
+        if manifest is not None and manifest.is_done('transcribed'):
+            transcribed = True
+        elif manifest is not None and not os.path.exists(audio_path) and done_chunks:
+            logger.warning(f"{audio_path} is gone, continuing with {len(done_chunks)} transcribed chunks")
+            transcribed = True
+        else:
+            def record_chunk(chunk_num: int, chunk_text: str, total_chunks: int) -> None:
+                on_event('chunk_transcribed', {'chunk': chunk_num, 'total_chunks': total_chunks,
+                                               'text': chunk_text})
+
+            transcribed = await transcribe_audio_file(
+                audio_path, queue=queue, output_dir=work_dir, skip_chunks=set(done_chunks),
+                on_chunk_saved=record_chunk if on_event is not None else None, store=store,
+                delete_source=manifest is None,
+                decode_slot=limits.decode if limits is not None else None,
+                stt_slot=limits.stt if limits is not None else None,
+                pool=stt_pool
+            )
+            if transcribed and manifest is not None:
+                manifest.mark_done('transcribed')
+                try:
+                    os.remove(audio_path)
+                    logger.info("Original file deleted successfully")
+                except Exception as e:
+                    logger.error(f"Error deleting file: {str(e)}")
+        return transcribed
+
+    transcription = asyncio.create_task(transcribe())
+    try:
+        await asyncio.wait({transcription, summarizer}, return_when=asyncio.FIRST_COMPLETED)
+        if not transcription.done():
+            # The summarizer died and nothing drains the queue: stop transcribing instead of waiting
+            logger.error("Summarizer stopped early, cancelling the transcription")
+            transcription.cancel()
+            await asyncio.wait({transcription})
+        elif not summarizer.done():
+            closing = asyncio.create_task(queue.put(None))
+            await asyncio.wait({closing, summarizer}, return_when=asyncio.FIRST_COMPLETED)
+            closing.cancel()
+        results = await summarizer
+        transcribed = transcription.result()
+    finally:
+        # No-ops unless this call itself was cancelled or failed
+        transcription.cancel()
+        summarizer.cancel()
+        await asyncio.wait({transcription, summarizer})
+        store.close()
+    if not transcribed:
+        return False
+    missing = [chunk_num for chunk_num, _, summary in results if not summary]
+    if missing and manifest is not None:
+        # The store keeps the other summaries, so the next run only retries these
+        logger.error(f"No summary for chunks {missing}, rerun to retry them")
+        return False
+    write_final_summary([summary for _, _, summary in results], work_dir, manifest)
+    return True
+
+async def refine_final_summary(summary_file: str = "text/final_summary.txt",
+                               client: Optional[OllamaClient] = None,
+                               semaphore: Optional[asyncio.Semaphore] = None,
+                               on_event: Optional[Callable[[str, Dict], None]] = None) -> bool:
+    """Refine the final summary into one text through a token-aware reduction tree.
+
+    The refined text is written next to `summary_file`. Returns True on success.
+    """
+    def on_token(content: str) -> None:
+        if content:
+            on_event('refine_token', {'text': content})
+
+    work_dir = os.path.dirname(summary_file) or "."
     try:
         with open(summary_file, 'r', encoding='utf-8') as f:
             text = f.read()
-        chunks = split_text_into_chunks(text)
-        print(f"\nRefining summary in {len(chunks)} chunks...")
-        
-        refined_chunks = []
-        for i, chunk in enumerate(chunks, 1):
-            print(f"\nProcessing chunk {i}/{len(chunks)}:")
-            print("=" * 50)
-            
-            messages = [
-                {'role': 'system', 'content': """Sei un editor esperto. Il tuo compito è:
-1. Rimuovere tutte le ripetizioni di concetti e informazioni
-2. Eliminare frasi incomplete o poco chiare
-3. Mantenere la coerenza tra i paragrafi
-4. Preservare tutte le informazioni uniche e rilevanti
-5. Migliorare la leggibilità del testo"""},
-                {'role': 'user', 'content': f'Riorganizza e pulisci questo testo:\n\n{chunk}'}
-            ]
-            
-            refined_chunk = []
-            async for part in await AsyncClient().chat(
-                model='llama3.2:latest',
-                messages=messages,
-                stream=True
-            ):
-                content = part['message']['content']
-                refined_chunk.append(content)
-                print(content, end='', flush=True)
-            
-            refined_chunks.append(''.join(refined_chunk))
-        final_refined_text = '\n\n'.join(refined_chunks)
-        with open("text/refined_summary.txt", 'w', encoding='utf-8') as f:
+        final_refined_text = await reduce_text(text, client, semaphore,
+                                               on_token=on_token if on_event is not None else None)
+        if not final_refined_text.strip():
+            raise ValueError("the reduction returned an empty summary")
+        with open(os.path.join(work_dir, "refined_summary.txt"), 'w', encoding='utf-8') as f:
             f.write(final_refined_text)
         
         logger.info("Summary refinement completed")
@@ -170,67 +341,155 @@ async def refine_final_summary(summary_file: str = "text/final_summary.txt") ->
             if os.path.exists(summary_file):
                 os.remove(summary_file)
             
-            for file in os.listdir("text"):
-                if file != "refined_summary.txt":
-                    file_path = os.path.join("text", file)
+            for file in os.listdir(work_dir):
+                if file not in {"refined_summary.txt", MANIFEST_FILE, STORE_FILE}:
+                    file_path = os.path.join(work_dir, file)
                     if os.path.isfile(file_path):
                         os.remove(file_path)
             
             logger.info("All temporary files cleaned up successfully")
         except Exception as e:
             logger.error(f"Error cleaning up temporary files: {e}")
+        return True
         
     except Exception as e:
         logger.error(f"Error refining summary: {e}")
+        return False
 
-async def process_audio_file(audio_path: str) -> None:
-    """Process single audio file through full pipeline"""
+async def process_audio_file(audio_path: str, run_dir: Optional[str] = None,
+                             limits: Optional[StageLimits] = None,
+                             stt_pool: Optional[TranscriptionPool] = None,
+                             client: Optional[OllamaClient] = None,
+                             on_event: Optional[Callable[[str, Dict], None]] = None) -> bool:
+    """Process single audio file through full pipeline, resuming from its manifest.
+
+    All outputs go to the file's own run directory (`ai_learning/runs/<name>`).
+    Returns True once the file is fully refined. A refined lecture is added
+    to the search index (see lecture_index) unless LECTURE_INDEX=0.
+
+    `on_event(kind, data)` follows the job as it runs: 'stage' (`stage`:
+    transcribe or refine), 'chunk_transcribed' and 'chunk_summarized'
+    (`chunk`, `total_chunks`, `text`), 'summary_token' (`chunk`, `text`),
+    'chunk_retry' (`chunk`, `attempt`, `error`), 'refine_token' (`text`)
+    and 'refined' (`text`). Transcription events come from a worker thread.
+    """
     file_start = time.time()
+    run_dir = run_dir or run_dir_for(audio_path)
     
     try:
-        # Transcribe
+        manifest = JobManifest.load_or_create(run_dir, audio_path)
+        if manifest.is_done('refined'):
+            logger.info(f"{os.path.basename(audio_path)} already processed, skipping")
+            return True
+
+        # Transcribe and summarize chunks as they arrive
         transcribe_start = time.time()
-        if not await transcribe_audio_file(audio_path):
-            logger.error(f"Transcription failed for {audio_path}")
-            return
+        if not manifest.is_done('summarized'):
+            if on_event is not None:
+                on_event('stage', {'stage': 'transcribe'})
+            if not await transcribe_and_summarize(audio_path, client=client, work_dir=run_dir,
+                                                  manifest=manifest, limits=limits, stt_pool=stt_pool,
+                                                  on_event=on_event):
+                logger.error(f"Transcription failed for {audio_path}")
+                return False
         transcribe_time = time.time() - transcribe_start
 
-        # Summarize
+        # Refine; a crash right after writing the refined text leaves no final summary behind
         summarize_start = time.time()
-        await summarize_text("")
-        await refine_final_summary()
+        final_summary = os.path.join(run_dir, "final_summary.txt")
+        refined_summary = os.path.join(run_dir, "refined_summary.txt")
+        if on_event is not None:
+            on_event('stage', {'stage': 'refine'})
+        if not os.path.exists(final_summary) and os.path.exists(refined_summary):
+            manifest.mark_done('refined')
+        elif await refine_final_summary(final_summary, client,
+                                        semaphore=limits.llm if limits is not None else None,
+                                        on_event=on_event):
+            manifest.mark_done('refined')
+        if on_event is not None and manifest.is_done('refined'):
+            with open(refined_summary, 'r', encoding='utf-8') as f:
+                on_event('refined', {'text': f.read()})
+        if INDEX_LECTURES and manifest.is_done('refined'):
+            try:
+                await asyncio.get_event_loop().run_in_executor(None, get_lecture_index().index_run, run_dir)
+            except Exception as e:
+                logger.warning(f"Could not add {os.path.basename(run_dir)} to the lecture index: {e}")
         summarize_time = time.time() - summarize_start
 
         # Timing stats
         total_time = time.time() - file_start
+        name = os.path.basename(audio_path)
+        tracer = get_tracer()
+        tracer.record('transcribe_summarize', transcribe_time, transcribe_start, file=name)
+        tracer.record('refine', summarize_time, summarize_start, file=name)
+        tracer.record('file_total', total_time, file_start, file=name)
         print(f"\nFile processing statistics for {os.path.basename(audio_path)}:")
-        print(f"Transcription time: {str(timedelta(seconds=int(transcribe_time)))}")
-        print(f"Summarization time: {str(timedelta(seconds=int(summarize_time)))}")
+        print(f"Transcription + summary time: {str(timedelta(seconds=int(transcribe_time)))}")
+        print(f"Refinement time: {str(timedelta(seconds=int(summarize_time)))}")
         print(f"Total processing time: {str(timedelta(seconds=int(total_time)))}\n")
+        return manifest.is_done('refined')
 
     except Exception as e:
         logger.error(f"Processing error for {audio_path}: {e}")
+        return False
+
+def get_jobs(audio_dir: str = 'ai_learning/audio') -> List[Tuple[str, str]]:
+    """`(audio_path, run_dir)` for every unfinished job.
+
+    Interrupted runs come first, including those whose source audio was
+    already deleted after transcription, then new WAV files.
+    """
+    jobs = {}
+    for manifest in pending_runs():
+        jobs[manifest.run_dir] = manifest.audio_file
+    if os.path.isdir(audio_dir):
+        for audio_file in get_audio_files(audio_dir):
+            run_dir = run_dir_for(audio_file)
+            if run_dir in jobs:
+                continue
+            if (os.path.exists(os.path.join(run_dir, MANIFEST_FILE))
+                    and JobManifest.load_or_create(run_dir).is_done('refined')):
+                logger.info(f"{os.path.basename(audio_file)} already processed, skipping")
+                continue
+            jobs[run_dir] = audio_file
+    return [(audio_file, run_dir) for run_dir, audio_file in jobs.items()]
 
 async def main() -> None:
     """Main application flow"""
     total_start = time.time()
+    stt_pool = None
+    loop = asyncio.get_event_loop()
     
     try:
-        audio_files = get_audio_files()
-        if not audio_files:
-            logger.error("No WAV files found in audio directory")
+        jobs = get_jobs()
+        if not jobs:
+            logger.error("No unfinished WAV files found in audio directory")
             return
 
-        print(f"Found {len(audio_files)} audio files to process")
-        for idx, audio_file in enumerate(audio_files, 1):
-            print(f"\nProcessing file {idx}/{len(audio_files)}: {os.path.basename(audio_file)}")
-            await process_audio_file(audio_file)
+        print(f"Found {len(jobs)} audio files to process")
+        # One warm STT pool for the whole batch instead of a fresh one per file
+        stt_pool = await loop.run_in_executor(None, TranscriptionPool().start)
+        report = await run_batch(
+            [(audio_file, run_dir, JobManifest.load_or_create(run_dir, audio_file).audio_seconds)
+             for audio_file, run_dir in jobs],
+            functools.partial(process_audio_file, stt_pool=stt_pool)
+        )
 
         total_time = time.time() - total_start
         print(f"\nTotal execution time: {str(timedelta(seconds=int(total_time)))}")
+        print(report.render())
+        print(get_client().stats.report())
+        print(get_tracer().report())
 
     except Exception as e:
         logger.error(f"Application error: {e}")
+    finally:
+        if stt_pool is not None:
+            await loop.run_in_executor(None, stt_pool.close)
+            print(stt_pool.timing_report())
+        await close_client()
+        close_lecture_index()
+        close_tracer()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,258 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+import wave
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from audio_dsp import TARGET_RATE, pcm_to_array, to_mono_16k
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_DB = os.environ.get("FINGERPRINT_DB", "cache/fingerprints.sqlite3")
+# Skip WAV files whose audio is already in the index; SKIP_DUPLICATE_AUDIO=0 to process everything
+SKIP_DUPLICATE_AUDIO = os.environ.get("SKIP_DUPLICATE_AUDIO", "1") != "0"
+# Share of a file's hashes that must line up with one known lecture at a single time offset
+DUPLICATE_MIN_SCORE = float(os.environ.get("FINGERPRINT_MIN_SCORE", "0.2"))
+MIN_MATCHES = 20
+
+WINDOW = 1024
+HOP = 512
+BAND_EDGES_HZ = (300, 500, 800, 1200, 1800, 2700, 4000)
+# A peak is the loudest point of its band within this many frames either side
+PEAK_NEIGHBORHOOD = 7
+PEAK_MARGIN_DB = 6.0
+FAN_OUT = 5
+MAX_DT_FRAMES = 63
+# One hash in HASH_SAMPLE is kept, picked by value, so every copy keeps the same ones
+HASH_SAMPLE = 16
+READ_BLOCK_SECONDS = 60
+
+def band_maxima(file_path: str) -> Tuple[np.ndarray, np.ndarray, float]:
+    """Loudest FFT bin of every band in every frame of the 16 kHz mono signal.
+
+    The file is read and resampled a block at a time. Returns the bins and
+    their magnitudes as `(frames, bands)` arrays, and the length in seconds.
+    """
+    band_bins = [(lo * WINDOW // TARGET_RATE, hi * WINDOW // TARGET_RATE)
+                 for lo, hi in zip(BAND_EDGES_HZ[:-1], BAND_EDGES_HZ[1:])]
+    window = np.hanning(WINDOW).astype(np.float32)
+    bins, values = [], []
+    carry = np.zeros(0, dtype=np.float32)
+    total = 0
+    with wave.open(file_path, 'rb') as wf:
+        rate, width, channels = wf.getframerate(), wf.getsampwidth(), wf.getnchannels()
+        while raw := wf.readframes(rate * READ_BLOCK_SECONDS):
+            mono = to_mono_16k(pcm_to_array(raw, width, channels), rate).astype(np.float32)
+            total += len(mono)
+            signal = np.concatenate([carry, mono])
+            n = (len(signal) - WINDOW) // HOP + 1
+            if n <= 0:
+                carry = signal
+                continue
+            spectrum = np.abs(np.fft.rfft(sliding_window_view(signal, WINDOW)[::HOP][:n] * window, axis=1))
+            rows = np.arange(n)
+            block_bins = np.stack([spectrum[:, lo:hi].argmax(axis=1) + lo for lo, hi in band_bins], axis=1)
+            bins.append(block_bins)
+            values.append(np.stack([spectrum[rows, block_bins[:, b]] for b in range(len(band_bins))], axis=1))
+            carry = signal[n * HOP:]
+    if not bins:
+        empty = np.zeros((0, len(band_bins)))
+        return empty.astype(np.int64), empty, total / TARGET_RATE
+    return np.concatenate(bins), np.concatenate(values), total / TARGET_RATE
+
+def spectral_peaks(file_path: str) -> Tuple[np.ndarray, np.ndarray, float]:
+    """Frames and FFT bins of the spectral peaks of a WAV file, and its length in seconds.
+
+    A peak is a band maximum that stands out from the band's median and is
+    the loudest of its band in the neighbouring frames. Peaks come sorted by
+    frame.
+    """
+    bins, values, seconds = band_maxima(file_path)
+    if len(bins) < 2:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), seconds
+    level = 20 * np.log10(values + 1e-6)
+    padded = np.pad(level, ((PEAK_NEIGHBORHOOD, PEAK_NEIGHBORHOOD), (0, 0)), constant_values=-np.inf)
+    local_max = sliding_window_view(padded, 2 * PEAK_NEIGHBORHOOD + 1, axis=0).max(axis=-1)
+    is_peak = (level == local_max) & (level > np.median(level, axis=0) + PEAK_MARGIN_DB)
+    frames, bands = np.nonzero(is_peak)
+    return frames.astype(np.int64), bins[frames, bands].astype(np.int64), seconds
+
+def landmark_hashes(frames: np.ndarray, peak_bins: np.ndarray, dt_spread: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """Sampled `(bin, bin, frame distance)` hashes of peak pairs, and the frame of each pair's first peak.
+
+    Each peak is paired with the first FAN_OUT peaks of the following
+    frames. Only one hash in HASH_SAMPLE is kept, chosen by value, so every
+    copy of a recording keeps the same ones. `dt_spread` adds the hashes of
+    distances that many frames off: a copy cut between two frames has about
+    half its peaks rounded to the neighbouring frame, so lookups spread by 1.
+    """
+    hashes, offsets = [], []
+    first = np.searchsorted(frames, frames + 1)
+    for k in range(FAN_OUT):
+        anchor = np.nonzero(first + k < len(frames))[0]
+        partner = first[anchor] + k
+        dt = frames[partner] - frames[anchor]
+        for shift in range(-dt_spread, dt_spread + 1):
+            near = (dt + shift > 0) & (dt + shift <= MAX_DT_FRAMES)
+            hashes.append((peak_bins[anchor[near]] << 16) | (peak_bins[partner[near]] << 6) | (dt[near] + shift))
+            offsets.append(frames[anchor[near]])
+    if not hashes:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    hashes, offsets = np.concatenate(hashes), np.concatenate(offsets)
+    keep = ((hashes * 2654435761) & 0xFFFFFFFF) % HASH_SAMPLE == 0
+    return hashes[keep], offsets[keep]
+
+def fingerprint(file_path: str) -> Tuple[np.ndarray, np.ndarray, float]:
+    """Sampled landmark hashes of a WAV file, their frame offsets, and its length in seconds.
+
+    The hashes do not change with gain, sample rate, channels or where the
+    file starts.
+    """
+    frames, peak_bins, seconds = spectral_peaks(file_path)
+    return (*landmark_hashes(frames, peak_bins), seconds)
+
+class FingerprintIndex:
+    """SQLite index of the audio fingerprints of every lecture seen.
+
+    `check` fingerprints a new file and looks it up: hashes of a known
+    lecture that line up at one time offset (re-uploads, re-encodes,
+    trimmed cuts) make it a duplicate. A file already checked (same path,
+    size and modification time) is answered from the index without
+    reading its audio. Lectures stay indexed after their WAV is deleted.
+    """
+
+    def __init__(self, path: str = FINGERPRINT_DB, min_score: float = DUPLICATE_MIN_SCORE):
+        self.path = path
+        self.min_score = min_score
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, size INTEGER NOT NULL, "
+                "mtime REAL NOT NULL, seconds REAL NOT NULL, hashes INTEGER NOT NULL, "
+                "duplicate_of INTEGER, score REAL, added REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS hashes ("
+                "hash INTEGER NOT NULL, file_id INTEGER NOT NULL, offset INTEGER NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS hashes_hash ON hashes(hash)")
+            self._conn.commit()
+        return self._conn
+
+    def _known(self, conn: sqlite3.Connection, path: str, stat: os.stat_result) -> Tuple[bool, Optional[str]]:
+        """Whether `path` was checked as it is now, and the lecture it duplicates."""
+        row = conn.execute("SELECT id, size, mtime, duplicate_of FROM files WHERE path = ?", (path,)).fetchone()
+        if row is None:
+            return False, None
+        file_id, size, mtime, duplicate_of = row
+        if size != stat.st_size or mtime != stat.st_mtime:
+            # A new file under an old name: keep the old lecture indexed under a retired path
+            conn.execute("UPDATE files SET path = path || '#' || id WHERE id = ?", (file_id,))
+            conn.commit()
+            return False, None
+        if duplicate_of is None:
+            return True, None
+        original = conn.execute("SELECT path FROM files WHERE id = ?", (duplicate_of,)).fetchone()
+        return True, original[0].split('#')[0] if original else None
+
+    def _best_match(self, conn: sqlite3.Connection, hashes: np.ndarray, offsets: np.ndarray,
+                    own_hashes: int) -> Tuple[Optional[int], float]:
+        """Indexed file whose hashes line up best with these, and its score.
+
+        The score is the share of aligned hashes out of the shorter of the
+        two files' hash counts (`own_hashes` for the file being checked).
+        """
+        query: Dict[int, list] = {}
+        for value, offset in zip(hashes.tolist(), offsets.tolist()):
+            query.setdefault(value, []).append(offset)
+        votes = Counter()
+        keys = list(query)
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = conn.execute(
+                f"SELECT hash, file_id, offset FROM hashes WHERE hash IN ({','.join('?' * len(chunk))})", chunk
+            )
+            for value, file_id, offset in rows:
+                for query_offset in query[value]:
+                    # Halved so a one-frame jitter mostly stays in the same bin
+                    votes[file_id, (offset - query_offset) // 2] += 1
+        best: Dict[int, int] = {}
+        for (file_id, delta), count in votes.items():
+            best[file_id] = max(best.get(file_id, 0), count + votes.get((file_id, delta + 1), 0))
+        best_id, best_score = None, 0.0
+        for file_id, matches in best.items():
+            if matches < MIN_MATCHES:
+                continue
+            indexed = conn.execute("SELECT hashes FROM files WHERE id = ?", (file_id,)).fetchone()[0]
+            score = matches / max(1, min(own_hashes, indexed))
+            if score > best_score:
+                best_id, best_score = file_id, score
+        return best_id, best_score
+
+    def check(self, file_path: str) -> Optional[str]:
+        """Index `file_path` and return the path of the lecture it duplicates, or None if it is new."""
+        path = os.path.abspath(file_path)
+        stat = os.stat(path)
+        with self._lock:
+            known, original = self._known(self._connection(), path, stat)
+        if known:
+            return original
+
+        start = time.perf_counter()
+        frames, peak_bins, seconds = spectral_peaks(path)
+        hashes, offsets = landmark_hashes(frames, peak_bins)
+        query_hashes, query_offsets = landmark_hashes(frames, peak_bins, dt_spread=1)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            conn = self._connection()
+            # Looked up under the lock, so two copies checked at once cannot both pass as new
+            match_id, score = (self._best_match(conn, query_hashes, query_offsets, len(hashes))
+                               if len(hashes) else (None, 0.0))
+            duplicate_of = match_id if score >= self.min_score else None
+            cursor = conn.execute(
+                "INSERT INTO files (path, size, mtime, seconds, hashes, duplicate_of, score, added) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (path, stat.st_size, stat.st_mtime, seconds, len(hashes), duplicate_of, score, time.time())
+            )
+            if duplicate_of is None:
+                conn.executemany(
+                    "INSERT INTO hashes (hash, file_id, offset) VALUES (?, ?, ?)",
+                    ((value, cursor.lastrowid, offset) for value, offset in zip(hashes.tolist(), offsets.tolist()))
+                )
+                original = None
+            else:
+                original = conn.execute("SELECT path FROM files WHERE id = ?",
+                                        (duplicate_of,)).fetchone()[0].split('#')[0]
+            conn.commit()
+        logger.info(f"Fingerprinted {os.path.basename(path)} ({seconds / 60:.0f} min) in {elapsed:.2f}s"
+                    + (f": duplicate of {os.path.basename(original)} (score {score:.2f})" if original else ""))
+        return original
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+_index: Optional[FingerprintIndex] = None
+
+def get_fingerprint_index() -> FingerprintIndex:
+    """Return the process-wide index, opening it on first use."""
+    global _index
+    if _index is None:
+        _index = FingerprintIndex()
+    return _index
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import timedelta
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENT_FILES = max(1, int(os.environ.get("BATCH_MAX_FILES", "3")))
+DECODE_LIMIT = max(1, int(os.environ.get("BATCH_DECODE_LIMIT", "1")))
+STT_LIMIT = max(1, int(os.environ.get("BATCH_STT_LIMIT", "2")))
+LLM_LIMIT = max(1, int(os.environ.get("OLLAMA_NUM_PARALLEL", "4")))
+
+class StageLimits:
+    """Concurrency limits shared by every file in a batch.
+
+    `decode` bounds files reading/splitting audio at once (CPU and disk),
+    `stt` bounds files in the transcription pool at once (network), and
+    `llm` bounds Ollama requests in flight across all files (GPU). A file
+    whose summary queue is full gives its `stt` slot up until the queue
+    drains, so LLM backpressure does not hold the pool.
+    """
+
+    def __init__(self, decode: int = DECODE_LIMIT, stt: int = STT_LIMIT, llm: int = LLM_LIMIT):
+        self.decode = asyncio.Semaphore(decode)
+        self.stt = asyncio.Semaphore(stt)
+        self.llm = asyncio.Semaphore(llm)
+        self.sizes = {'decode': decode, 'stt': stt, 'llm': llm}
+
+class ThroughputReport:
+    """Files and audio processed over the wall clock time of a batch."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.finished: Optional[float] = None
+        self.files_done = 0
+        self.files_failed = 0
+        self.audio_seconds = 0.0
+
+    def record(self, ok: bool, audio_seconds: float) -> None:
+        if ok:
+            self.files_done += 1
+            self.audio_seconds += audio_seconds
+        else:
+            self.files_failed += 1
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.time()) - self.started
+
+    def render(self) -> str:
+        hours = max(self.elapsed, 1e-9) / 3600
+        return (
+            f"Batch throughput: {self.files_done} files done, {self.files_failed} failed "
+            f"in {str(timedelta(seconds=int(self.elapsed)))}\n"
+            f"Files per hour: {self.files_done / hours:.2f}\n"
+            f"Audio hours per hour: {self.audio_seconds / 3600 / hours:.2f}"
+        )
+
+async def run_batch(jobs: List[Tuple[str, str, float]],
+                    process_job: Callable[[str, str, StageLimits], Awaitable[bool]],
+                    max_files: int = MAX_CONCURRENT_FILES,
+                    limits: Optional[StageLimits] = None) -> ThroughputReport:
+    """Run `process_job(audio_path, run_dir, limits)` for up to `max_files` jobs at a time.
+
+    `jobs` holds `(audio_path, run_dir, audio_seconds)`. Each file still goes
+    through its stages in order, but one file can be in STT while another is
+    decoding and a third is waiting on the LLM.
+    """
+    limits = limits or StageLimits()
+    report = ThroughputReport()
+    file_slots = asyncio.Semaphore(max_files)
+    logger.info(f"Batch of {len(jobs)} files, {max_files} at a time, stage limits {limits.sizes}")
+
+    async def run_one(idx: int, audio_path: str, run_dir: str, audio_seconds: float) -> None:
+        async with file_slots:
+            print(f"\nProcessing file {idx}/{len(jobs)}: {os.path.basename(audio_path or run_dir)}")
+            try:
+                ok = await process_job(audio_path, run_dir, limits)
+            except Exception as e:
+                logger.error(f"Processing error for {audio_path}: {e}")
+                ok = False
+            report.record(ok, audio_seconds)
+
+    await asyncio.gather(*(
+        run_one(idx, audio_path, run_dir, audio_seconds)
+        for idx, (audio_path, run_dir, audio_seconds) in enumerate(jobs, 1)
+    ))
+    report.finished = time.time()
+    return report
@@ -0,0 +1,99 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import wave
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+RUNS_DIR = 'ai_learning/runs'
+MANIFEST_FILE = 'manifest.json'
+STAGES = ('downloaded', 'transcribed', 'summarized', 'refined')
+
+def audio_duration(audio_path: str) -> float:
+    """Length of a WAV file in seconds, read from its header only."""
+    try:
+        with wave.open(audio_path, 'rb') as wf:
+            return wf.getnframes() / float(wf.getframerate())
+    except (OSError, wave.Error, EOFError):
+        return 0.0
+
+def run_dir_for(audio_path: str, runs_dir: str = RUNS_DIR) -> str:
+    """Working directory of one audio file: `<runs_dir>/<file name without extension>`."""
+    return os.path.join(runs_dir, os.path.splitext(os.path.basename(audio_path))[0])
+
+class JobManifest:
+    """Durable per-file record of which pipeline stages are finished.
+
+    Every update is written straight to `manifest.json` in the run directory
+    (temp file + `os.replace`). Finished chunks are kept in the run's
+    transcript store (see transcript_store), not here; the `chunks` maps of
+    manifests written before it are ignored.
+    """
+
+    def __init__(self, run_dir: str, data: Dict):
+        self.run_dir = run_dir
+        self.path = os.path.join(run_dir, MANIFEST_FILE)
+        self.data = data
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load_or_create(cls, run_dir: str, audio_path: Optional[str] = None) -> 'JobManifest':
+        path = os.path.join(run_dir, MANIFEST_FILE)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                return cls(run_dir, json.load(f))
+        os.makedirs(run_dir, exist_ok=True)
+        manifest = cls(run_dir, {
+            'audio_file': audio_path,
+            'audio_seconds': audio_duration(audio_path) if audio_path else 0.0,
+            'stages': {stage: {'done': False} for stage in STAGES}
+        })
+        if audio_path and os.path.exists(audio_path):
+            manifest.mark_done('downloaded')
+        else:
+            manifest.save()
+        return manifest
+
+    def save(self) -> None:
+        with self._lock:
+            self.data['updated'] = time.time()
+            fd, tmp_path = tempfile.mkstemp(dir=self.run_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+    @property
+    def audio_file(self) -> Optional[str]:
+        return self.data.get('audio_file')
+
+    @property
+    def audio_seconds(self) -> float:
+        return self.data.get('audio_seconds') or 0.0
+
+    def is_done(self, stage: str) -> bool:
+        return self.data['stages'][stage]['done']
+
+    def mark_done(self, stage: str) -> None:
+        self.data['stages'][stage] = {'done': True, 'finished': time.time()}
+        self.save()
+
+def pending_runs(runs_dir: str = RUNS_DIR) -> List[JobManifest]:
+    """Manifests of runs that have not been refined yet."""
+    if not os.path.isdir(runs_dir):
+        return []
+    manifests = []
+    for name in sorted(os.listdir(runs_dir)):
+        run_dir = os.path.join(runs_dir, name)
+        if os.path.exists(os.path.join(run_dir, MANIFEST_FILE)):
+            try:
+                manifest = JobManifest.load_or_create(run_dir)
+            except (OSError, ValueError) as e:
+                logger.error(f"Unreadable manifest in {run_dir}: {e}")
+                continue
+            if not manifest.is_done('refined'):
+                manifests.append(manifest)
+    return manifests
@@ -0,0 +1,644 @@
+import argparse
+import asyncio
+import ipaddress
+import itertools
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+import wave
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, quote, urlsplit
+
+import httpx
+
+from ai_learning import process_audio_file
+from audio_fingerprint import SKIP_DUPLICATE_AUDIO, FingerprintIndex, get_fingerprint_index
+from batch_scheduler import MAX_CONCURRENT_FILES, StageLimits
+from job_manifest import RUNS_DIR, run_dir_for
+from lecture_index import SEARCH_LIMIT, close_lecture_index, get_lecture_index
+from ollama_client import FakeAsyncClient, OllamaClient, get_client
+from speech_to_text import TranscriptionPool
+from tracing import close_tracer
+from wav_audio_video_download import (DOWNLOAD_WORKERS, DownloaderPool, download_and_convert,
+                                      sanitize_filename, ydl_options)
+
+logger = logging.getLogger(__name__)
+
+# The server has no authentication, so it only listens on a loopback address
+JOB_SERVER_HOST = os.environ.get("JOB_SERVER_HOST", "127.0.0.1")
+JOB_SERVER_PORT = int(os.environ.get("JOB_SERVER_PORT", "8765"))
+JOB_SERVER_URL = os.environ.get("JOB_SERVER_URL", f"http://{JOB_SERVER_HOST}:{JOB_SERVER_PORT}")
+UPLOAD_DIR = 'ai_learning/audio'
+MAX_UPLOAD_BYTES = int(os.environ.get("JOB_MAX_UPLOAD_MB", "2048")) * 1024 * 1024
+UPLOAD_READ_BYTES = 1024 * 1024
+# Comment lines sent on idle event streams so proxies and clients keep them open
+SSE_KEEPALIVE_SECONDS = 15.0
+FINAL_STATUSES = ('done', 'failed', 'duplicate', 'cancelled')
+TOKEN_EVENTS = ('summary_token', 'refine_token')
+# Most recent token events a job keeps for Last-Event-ID replay while it runs
+JOB_TOKEN_HISTORY = int(os.environ.get("JOB_TOKEN_HISTORY", "500"))
+# Finished jobs stay queryable until there are more than this many or they are older than the TTL
+JOB_KEEP_FINISHED = int(os.environ.get("JOB_KEEP_FINISHED", "100"))
+JOB_FINISHED_TTL = float(os.environ.get("JOB_FINISHED_TTL_HOURS", "24")) * 3600
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+class Job:
+    """One queued WAV upload or URL and the events it has produced so far.
+
+    Events are numbered from 1, so a client that reconnects with the last
+    id it saw gets only what it missed. Summary and refinement tokens are
+    the exception: only the last `JOB_TOKEN_HISTORY` are kept while the job
+    runs and none once it has ended, as 'chunk_summarized' and 'refined'
+    carry the same text whole.
+    """
+
+    def __init__(self, job_id: str, kind: str, source: str, name: str, priority: int):
+        self.id = job_id
+        self.kind = kind
+        self.source = source
+        self.name = name
+        self.priority = priority
+        self.status = 'queued'
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.audio_path: Optional[str] = source if kind == 'upload' else None
+        self.result: Optional[str] = None
+        self.error: Optional[str] = None
+        self.events: List[Dict] = []
+        self.emitted = 0
+        self._tokens = 0
+        self._subscribers: Set[asyncio.Queue] = set()
+
+    def emit(self, kind: str, data: Dict) -> None:
+        """Record an event and hand it to every open stream; call from the event loop thread."""
+        self.emitted += 1
+        event = {'id': self.emitted, 'event': kind, 'data': data}
+        self.events.append(event)
+        if kind in TOKEN_EVENTS:
+            self._tokens += 1
+            # Trimmed in batches so each event costs O(1) on average
+            if self._tokens > 2 * JOB_TOKEN_HISTORY:
+                self._drop_tokens(JOB_TOKEN_HISTORY)
+        elif kind == 'end':
+            self._drop_tokens(0)
+        for queue in self._subscribers:
+            queue.put_nowait(event)
+
+    def _drop_tokens(self, keep: int) -> None:
+        """Forget all but the newest `keep` token events."""
+        drop = self._tokens - keep
+        if drop <= 0:
+            return
+        kept = []
+        for event in self.events:
+            if drop and event['event'] in TOKEN_EVENTS:
+                drop -= 1
+            else:
+                kept.append(event)
+        self.events = kept
+        self._tokens = keep
+
+    def subscribe(self, after: int = 0) -> Tuple[List[Dict], asyncio.Queue]:
+        """Kept events after id `after`, and a queue that receives every later one."""
+        queue = asyncio.Queue()
+        self._subscribers.add(queue)
+        return [event for event in self.events if event['id'] > after], queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+
+    def to_dict(self, with_result: bool = False) -> Dict:
+        info = {
+            'id': self.id, 'kind': self.kind, 'name': self.name, 'priority': self.priority,
+            'status': self.status, 'created': self.created, 'started': self.started,
+            'finished': self.finished, 'events': self.emitted, 'error': self.error,
+        }
+        if with_result:
+            info['result'] = self.result
+        return info
+
+def is_loopback_host(host: str) -> bool:
+    """True if `host` is a loopback address, or a name whose every address is one (like `localhost`)."""
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        pass
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, None)}
+    except socket.gaierror:
+        return False
+    return bool(addresses) and all(ipaddress.ip_address(address.split('%')[0]).is_loopback
+                                   for address in addresses)
+
+class JobServer:
+    """Localhost HTTP service that runs the batch pipeline on queued jobs.
+
+    Jobs are WAV uploads (`POST /jobs` with the file as body) or URLs
+    (`POST /jobs` with `{"url": ...}`), each with a priority: higher runs
+    first, ties in arrival order. Up to `workers` jobs run at once through
+    `process_audio_file`, sharing one warm STT pool, one LLM client and the
+    batch stage limits for the whole life of the server. Progress is
+    streamed as Server-Sent Events on `GET /jobs/<id>/events`: per-chunk
+    transcripts and summaries, summary and refinement tokens, and a final
+    'end' event. Finished jobs are forgotten once more than `keep_finished`
+    have ended or after `finished_ttl` seconds. `GET /search?q=...` (with
+    optional `limit`, `kind` and `lecture`) queries the index of finished
+    lectures, see `lecture_index`.
+    Pass a fake STT backend and `FakeAsyncClient` to run without network
+    access or models.
+    """
+
+    def __init__(self, host: str = JOB_SERVER_HOST, port: int = JOB_SERVER_PORT,
+                 workers: int = MAX_CONCURRENT_FILES, stt_pool: Optional[TranscriptionPool] = None,
+                 client: Optional[OllamaClient] = None, upload_dir: str = UPLOAD_DIR,
+                 runs_dir: str = RUNS_DIR, skip_duplicates: bool = SKIP_DUPLICATE_AUDIO,
+                 fingerprints: Optional[FingerprintIndex] = None, downloader_factory=None,
+                 keep_finished: int = JOB_KEEP_FINISHED, finished_ttl: float = JOB_FINISHED_TTL):
+        if not is_loopback_host(host):
+            raise ValueError(f"Job server must listen on a loopback address, not {host}")
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.stt_pool = stt_pool or TranscriptionPool()
+        self.client = client or get_client()
+        self.upload_dir = upload_dir
+        self.runs_dir = runs_dir
+        self.skip_duplicates = skip_duplicates
+        self.fingerprints = fingerprints
+        self.downloader_factory = downloader_factory
+        self.keep_finished = keep_finished
+        self.finished_ttl = finished_ttl
+        self.jobs: Dict[str, Job] = {}
+        # Finished job ids, oldest first
+        self._finished: Dict[str, float] = OrderedDict()
+        self.limits: Optional[StageLimits] = None
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._order = itertools.count()
+        self._workers: List[asyncio.Task] = []
+        self._running: Set[asyncio.Task] = set()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._downloads: Optional[ThreadPoolExecutor] = None
+        self._downloaders: Optional[DownloaderPool] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> 'JobServer':
+        """Warm up the STT pool and the model, then start listening."""
+        loop = asyncio.get_running_loop()
+        os.makedirs(self.upload_dir, exist_ok=True)
+        await loop.run_in_executor(None, self.stt_pool.start)
+        await self.client.warm_up()
+        if self.skip_duplicates and self.fingerprints is None:
+            self.fingerprints = get_fingerprint_index()
+        self.limits = StageLimits()
+        self._queue = asyncio.PriorityQueue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Job server listening on {self.url} ({self.workers} jobs at a time)")
+        return self
+
+    async def serve_forever(self) -> None:
+        await self._server.serve_forever()
+
+    async def close(self) -> None:
+        """Stop listening, cancel queued jobs and wait for the running ones before closing the pool."""
+        if self._server is not None:
+            self._server.close()
+        for job in self.jobs.values():
+            if job.status == 'queued':
+                self._finish(job, 'cancelled')
+        for worker in self._workers:
+            worker.cancel()
+        if self._running:
+            logger.info(f"Waiting for {len(self._running)} running jobs to finish")
+            await asyncio.gather(*self._running, return_exceptions=True)
+        loop = asyncio.get_running_loop()
+        if self._downloaders is not None:
+            await loop.run_in_executor(self._downloads, self._downloaders.close)
+        if self._downloads is not None:
+            self._downloads.shutdown()
+        await loop.run_in_executor(None, self.stt_pool.close)
+        await self.client.aclose()
+        close_lecture_index()
+        close_tracer()
+
+    async def __aenter__(self) -> 'JobServer':
+        return await self.start()
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    def submit(self, kind: str, source: str, name: str, priority: int = 0) -> Job:
+        self._evict_finished()
+        job = Job(uuid.uuid4().hex[:12], kind, source, name, priority)
+        self.jobs[job.id] = job
+        self._queue.put_nowait((-priority, next(self._order), job.id))
+        job.emit('status', {'status': 'queued', 'position': self._queue.qsize()})
+        logger.info(f"Job {job.id} queued: {name} (priority {priority})")
+        return job
+
+    def cancel(self, job: Job) -> None:
+        """Cancel a queued job; a running one holds STT workers and runs to the end."""
+        if job.status != 'queued':
+            raise HTTPError(409, f"job is {job.status}, only queued jobs can be cancelled")
+        self._finish(job, 'cancelled')
+
+    def _finish(self, job: Job, status: str, error: Optional[str] = None) -> None:
+        job.status = status
+        job.error = error
+        job.finished = time.time()
+        job.emit('end', job.to_dict(with_result=True))
+        self._finished[job.id] = job.finished
+        self._evict_finished()
+
+    def _evict_finished(self) -> None:
+        """Forget finished jobs past the `keep_finished` cap or older than `finished_ttl`."""
+        expired = time.time() - self.finished_ttl
+        while self._finished:
+            job_id, finished = next(iter(self._finished.items()))
+            if len(self._finished) <= self.keep_finished and finished >= expired:
+                break
+            del self._finished[job_id]
+            self.jobs.pop(job_id, None)
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, job_id = await self._queue.get()
+            job = self.jobs.get(job_id)
+            # Cancelled jobs stay in the queue and may have been evicted already
+            if job is None or job.status != 'queued':
+                continue
+            task = asyncio.create_task(self._run(job))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+            # Shielded so closing the server lets the job finish instead of cancelling it
+            await asyncio.shield(task)
+
+    def _free_audio_path(self, name: str) -> str:
+        """Path in the upload directory whose file and run directory are both unused."""
+        base = os.path.splitext(sanitize_filename(name))[0] or 'upload'
+        for n in itertools.count(1):
+            path = os.path.join(self.upload_dir, f"{base}.wav" if n == 1 else f"{base}_{n}.wav")
+            if not os.path.exists(path) and not os.path.exists(run_dir_for(path, self.runs_dir)):
+                return path
+
+    def _download(self, url: str) -> Optional[str]:
+        """Download `url` with this thread's warm downloader, as a fresh name (runs in `_downloads`)."""
+        path = download_and_convert(url, self.upload_dir, self._downloaders.get())
+        if path is None:
+            return None
+        free_path = self._free_audio_path(os.path.basename(path))
+        if free_path != path:
+            os.replace(path, free_path)
+        return free_path
+
+    async def _run(self, job: Job) -> None:
+        loop = asyncio.get_running_loop()
+
+        def on_event(kind: str, data: Dict) -> None:
+            # Transcription events come from a pool thread
+            loop.call_soon_threadsafe(job.emit, kind, data)
+
+        job.status = 'running'
+        job.started = time.time()
+        job.emit('status', {'status': 'running'})
+        try:
+            if job.kind == 'url':
+                job.emit('stage', {'stage': 'download'})
+                if self._downloads is None:
+                    self._downloads = ThreadPoolExecutor(DOWNLOAD_WORKERS, thread_name_prefix='download')
+                    self._downloaders = DownloaderPool(ydl_options(self.upload_dir), self.downloader_factory)
+                job.audio_path = await loop.run_in_executor(self._downloads, self._download, job.source)
+                if job.audio_path is None:
+                    raise RuntimeError(f"download of {job.source} failed")
+                job.name = os.path.basename(job.audio_path)
+
+            if self.skip_duplicates:
+                original = await loop.run_in_executor(None, self.fingerprints.check, job.audio_path)
+                if original is not None and os.path.abspath(original) != os.path.abspath(job.audio_path):
+                    os.remove(job.audio_path)
+                    refined = os.path.join(run_dir_for(original, self.runs_dir), 'refined_summary.txt')
+                    if os.path.exists(refined):
+                        with open(refined, 'r', encoding='utf-8') as f:
+                            job.result = f.read()
+                    job.emit('duplicate', {'original': os.path.basename(original)})
+                    self._finish(job, 'duplicate')
+                    return
+
+            run_dir = run_dir_for(job.audio_path, self.runs_dir)
+            ok = await process_audio_file(job.audio_path, run_dir, self.limits, self.stt_pool,
+                                          self.client, on_event=on_event)
+            # Let events scheduled from pool threads land before the end event
+            await asyncio.sleep(0)
+            refined = os.path.join(run_dir, 'refined_summary.txt')
+            if ok and os.path.exists(refined):
+                with open(refined, 'r', encoding='utf-8') as f:
+                    job.result = f.read()
+                self._finish(job, 'done')
+            else:
+                self._finish(job, 'failed', "processing failed, see the server log")
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {e}")
+            await asyncio.sleep(0)
+            self._finish(job, 'failed', str(e))
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serve the requests of one connection, kept alive until the client closes it."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                except ValueError:
+                    await self._send_json(writer, 400, {'error': "malformed request line"}, close=True)
+                    break
+                headers = {}
+                while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                parsed = urlsplit(target)
+                query = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+                try:
+                    keep_open = await self._route(method, parsed.path.rstrip('/') or '/', query,
+                                                  headers, reader, writer)
+                except HTTPError as e:
+                    # The request body may be left unread, so the connection cannot be reused
+                    await self._send_json(writer, e.status, {'error': str(e)}, close=True)
+                    break
+                if not keep_open or headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, path: str, query: Dict, headers: Dict,
+                     reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> bool:
+        parts = path.strip('/').split('/')
+        if path == '/health' and method == 'GET':
+            running = sum(job.status == 'running' for job in self.jobs.values())
+            return await self._send_json(writer, 200, {
+                'status': 'ok', 'queued': self._queue.qsize(), 'running': running,
+                'stt_workers': self.stt_pool.processes, 'stt_backend': self.stt_pool.backend,
+                'model': self.client.model,
+            })
+        if path == '/search' and method == 'GET':
+            if not query.get('q', '').strip():
+                raise HTTPError(400, "q is required")
+            limit = int_param(query.get('limit', SEARCH_LIMIT), 'limit')
+            try:
+                results = await asyncio.get_event_loop().run_in_executor(
+                    None, get_lecture_index().search, query['q'], limit, query.get('kind'), query.get('lecture'))
+            except ValueError as e:
+                raise HTTPError(400, str(e))
+            return await self._send_json(writer, 200, results)
+        if parts[0] != 'jobs':
+            raise HTTPError(404, f"no route for {path}")
+        if len(parts) == 1:
+            if method == 'GET':
+                return await self._send_json(writer, 200, [job.to_dict() for job in self.jobs.values()])
+            if method == 'POST':
+                job = await self._submit_request(query, headers, reader)
+                return await self._send_json(writer, 202, job.to_dict())
+            raise HTTPError(405, f"{method} not allowed on /jobs")
+        job = self.jobs.get(parts[1])
+        if job is None:
+            raise HTTPError(404, f"no job {parts[1]}")
+        if len(parts) == 2 and method == 'GET':
+            return await self._send_json(writer, 200, job.to_dict(with_result=True))
+        if len(parts) == 2 and method == 'DELETE':
+            self.cancel(job)
+            return await self._send_json(writer, 200, job.to_dict())
+        if len(parts) == 3 and parts[2] == 'events' and method == 'GET':
+            after = int_param(headers.get('last-event-id') or query.get('after') or 0, 'Last-Event-ID')
+            await self._stream_events(job, after, writer)
+            return False
+        raise HTTPError(404, f"no route for {method} {path}")
+
+    async def _submit_request(self, query: Dict, headers: Dict, reader: asyncio.StreamReader) -> Job:
+        priority = int_param(query.get('priority', 0), 'priority')
+        if 'content-length' not in headers:
+            raise HTTPError(411, "Content-Length required")
+        length = int_param(headers['content-length'], 'Content-Length')
+        content_type = headers.get('content-type', '').split(';')[0].strip()
+        if content_type == 'application/json':
+            try:
+                body = json.loads(await reader.readexactly(length) or b'{}')
+            except ValueError:
+                raise HTTPError(400, "invalid JSON body")
+            url = body.get('url', '') if isinstance(body, dict) else ''
+            if urlsplit(url).scheme not in ('http', 'https'):
+                raise HTTPError(400, "body must be {\"url\": \"http(s)://...\"}")
+            return self.submit('url', url, url, int_param(body.get('priority', priority), 'priority'))
+        if content_type not in ('audio/wav', 'audio/x-wav', 'audio/wave', 'application/octet-stream'):
+            raise HTTPError(415, "send a WAV file (audio/wav) or a JSON body with a url")
+        if length > MAX_UPLOAD_BYTES:
+            raise HTTPError(413, f"upload larger than {MAX_UPLOAD_BYTES // 1024 // 1024} MB")
+
+        name = query.get('name') or 'upload.wav'
+        path = self._free_audio_path(name)
+        part_path = path + '.part'
+        remaining = length
+        with open(part_path, 'wb') as f:
+            while remaining:
+                data = await reader.read(min(UPLOAD_READ_BYTES, remaining))
+                if not data:
+                    f.close()
+                    os.remove(part_path)
+                    raise asyncio.IncompleteReadError(b'', remaining)
+                f.write(data)
+                remaining -= len(data)
+        try:
+            with wave.open(part_path, 'rb') as wf:
+                wf.getnframes()
+        except (wave.Error, EOFError) as e:
+            os.remove(part_path)
+            raise HTTPError(400, f"not a WAV file: {e}")
+        # Taken again, a concurrent upload may have claimed the name while this one was read
+        path = self._free_audio_path(name)
+        os.replace(part_path, path)
+        return self.submit('upload', path, os.path.basename(path), priority)
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, body, close: bool = False) -> bool:
+        payload = json.dumps(body).encode('utf-8')
+        reason = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found',
+                  405: 'Method Not Allowed', 409: 'Conflict', 411: 'Length Required',
+                  413: 'Payload Too Large', 415: 'Unsupported Media Type'}.get(status, '')
+        writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(payload)}\r\n"
+                     f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n".encode('latin-1') + payload)
+        await writer.drain()
+        return not close
+
+    async def _stream_events(self, job: Job, after: int, writer: asyncio.StreamWriter) -> None:
+        """Send the events after id `after`, then live ones until the job's 'end' event."""
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                     b"Connection: close\r\n\r\n")
+        backlog, queue = job.subscribe(after)
+        try:
+            for event in backlog:
+                writer.write(sse_message(event))
+            await writer.drain()
+            if job.status in FINAL_STATUSES and (not backlog or backlog[-1]['event'] == 'end'):
+                return
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    writer.write(b": keep-alive\n\n")
+                    await writer.drain()
+                    continue
+                writer.write(sse_message(event))
+                await writer.drain()
+                if event['event'] == 'end':
+                    return
+        finally:
+            job.unsubscribe(queue)
+
+def int_param(value, name: str) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise HTTPError(400, f"{name} must be an integer")
+
+def sse_message(event: Dict) -> bytes:
+    return (f"id: {event['id']}\nevent: {event['event']}\n"
+            f"data: {json.dumps(event['data'], ensure_ascii=False)}\n\n").encode('utf-8')
+
+def submit_job(source: str, priority: int = 0, server_url: str = JOB_SERVER_URL,
+               client: Optional[httpx.Client] = None) -> Dict:
+    """Queue a WAV file (streamed from disk) or a URL on the server; returns the job."""
+    http = client or httpx.Client(timeout=None)
+    try:
+        if source.startswith(('http://', 'https://')):
+            response = http.post(f"{server_url}/jobs", json={'url': source, 'priority': priority})
+        else:
+            with open(source, 'rb') as f:
+                response = http.post(
+                    f"{server_url}/jobs?priority={priority}&name={quote(os.path.basename(source))}",
+                    content=iter(lambda: f.read(UPLOAD_READ_BYTES), b''),
+                    headers={'Content-Type': 'audio/wav', 'Content-Length': str(os.path.getsize(source))}
+                )
+        response.raise_for_status()
+        return response.json()
+    finally:
+        if client is None:
+            http.close()
+
+def follow_job(job_id: str, server_url: str = JOB_SERVER_URL, after: int = 0,
+               client: Optional[httpx.Client] = None) -> Iterator[Dict]:
+    """Yield the job's events `{'id', 'event', 'data'}` as they happen, ending with 'end'."""
+    http = client or httpx.Client(timeout=None)
+    try:
+        with http.stream('GET', f"{server_url}/jobs/{job_id}/events", headers={'Last-Event-ID': str(after)}) as response:
+            response.raise_for_status()
+            event = {}
+            for line in response.iter_lines():
+                if not line:
+                    if 'event' in event:
+                        yield event
+                    event = {}
+                elif line.startswith('id: '):
+                    event['id'] = int(line[4:])
+                elif line.startswith('event: '):
+                    event['event'] = line[7:]
+                elif line.startswith('data: '):
+                    event['data'] = json.loads(line[6:])
+    finally:
+        if client is None:
+            http.close()
+
+def print_events(job_id: str, server_url: str = JOB_SERVER_URL) -> Dict:
+    """Show a job's progress on the console as it streams; returns its final state."""
+    streaming = None
+    for event in follow_job(job_id, server_url):
+        kind, data = event['event'], event['data']
+        if kind in ('summary_token', 'refine_token'):
+            key = (kind, data.get('chunk'))
+            if streaming != key:
+                label = f"Summary of chunk {data['chunk']}" if kind == 'summary_token' else "Refined summary"
+                print(f"\n\n{label}:\n" + "-" * 50)
+                streaming = key
+            print(data['text'], end='', flush=True)
+            continue
+        streaming = None
+        if kind == 'chunk_transcribed':
+            print(f"\n\nTranscript of chunk {data['chunk']}/{data['total_chunks']}:\n{data['text']}")
+        elif kind == 'chunk_retry':
+            print(f"\n[chunk {data['chunk']}: attempt {data['attempt']} failed, retrying]")
+        elif kind in ('status', 'stage', 'duplicate'):
+            print(f"\n[{kind}: {', '.join(f'{k}={v}' for k, v in data.items())}]")
+        elif kind == 'end':
+            print(f"\n\nJob {job_id} {data['status']}" + (f": {data['error']}" if data.get('error') else ""))
+            return data
+    return {}
+
+async def serve(args: argparse.Namespace) -> None:
+    if args.fake:
+        stt_pool = TranscriptionPool(backend='fake', backend_options={'latency': args.fake_stt_latency})
+        client = OllamaClient(client=FakeAsyncClient(), cache=None)
+    else:
+        stt_pool, client = TranscriptionPool(), get_client()
+    server = JobServer(args.host, args.port, args.workers, stt_pool, client,
+                       upload_dir=args.upload_dir, runs_dir=args.runs_dir)
+    async with server:
+        print(f"Job server ready on {server.url}")
+        await server.serve_forever()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local job server for the lecture pipeline")
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve_parser = commands.add_parser('serve', help="run the server")
+    serve_parser.add_argument('--host', default=JOB_SERVER_HOST)
+    serve_parser.add_argument('--port', type=int, default=JOB_SERVER_PORT)
+    serve_parser.add_argument('--workers', type=int, default=MAX_CONCURRENT_FILES, help="jobs run at once")
+    serve_parser.add_argument('--upload-dir', default=UPLOAD_DIR)
+    serve_parser.add_argument('--runs-dir', default=RUNS_DIR)
+    serve_parser.add_argument('--fake', action='store_true', help="fake STT and LLM, nothing leaves the machine")
+    serve_parser.add_argument('--fake-stt-latency', type=float, default=0.2)
+    submit_parser = commands.add_parser('submit', help="queue a WAV file or URL and follow it")
+    submit_parser.add_argument('source')
+    submit_parser.add_argument('--priority', type=int, default=0, help="higher runs first")
+    submit_parser.add_argument('--no-follow', action='store_true')
+    follow_parser = commands.add_parser('follow', help="stream the progress of a job")
+    follow_parser.add_argument('job_id')
+    commands.add_parser('jobs', help="list jobs")
+    for sub in (submit_parser, follow_parser, commands.choices['jobs']):
+        sub.add_argument('--server', default=JOB_SERVER_URL)
+    args = parser.parse_args()
+    if args.command == 'serve' and not is_loopback_host(args.host):
+        serve_parser.error(f"--host must be a loopback address or a name resolving only to one, not {args.host}")
+
+    if args.command == 'serve':
+        try:
+            asyncio.run(serve(args))
+        except KeyboardInterrupt:
+            print("Job server stopped")
+    elif args.command == 'submit':
+        job = submit_job(args.source, args.priority, args.server)
+        print(f"Job {job['id']} queued ({job['name']})")
+        if not args.no_follow:
+            print_events(job['id'], args.server)
+    elif args.command == 'follow':
+        print_events(args.job_id, args.server)
+    else:
+        for job in httpx.get(f"{args.server}/jobs").json():
+            print(f"{job['id']}  {job['status']:<9}  p{job['priority']:<3} {job['name']}")
+
+if __name__ == "__main__":
+    main()
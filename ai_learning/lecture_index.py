@@ -0,0 +1,326 @@
+import argparse
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from job_manifest import MANIFEST_FILE, RUNS_DIR, JobManifest
+from transcript_store import STORE_FILE, TranscriptStore
+
+logger = logging.getLogger(__name__)
+
+LECTURE_INDEX_DB = os.environ.get("LECTURE_INDEX_DB", "cache/lecture_index.sqlite3")
+# Add each lecture to the search index once it is refined; LECTURE_INDEX=0 to leave the index alone
+INDEX_LECTURES = os.environ.get("LECTURE_INDEX", "1") != "0"
+REFINED_FILE = 'refined_summary.txt'
+KINDS = ('transcript', 'summary', 'refined')
+SEARCH_LIMIT = 10
+SNIPPET_TOKENS = 16
+WORD = re.compile(r'\w+', re.UNICODE)
+
+def fts_query(text: str) -> str:
+    """FTS5 query matching passages that contain every word of `text`, whatever its punctuation.
+
+    A trailing `*` on a word keeps it a prefix search.
+    """
+    terms = []
+    for token in text.split():
+        prefix = token.endswith('*')
+        terms.extend(f'"{word}"' for word in WORD.findall(token))
+        if prefix and terms:
+            terms[-1] += '*'
+    return ' '.join(terms)
+
+def format_offset(seconds: Optional[float]) -> str:
+    """`m:ss`, or `h:mm:ss` from an hour on; empty when there is no offset."""
+    if seconds is None:
+        return ''
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes}:{secs:02d}"
+
+class LectureIndex:
+    """Full-text index over the transcripts and summaries of every processed lecture.
+
+    Each passage is one chunk transcript, one chunk summary or a lecture's
+    refined summary, with its lecture (the run directory name), chunk
+    number and the audio offsets it covers. Passages live in a plain table
+    and an FTS5 index over it (external content, kept in step by triggers),
+    ranked by BM25 on the text. The passage kind is an FTS5 column too, so
+    a kind filter is part of the match; a lecture filter is a rowid range.
+    Accents are folded, so `perche` also finds `perché`.
+    A lecture is only read again when its transcript store or refined
+    summary changed since it was indexed.
+    """
+
+    def __init__(self, path: str = LECTURE_INDEX_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(
+                "CREATE TABLE IF NOT EXISTS lectures ("
+                "id INTEGER PRIMARY KEY, lecture TEXT UNIQUE NOT NULL, run_dir TEXT NOT NULL, "
+                "audio_file TEXT, seconds REAL, chunks INTEGER NOT NULL, first_passage INTEGER, "
+                "last_passage INTEGER, version TEXT NOT NULL, indexed REAL NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS passages ("
+                "id INTEGER PRIMARY KEY, lecture_id INTEGER NOT NULL, kind TEXT NOT NULL, chunk_num INTEGER, "
+                "start_seconds REAL, end_seconds REAL, text TEXT NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS passages_lecture ON passages(lecture_id);"
+                "CREATE VIRTUAL TABLE IF NOT EXISTS passages_fts USING fts5("
+                "kind, text, content='passages', content_rowid='id', "
+                "prefix='3 4', tokenize='unicode61 remove_diacritics 2');"
+                "CREATE TRIGGER IF NOT EXISTS passages_insert AFTER INSERT ON passages BEGIN "
+                "INSERT INTO passages_fts(rowid, kind, text) VALUES (new.id, new.kind, new.text); END;"
+                "CREATE TRIGGER IF NOT EXISTS passages_delete AFTER DELETE ON passages BEGIN "
+                "INSERT INTO passages_fts(passages_fts, rowid, kind, text) "
+                "VALUES ('delete', old.id, old.kind, old.text); END;"
+            )
+            self._conn.commit()
+        return self._conn
+
+    @staticmethod
+    def _version(run_dir: str) -> Optional[str]:
+        """Modification times of what a lecture is indexed from, or None if it has nothing to index."""
+        stamps = []
+        for name in (STORE_FILE, REFINED_FILE):
+            path = os.path.join(run_dir, name)
+            stamps.append(str(os.stat(path).st_mtime_ns) if os.path.exists(path) else '-')
+        return None if stamps == ['-', '-'] else ':'.join(stamps)
+
+    def index_run(self, run_dir: str, force: bool = False) -> bool:
+        """Add or refresh the lecture of one run directory; returns False if it was already current."""
+        version = self._version(run_dir)
+        if version is None:
+            return False
+        lecture = os.path.basename(os.path.normpath(run_dir))
+        with self._lock:
+            row = self._connection().execute("SELECT version FROM lectures WHERE lecture = ?",
+                                             (lecture,)).fetchone()
+        if row is not None and row[0] == version and not force:
+            return False
+
+        passages = []
+        chunks = []
+        if os.path.exists(os.path.join(run_dir, STORE_FILE)):
+            with TranscriptStore(os.path.join(run_dir, STORE_FILE)) as store:
+                chunks = store.chunks()
+        for chunk in chunks:
+            offsets = (chunk['chunk_num'], chunk['start_seconds'], chunk['end_seconds'])
+            passages.append(('transcript', *offsets, chunk['text']))
+            if chunk['summary']:
+                passages.append(('summary', *offsets, chunk['summary']))
+        refined_path = os.path.join(run_dir, REFINED_FILE)
+        if os.path.exists(refined_path):
+            with open(refined_path, 'r', encoding='utf-8') as f:
+                passages.append(('refined', None, None, None, f.read()))
+        audio_file, seconds = None, None
+        if os.path.exists(os.path.join(run_dir, MANIFEST_FILE)):
+            manifest = JobManifest.load_or_create(run_dir)
+            audio_file, seconds = manifest.audio_file, manifest.audio_seconds or None
+
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                self._delete(conn, lecture)
+                cursor = conn.execute(
+                    "INSERT INTO lectures (lecture, run_dir, audio_file, seconds, chunks, version, indexed) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (lecture, os.path.abspath(run_dir), audio_file, seconds, len(chunks), version, time.time())
+                )
+                lecture_id = cursor.lastrowid
+                conn.executemany(
+                    "INSERT INTO passages (lecture_id, kind, chunk_num, start_seconds, end_seconds, text) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [(lecture_id, *passage) for passage in passages]
+                )
+                conn.execute(
+                    "UPDATE lectures SET (first_passage, last_passage) = "
+                    "(SELECT MIN(id), MAX(id) FROM passages WHERE lecture_id = ?) WHERE id = ?",
+                    (lecture_id, lecture_id)
+                )
+        logger.info(f"Indexed {lecture}: {len(chunks)} chunks, {len(passages)} passages")
+        return True
+
+    @staticmethod
+    def _delete(conn: sqlite3.Connection, lecture: str) -> None:
+        conn.execute("DELETE FROM passages WHERE lecture_id IN (SELECT id FROM lectures WHERE lecture = ?)",
+                     (lecture,))
+        conn.execute("DELETE FROM lectures WHERE lecture = ?", (lecture,))
+
+    def remove(self, lecture: str) -> None:
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                self._delete(conn, lecture)
+
+    def update(self, runs_dir: str = RUNS_DIR, prune: bool = False) -> Dict[str, int]:
+        """Index every run in `runs_dir` that is new or changed since the last update.
+
+        With `prune`, lectures whose run directory is gone are dropped.
+        Returns `{'indexed', 'current', 'pruned'}` counts.
+        """
+        counts = {'indexed': 0, 'current': 0, 'pruned': 0}
+        names = sorted(os.listdir(runs_dir)) if os.path.isdir(runs_dir) else []
+        for name in names:
+            run_dir = os.path.join(runs_dir, name)
+            if not os.path.isdir(run_dir):
+                continue
+            try:
+                changed = self.index_run(run_dir)
+            except (OSError, ValueError, sqlite3.DatabaseError) as e:
+                logger.error(f"Could not index {run_dir}: {e}")
+                continue
+            counts['indexed' if changed else 'current'] += 1
+        if prune:
+            with self._lock:
+                known = [row[0] for row in self._connection().execute("SELECT lecture FROM lectures")]
+            for lecture in set(known) - set(names):
+                self.remove(lecture)
+                counts['pruned'] += 1
+        return counts
+
+    def search(self, query: str, limit: int = SEARCH_LIMIT, kind: Optional[str] = None,
+               lecture: Optional[str] = None, raw: bool = False) -> List[Dict]:
+        """Best matching passages for `query`, each as `{'lecture', 'kind', 'chunk_num',
+        'start_seconds', 'end_seconds', 'snippet', 'score'}`.
+
+        Every word of `query` must appear (see `fts_query`); pass `raw` to
+        use FTS5 syntax as is (phrases, OR, NEAR). `kind` and `lecture`
+        narrow the search to one kind of passage or one lecture.
+        """
+        match = query if raw else fts_query(query)
+        if not match:
+            return []
+        if kind is not None and kind not in KINDS:
+            raise ValueError(f"kind must be one of {', '.join(KINDS)}")
+        match = f"text : ({match})"
+        if kind is not None:
+            match = f"kind : {kind} AND {match}"
+        # Rank first and build snippets for the hits only: ranking every
+        # match is cheap, joining and snippeting every match is not
+        sql = "SELECT rowid, bm25(passages_fts, 0.0, 1.0) FROM passages_fts WHERE passages_fts MATCH ?"
+        params = [match]
+        with self._lock:
+            conn = self._connection()
+            if lecture is not None:
+                # A lecture's passages are written together, so they are one range of rowids
+                row = conn.execute("SELECT first_passage, last_passage FROM lectures WHERE lecture = ?",
+                                   (lecture,)).fetchone()
+                if row is None or row[0] is None:
+                    return []
+                sql += " AND rowid BETWEEN ? AND ?"
+                params.extend(row)
+            sql += " ORDER BY bm25(passages_fts, 0.0, 1.0) LIMIT ?"
+            params.append(limit)
+            scores = dict(conn.execute(sql, params).fetchall())
+            if not scores:
+                return []
+            rows = conn.execute(
+                "SELECT passages_fts.rowid, l.lecture, p.kind, p.chunk_num, p.start_seconds, p.end_seconds, "
+                f"snippet(passages_fts, 1, '[', ']', ' … ', {SNIPPET_TOKENS}) "
+                "FROM passages_fts JOIN passages p ON p.id = passages_fts.rowid "
+                "JOIN lectures l ON l.id = p.lecture_id "
+                f"WHERE passages_fts MATCH ? AND passages_fts.rowid IN ({', '.join('?' * len(scores))})",
+                [match, *scores]
+            ).fetchall()
+        rows.sort(key=lambda row: scores[row[0]])
+        return [{'lecture': row[1], 'kind': row[2], 'chunk_num': row[3], 'start_seconds': row[4],
+                 'end_seconds': row[5], 'snippet': row[6], 'score': -scores[row[0]]} for row in rows]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            conn = self._connection()
+            (lectures,) = conn.execute("SELECT COUNT(*) FROM lectures").fetchone()
+            (passages,) = conn.execute("SELECT COUNT(*) FROM passages").fetchone()
+        return {'lectures': lectures, 'passages': passages,
+                'bytes': os.path.getsize(self.path) if os.path.exists(self.path) else 0}
+
+    def optimize(self) -> None:
+        """Merge the FTS5 index segments, after a large update."""
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("INSERT INTO passages_fts(passages_fts) VALUES ('optimize')")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+_shared_index: Optional[LectureIndex] = None
+
+def get_lecture_index() -> LectureIndex:
+    """Return the process-wide lecture index, opening it on first use."""
+    global _shared_index
+    if _shared_index is None:
+        _shared_index = LectureIndex()
+    return _shared_index
+
+def close_lecture_index() -> None:
+    global _shared_index
+    if _shared_index is not None:
+        _shared_index.close()
+        _shared_index = None
+
+def print_results(results: List[Dict]) -> None:
+    if not results:
+        print("No results")
+    for result in results:
+        where = f"chunk {result['chunk_num']}" if result['chunk_num'] is not None else "refined summary"
+        if result['start_seconds'] is not None:
+            where += f" {format_offset(result['start_seconds'])}-{format_offset(result['end_seconds'])}"
+        print(f"{result['lecture']}  [{result['kind']}, {where}]\n    {result['snippet']}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Search the transcripts and summaries of processed lectures")
+    parser.add_argument('--db', default=LECTURE_INDEX_DB)
+    commands = parser.add_subparsers(dest='command', required=True)
+    search_parser = commands.add_parser('search', help="find passages containing every word of a query")
+    search_parser.add_argument('query')
+    search_parser.add_argument('--limit', type=int, default=SEARCH_LIMIT)
+    search_parser.add_argument('--kind', choices=KINDS)
+    search_parser.add_argument('--lecture')
+    search_parser.add_argument('--raw', action='store_true', help="query in FTS5 syntax")
+    update_parser = commands.add_parser('update', help="index new and changed runs")
+    update_parser.add_argument('--runs-dir', default=RUNS_DIR)
+    update_parser.add_argument('--prune', action='store_true', help="drop lectures whose run is gone")
+    commands.add_parser('stats', help="size of the index")
+    args = parser.parse_args()
+
+    index = LectureIndex(args.db)
+    try:
+        if args.command == 'search':
+            start = time.perf_counter()
+            try:
+                results = index.search(args.query, args.limit, args.kind, args.lecture, args.raw)
+            except sqlite3.OperationalError as e:
+                parser.error(f"invalid query: {e}")
+            print_results(results)
+            print(f"({len(results)} results in {(time.perf_counter() - start) * 1000:.1f} ms)")
+        elif args.command == 'update':
+            start = time.perf_counter()
+            counts = index.update(args.runs_dir, args.prune)
+            if counts['indexed']:
+                index.optimize()
+            print(f"{counts['indexed']} lectures indexed, {counts['current']} already current, "
+                  f"{counts['pruned']} removed in {time.perf_counter() - start:.1f}s")
+        else:
+            stats = index.stats()
+            print(f"{stats['lectures']} lectures, {stats['passages']} passages, "
+                  f"{stats['bytes'] / 1024 / 1024:.1f} MB")
+    finally:
+        index.close()
+
+if __name__ == '__main__':
+    main()
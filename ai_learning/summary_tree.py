@@ -0,0 +1,153 @@
+import asyncio
+import contextlib
+import logging
+from typing import Callable, List, Optional
+
+from ollama_client import CONTEXT_TOKENS, OllamaClient, get_client
+from text_chunker import iter_chunks
+
+logger = logging.getLogger(__name__)
+
+REDUCE_PROMPT = """Sei un editor esperto. Il tuo compito è:
+1. Rimuovere tutte le ripetizioni di concetti e informazioni
+2. Eliminare frasi incomplete o poco chiare
+3. Mantenere la coerenza tra i paragrafi
+4. Preservare tutte le informazioni uniche e rilevanti
+5. Migliorare la leggibilità del testo"""
+SECTION_SEPARATOR = "\n\n---\n\n"
+# Share of the context left for the prompt; the rest is room for the answer
+INPUT_SHARE = 0.6
+# A level that stops shrinking the input this many times in a row ends the reduction
+MAX_STALLED_LEVELS = 2
+# Same retry policy as chunk summaries: attempts per reduce request, backoff grows per attempt
+MAX_REDUCE_RETRIES = 3
+RETRY_BACKOFF_SECONDS = 2.0
+
+def pack_by_tokens(pieces: List[str], max_tokens: int, count_tokens: Callable[[str], int],
+                   separator: str = "\n\n") -> List[List[str]]:
+    """Group consecutive pieces so each group stays within `max_tokens`.
+
+    A piece larger than `max_tokens` on its own gets a group to itself.
+    """
+    separator_tokens = count_tokens(separator)
+    groups = []
+    current, current_tokens = [], 0
+    for piece in pieces:
+        tokens = count_tokens(piece)
+        if current and current_tokens + separator_tokens + tokens > max_tokens:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current_tokens += tokens + (separator_tokens if current else 0)
+        current.append(piece)
+    if current:
+        groups.append(current)
+    return groups
+
+def input_budget(client: OllamaClient, context_tokens: int = CONTEXT_TOKENS) -> int:
+    """Tokens of text one reduce request can carry next to the system prompt and its answer."""
+    return int((context_tokens - client.count_tokens(REDUCE_PROMPT)) * INPUT_SHARE)
+
+async def reduce_group(group: List[str], client: OllamaClient,
+                       semaphore: Optional[asyncio.Semaphore] = None, echo: bool = False,
+                       on_token: Optional[Callable[[str], None]] = None) -> str:
+    """One reduce request: merge sibling sections into a single clean text.
+
+    With `echo` the answer is printed as it streams; `on_token` gets every piece too.
+    """
+    if len(group) == 1:
+        prompt = f'Riorganizza e pulisci questo testo:\n\n{group[0]}'
+    else:
+        prompt = ('Unisci queste sezioni, separate da ---, in un unico testo coerente '
+                  f'senza ripetizioni:\n\n{SECTION_SEPARATOR.join(group)}')
+    messages = [
+        {'role': 'system', 'content': REDUCE_PROMPT},
+        {'role': 'user', 'content': prompt}
+    ]
+    parts = []
+    async with semaphore or contextlib.nullcontext():
+        async for content in client.chat_stream(messages):
+            parts.append(content)
+            if echo:
+                print(content, end='', flush=True)
+            if on_token is not None:
+                on_token(content)
+    return ''.join(parts)
+
+async def reduce_group_with_retry(group: List[str], client: OllamaClient,
+                                  semaphore: Optional[asyncio.Semaphore] = None, echo: bool = False,
+                                  on_token: Optional[Callable[[str], None]] = None,
+                                  max_retries: int = MAX_REDUCE_RETRIES) -> str:
+    """`reduce_group`, retried with backoff on errors and empty answers.
+
+    After the last failed attempt the group's own text is kept, joined, so a
+    failing request never drops sections. Tokens streamed by a failed attempt
+    have already reached `on_token`.
+    """
+    for attempt in range(1, max_retries + 1):
+        try:
+            text = await reduce_group(group, client, semaphore, echo, on_token)
+            if not text.strip():
+                raise ValueError("empty answer")
+            return text
+        except Exception as e:
+            logger.warning(f"Reduce of {len(group)} sections: attempt {attempt}/{max_retries} failed - {e}")
+            if attempt < max_retries:
+                if echo:
+                    print("\n[retrying]", flush=True)
+                await asyncio.sleep(RETRY_BACKOFF_SECONDS * attempt)
+    logger.error(f"Reduce of {len(group)} sections: giving up after {max_retries} attempts, "
+                 f"keeping them unreduced")
+    return SECTION_SEPARATOR.join(group)
+
+async def reduce_text(text: str, client: Optional[OllamaClient] = None,
+                      semaphore: Optional[asyncio.Semaphore] = None,
+                      context_tokens: int = CONTEXT_TOKENS,
+                      on_token: Optional[Callable[[str], None]] = None) -> str:
+    """Refine a long text into one summary with `reduce_tree`, starting from context-sized sections."""
+    client = client or get_client()
+    sections = list(iter_chunks(text, input_budget(client, context_tokens),
+                                chars_per_token=client.chars_per_token))
+    print(f"\nRefining summary: {len(sections)} sections")
+    return await reduce_tree(sections, client, semaphore, context_tokens, on_token)
+
+async def reduce_tree(pieces: List[str], client: Optional[OllamaClient] = None,
+                      semaphore: Optional[asyncio.Semaphore] = None,
+                      context_tokens: int = CONTEXT_TOKENS,
+                      on_token: Optional[Callable[[str], None]] = None) -> str:
+    """Reduce `pieces` to one text, level by level.
+
+    Each level packs consecutive pieces into groups that fill the model's
+    context, measured in tokens, and reduces every group with one request;
+    the groups of a level run concurrently under `semaphore`. The number of
+    sequential rounds grows with the logarithm of the input length. The last
+    request, the root of the tree, is streamed to the console and to `on_token`.
+    Every request goes through `reduce_group_with_retry`, so a level never
+    loses text to a failed or empty answer.
+    """
+    client = client or get_client()
+    budget = input_budget(client, context_tokens)
+    pieces = [piece for piece in pieces if piece.strip()]
+    level = 0
+    stalled = 0
+    while pieces:
+        groups = pack_by_tokens(pieces, budget, client.count_tokens, SECTION_SEPARATOR)
+        level += 1
+        total_tokens = sum(client.count_tokens(piece) for piece in pieces)
+        logger.info(f"Reduce level {level}: {len(pieces)} sections, ~{total_tokens} tokens "
+                    f"-> {len(groups)} requests")
+        if len(groups) == 1:
+            print(f"\nLevel {level} (final):")
+            print("=" * 50)
+            return await reduce_group_with_retry(groups[0], client, semaphore, echo=True, on_token=on_token)
+
+        reduced = await asyncio.gather(*(reduce_group_with_retry(group, client, semaphore)
+                                         for group in groups))
+        if sum(client.count_tokens(text) for text in reduced) >= total_tokens:
+            stalled += 1
+            if stalled >= MAX_STALLED_LEVELS:
+                logger.warning(f"Reduction stopped shrinking at level {level}, keeping {len(reduced)} sections")
+                return '\n\n'.join(reduced)
+        else:
+            stalled = 0
+        pieces = reduced
+    return ""
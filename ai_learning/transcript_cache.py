@@ -0,0 +1,97 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.environ.get("TRANSCRIPT_CACHE_DIR", "cache/transcripts")
+MAX_CACHE_BYTES = int(os.environ.get("TRANSCRIPT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+def cache_key(pcm: bytes, settings: Dict) -> str:
+    """Content address of a chunk: the 16 kHz mono PCM plus every setting that changes the transcript."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps(settings, sort_keys=True).encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(pcm)
+    return digest.hexdigest()
+
+class TranscriptCache:
+    """Persistent transcript cache shared by all Pool workers.
+
+    One small file per entry under a two-level fan-out. Writes go through a
+    temporary file and `os.replace`, so concurrent workers never see partial
+    entries. Hits refresh the file mtime, which `evict` uses as LRU order.
+    An empty string is a valid entry: it records audio with no recognizable speech.
+    """
+
+    def __init__(self, cache_dir: str = CACHE_DIR, max_bytes: int = MAX_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.txt")
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                text = f.read()
+            os.utime(path)
+            return text
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"Transcript cache read failed for {key[:12]}: {e}")
+            return None
+
+    def put(self, key: str, text: str) -> None:
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        except OSError as e:
+            logger.warning(f"Transcript cache write failed for {key[:12]}: {e}")
+            return
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            # evict only sees entries, so a leftover temporary file would never be removed
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            logger.warning(f"Transcript cache write failed for {key[:12]}: {e}")
+
+    def evict(self) -> int:
+        """Drop least recently used entries until the cache fits in `max_bytes`. Returns entries removed."""
+        if not os.path.isdir(self.cache_dir):
+            return 0
+        entries = []
+        total = 0
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith('.txt'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+        removed = 0
+        if total <= self.max_bytes:
+            return removed
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+            if total <= self.max_bytes:
+                break
+        logger.info(f"Transcript cache: evicted {removed} entries")
+        return removed
@@ -0,0 +1,266 @@
+import argparse
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+STORE_FILE = 'transcript.sqlite3'
+# Chunk and summary rows kept in memory before they are written in one transaction
+STORE_BATCH_ROWS = max(1, int(os.environ.get("TRANSCRIPT_STORE_BATCH_ROWS", "8")))
+LEGACY_METADATA = 'chunks_metadata.json'
+LEGACY_FILE = re.compile(r'^(chunk|summary)_(\d+)\.txt$')
+
+def read_legacy_layout(work_dir: str) -> Dict:
+    """Transcript of `work_dir` in the old one-file-per-chunk layout.
+
+    Returns `{'total_chunks', 'audio_file', 'chunks': {chunk_num: {'text',
+    'summary'}}, 'files': [...]}`, read from `chunk_NNN.txt`,
+    `summary_NNN.txt` and `chunks_metadata.json`; `files` lists what was read.
+    """
+    layout = {'total_chunks': None, 'audio_file': None, 'chunks': {}, 'files': []}
+    if not os.path.isdir(work_dir):
+        return layout
+    metadata_file = os.path.join(work_dir, LEGACY_METADATA)
+    if os.path.exists(metadata_file):
+        try:
+            with open(metadata_file, 'r', encoding='utf-8') as f:
+                metadata = json.load(f)
+            layout['total_chunks'] = metadata.get('total_chunks')
+            layout['audio_file'] = metadata.get('audio_file')
+        except (OSError, ValueError) as e:
+            logger.warning(f"Unreadable {metadata_file}: {e}")
+        layout['files'].append(metadata_file)
+    for name in sorted(os.listdir(work_dir)):
+        match = LEGACY_FILE.match(name)
+        if match is None:
+            continue
+        kind, chunk_num = match.group(1), int(match.group(2))
+        path = os.path.join(work_dir, name)
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        chunk = layout['chunks'].setdefault(chunk_num, {'text': None, 'summary': None})
+        chunk['text' if kind == 'chunk' else 'summary'] = content
+        layout['files'].append(path)
+    return layout
+
+class TranscriptStore:
+    """All chunk transcripts and summaries of one lecture in a single SQLite file.
+
+    Replaces the `chunk_NNN.txt` / `summary_NNN.txt` / `chunks_metadata.json`
+    files of a work directory. Each chunk row holds the transcript, the audio
+    offsets it covers, the STT stage timings and, once written, its summary.
+    Rows are buffered and written `batch_rows` at a time in one transaction,
+    and on `flush`/`close`; a crash loses at most the buffered rows, which a
+    rerun redoes from the transcript and response caches. Reads see buffered
+    rows too and look chunks up by number. Writes may come from the
+    transcription thread and from the event loop.
+    """
+
+    def __init__(self, path: str, batch_rows: int = STORE_BATCH_ROWS):
+        self.path = path
+        self.batch_rows = batch_rows
+        self.flushes = 0
+        self._chunks: Dict[int, Dict] = {}
+        self._summaries: Dict[int, Dict] = {}
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @classmethod
+    def open(cls, work_dir: str, batch_rows: int = STORE_BATCH_ROWS) -> 'TranscriptStore':
+        """Store of `work_dir`, taking over any transcript left there in the old layout."""
+        store = cls(os.path.join(work_dir, STORE_FILE), batch_rows)
+        store.migrate_legacy(work_dir)
+        return store
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "chunk_num INTEGER PRIMARY KEY, text TEXT NOT NULL, "
+                "start_seconds REAL, end_seconds REAL, timings TEXT, cached INTEGER NOT NULL DEFAULT 0, "
+                "summary TEXT, summary_seconds REAL, added REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT)")
+            self._conn.commit()
+        return self._conn
+
+    def add_chunk(self, chunk_num: int, text: str, start_seconds: Optional[float] = None,
+                  end_seconds: Optional[float] = None, timings: Optional[Dict] = None,
+                  cached: bool = False) -> None:
+        """Record the transcript of a chunk and the audio it covers, in seconds from the start."""
+        with self._lock:
+            self._summaries.pop(chunk_num, None)
+            self._chunks[chunk_num] = {'chunk_num': chunk_num, 'text': text, 'start_seconds': start_seconds,
+                                       'end_seconds': end_seconds, 'timings': timings, 'cached': cached,
+                                       'summary': None, 'summary_seconds': None}
+            self._flush_if_full()
+
+    def add_summary(self, chunk_num: int, summary: str, seconds: Optional[float] = None) -> None:
+        with self._lock:
+            self._summaries[chunk_num] = {'summary': summary, 'summary_seconds': seconds}
+            self._flush_if_full()
+
+    def _flush_if_full(self) -> None:
+        if len(self._chunks) + len(self._summaries) >= self.batch_rows:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._chunks and not self._summaries:
+            return
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO chunks (chunk_num, text, start_seconds, end_seconds, timings, "
+                "cached, added) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(row['chunk_num'], row['text'], row['start_seconds'], row['end_seconds'],
+                  json.dumps(row['timings']) if row['timings'] else None, int(row['cached']), now)
+                 for row in self._chunks.values()]
+            )
+            conn.executemany(
+                "UPDATE chunks SET summary = ?, summary_seconds = ? WHERE chunk_num = ?",
+                [(row['summary'], row['summary_seconds'], num) for num, row in self._summaries.items()]
+            )
+        self._chunks.clear()
+        self._summaries.clear()
+        self.flushes += 1
+
+    def flush(self) -> None:
+        """Write every buffered row now."""
+        with self._lock:
+            self._flush()
+
+    def set_info(self, **values) -> None:
+        """Record lecture-wide values such as `total_chunks` or `audio_file`, written at once."""
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO info (key, value) VALUES (?, ?)",
+                                 [(key, json.dumps(value)) for key, value in values.items()])
+
+    def info(self, key: str):
+        with self._lock:
+            row = self._connection().execute("SELECT value FROM info WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    @property
+    def total_chunks(self) -> Optional[int]:
+        return self.info('total_chunks')
+
+    @staticmethod
+    def _row(row: sqlite3.Row) -> Dict:
+        chunk = dict(row)
+        chunk['timings'] = json.loads(chunk['timings']) if chunk['timings'] else None
+        chunk['cached'] = bool(chunk['cached'])
+        chunk.pop('added', None)
+        return chunk
+
+    def _select(self, where: str = '', params: tuple = ()) -> Dict[int, Dict]:
+        conn = self._connection()
+        conn.row_factory = sqlite3.Row
+        try:
+            rows = conn.execute(f"SELECT * FROM chunks {where} ORDER BY chunk_num", params).fetchall()
+        finally:
+            conn.row_factory = None
+        return {row['chunk_num']: self._row(row) for row in rows}
+
+    def chunk(self, chunk_num: int) -> Optional[Dict]:
+        """One chunk as `{'chunk_num', 'text', 'start_seconds', 'end_seconds', 'timings', 'cached',
+        'summary', 'summary_seconds'}`, or None if it has no transcript."""
+        with self._lock:
+            if chunk_num in self._chunks:
+                chunks = {chunk_num: dict(self._chunks[chunk_num])}
+            else:
+                chunks = self._select("WHERE chunk_num = ?", (chunk_num,))
+            for num, row in self._summaries.items():
+                if num in chunks:
+                    chunks[num].update(row)
+        return chunks.get(chunk_num)
+
+    def chunks(self) -> List[Dict]:
+        """Every transcribed chunk, in chunk order."""
+        with self._lock:
+            chunks = self._select()
+            chunks.update((num, dict(row)) for num, row in self._chunks.items())
+            for num, row in self._summaries.items():
+                if num in chunks:
+                    chunks[num].update(row)
+        return [chunks[num] for num in sorted(chunks)]
+
+    def clear(self) -> None:
+        """Drop every chunk and lecture value, to start a new transcript in the same place."""
+        with self._lock:
+            self._chunks.clear()
+            self._summaries.clear()
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM chunks")
+                conn.execute("DELETE FROM info")
+
+    def migrate_legacy(self, work_dir: str) -> int:
+        """Move a transcript in the old file layout of `work_dir` into the store.
+
+        Legacy files are deleted once their content is committed. Returns the
+        number of chunks taken over.
+        """
+        layout = read_legacy_layout(work_dir)
+        if not layout['files']:
+            return 0
+        for chunk_num, chunk in sorted(layout['chunks'].items()):
+            if chunk['text'] is not None:
+                self.add_chunk(chunk_num, chunk['text'])
+                if chunk['summary'] is not None:
+                    self.add_summary(chunk_num, chunk['summary'])
+        self.flush()
+        info = {key: layout[key] for key in ('total_chunks', 'audio_file') if layout[key] is not None}
+        if info:
+            self.set_info(**info)
+        for path in layout['files']:
+            os.remove(path)
+        migrated = sum(chunk['text'] is not None for chunk in layout['chunks'].values())
+        logger.info(f"Moved {migrated} chunks of {work_dir} from the old file layout into {self.path}")
+        return migrated
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush()
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def __enter__(self) -> 'TranscriptStore':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Move old chunk files into transcript stores and show them")
+    parser.add_argument('work_dirs', nargs='+', help="run or text directories")
+    parser.add_argument('--chunk', type=int, help="print this chunk of each directory")
+    args = parser.parse_args()
+    for work_dir in args.work_dirs:
+        with TranscriptStore.open(work_dir) as store:
+            if args.chunk is not None:
+                chunk = store.chunk(args.chunk)
+                print(f"{work_dir} chunk {args.chunk}:\n{chunk['text'] if chunk else '(none)'}")
+                if chunk and chunk['summary']:
+                    print(f"Summary:\n{chunk['summary']}")
+            else:
+                chunks = store.chunks()
+                summarized = sum(chunk['summary'] is not None for chunk in chunks)
+                print(f"{work_dir}: {len(chunks)}/{store.total_chunks or '?'} chunks transcribed, "
+                      f"{summarized} summarized")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+import logging
+import wave
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from audio_dsp import downmix, pcm_to_array
+
+logger = logging.getLogger(__name__)
+
+FRAME_MS = 30
+# Speech frames are extended by this much on both sides so word tails are not cut
+HANGOVER_MS = 240
+MIN_SILENCE_MS = 500
+# Silences longer than this inside a chunk are shortened to KEEP_SILENCE_MS before STT
+TRIM_SILENCE_MS = 1500
+KEEP_SILENCE_MS = 300
+THRESHOLD_MARGIN_DB = 12.0
+# Loud frames less than this above the noise floor mean there is no quiet floor to measure
+MIN_SPREAD_DB = 6.0
+READ_BLOCK_SECONDS = 60
+
+def frame_energy_db(samples: np.ndarray, frame_len: int) -> np.ndarray:
+    """RMS level in dBFS of consecutive `frame_len` frames of int16 `(frames, channels)` audio."""
+    n_frames = len(samples) // frame_len
+    if n_frames == 0:
+        return np.empty(0, dtype=np.float32)
+    mono = downmix(samples[:n_frames * frame_len])
+    power = np.square(mono, out=mono).reshape(n_frames, frame_len).mean(axis=1)
+    return (10 * np.log10(power / (32768.0 ** 2) + 1e-10)).astype(np.float32)
+
+def wav_frame_energy(file_path: str, frame_ms: int = FRAME_MS) -> Tuple[np.ndarray, int, int]:
+    """Frame energy of a whole WAV, read in fixed blocks so memory stays flat.
+
+    Returns `(energy_db, frame_len, total_frames)`, with `frame_len` in audio frames.
+    """
+    with wave.open(file_path, 'rb') as wf:
+        rate = wf.getframerate()
+        frame_len = max(1, rate * frame_ms // 1000)
+        total_frames = wf.getnframes()
+        block_frames = frame_len * max(1, READ_BLOCK_SECONDS * 1000 // frame_ms)
+        energies = []
+        while True:
+            raw_data = wf.readframes(block_frames)
+            if not raw_data:
+                break
+            samples = pcm_to_array(raw_data, wf.getsampwidth(), wf.getnchannels())
+            energies.append(frame_energy_db(samples, frame_len))
+    energy = np.concatenate(energies) if energies else np.empty(0, dtype=np.float32)
+    return energy, frame_len, total_frames
+
+def speech_threshold(energy_db: np.ndarray, margin_db: float = THRESHOLD_MARGIN_DB) -> float:
+    """Adaptive speech level: `margin_db` above the noise floor, capped at halfway to the loud frames.
+
+    Audio at one steady level (dense speech, constant background noise)
+    has no floor to measure; its threshold is -inf, so every frame is speech.
+    """
+    floor, loud = np.percentile(energy_db, [10, 90])
+    if loud - floor < MIN_SPREAD_DB:
+        return float('-inf')
+    return float(floor + min(margin_db, max((loud - floor) / 2, 3.0)))
+
+def speech_mask(energy_db: np.ndarray, margin_db: float = THRESHOLD_MARGIN_DB,
+                hangover_frames: int = HANGOVER_MS // FRAME_MS) -> np.ndarray:
+    """Boolean speech/no-speech per frame from an adaptive noise-floor threshold."""
+    if not len(energy_db):
+        return np.zeros(0, dtype=bool)
+    mask = energy_db > speech_threshold(energy_db, margin_db)
+    if hangover_frames > 0:
+        kernel = np.ones(2 * hangover_frames + 1, dtype=np.int32)
+        mask = np.convolve(mask.astype(np.int32), kernel, mode='same') > 0
+    return mask
+
+def silent_runs(mask: np.ndarray, min_frames: int) -> np.ndarray:
+    """`(start, end)` frame indices of non-speech runs at least `min_frames` long."""
+    padded = np.concatenate(([True], mask, [True])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(padded))
+    runs = edges.reshape(-1, 2)
+    return runs[(runs[:, 1] - runs[:, 0]) >= min_frames]
+
+def _choose_cut(runs: np.ndarray, lo: int, hi: int, target: int) -> int:
+    """Frame to cut at: middle of the pause nearest to `target` whose middle falls in `[lo, hi]`, longest on ties."""
+    if len(runs):
+        mids = (runs[:, 0] + runs[:, 1]) // 2
+        inside = (mids >= lo) & (mids <= hi)
+        if inside.any():
+            lengths = (runs[:, 1] - runs[:, 0])[inside]
+            candidates = mids[inside]
+            order = np.lexsort((-lengths, np.abs(candidates - target)))
+            return int(candidates[order[0]])
+    return hi
+
+def _speech_ranges(mask: np.ndarray, runs: np.ndarray, start: int, end: int,
+                   trim_frames: int, keep_frames: int) -> List[Tuple[int, int]]:
+    """Frame ranges of `[start, end)` left after shortening long silences and dropping silent edges."""
+    if not mask[start:end].any():
+        return []
+    ranges = []
+    cursor = start
+    overlapping = runs[(runs[:, 1] > start) & (runs[:, 0] < end)]
+    for run_start, run_end in overlapping.tolist():
+        run_start, run_end = max(run_start, start), min(run_end, end)
+        if run_end - run_start < trim_frames and run_start > start and run_end < end:
+            continue
+        if run_end <= run_start:
+            continue
+        # Leading and trailing silence is dropped entirely, inner silence keeps a short pause
+        head = 0 if run_start == start else keep_frames // 2
+        tail = 0 if run_end == end else keep_frames // 2
+        if run_start + head > cursor:
+            ranges.append((cursor, run_start + head))
+        cursor = max(cursor, run_end - tail)
+    if cursor < end:
+        ranges.append((cursor, end))
+    return ranges
+
+def segment_on_silence(file_path: str, target_ms: int = 150000, min_ratio: float = 0.6,
+                       min_silence_ms: int = MIN_SILENCE_MS, trim_silence_ms: int = TRIM_SILENCE_MS,
+                       keep_silence_ms: int = KEEP_SILENCE_MS) -> List[Dict]:
+    """Split a WAV at pauses close to `target_ms`, with long silences trimmed out.
+
+    Each chunk is cut at the pause closest to `target_ms` among those between
+    `min_ratio * target_ms` and `target_ms` from its start, or hard-cut at
+    `target_ms` when there is none. Chunks are windows like `split_audio` returns, plus `ranges`: the
+    `(start_frame, num_frames)` spans that still contain speech. Chunks with
+    no speech at all are left out.
+    """
+    energy, frame_len, total_frames = wav_frame_energy(file_path)
+    mask = speech_mask(energy)
+    runs = silent_runs(mask, max(1, min_silence_ms // FRAME_MS))
+    short_runs = silent_runs(mask, 1)
+    target = max(1, target_ms // FRAME_MS)
+    trim_frames = max(1, trim_silence_ms // FRAME_MS)
+    keep_frames = keep_silence_ms // FRAME_MS
+
+    windows = []
+    start = 0
+    n_frames = len(mask)
+    kept = 0
+    while start < n_frames:
+        end = n_frames if n_frames - start <= target else _choose_cut(
+            runs, start + int(target * min_ratio), start + target, start + target)
+        ranges = _speech_ranges(mask, short_runs, start, end, trim_frames, keep_frames)
+        if ranges:
+            spans = [(s * frame_len, min(e * frame_len, total_frames) - s * frame_len) for s, e in ranges]
+            if end == n_frames and total_frames > end * frame_len and mask[-1]:
+                # Audio after the last whole energy frame belongs to the final span
+                last_start, _ = spans[-1]
+                spans[-1] = (last_start, total_frames - last_start)
+            windows.append({
+                'path': file_path,
+                'start_frame': start * frame_len,
+                'num_frames': min(end * frame_len, total_frames) - start * frame_len,
+                'ranges': spans
+            })
+            kept += sum(n for _, n in spans)
+        start = end
+
+    if total_frames:
+        logger.info(f"Silence-aware split: {len(windows)} chunks, "
+                    f"{100 * (1 - kept / total_frames):.0f}% of the audio trimmed as silence")
+    return windows
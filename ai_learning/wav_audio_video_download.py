@@ -1,7 +1,22 @@
+import json
 import os
-import yt_dlp
 import re
+import tempfile
+import threading
+import time
 import unicodedata
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack
+from typing import Callable, Dict, Optional
+
+from audio_fingerprint import SKIP_DUPLICATE_AUDIO, FingerprintIndex, get_fingerprint_index
+
+# Videos downloaded and converted at the same time, one downloader per worker
+DOWNLOAD_WORKERS = max(1, int(os.environ.get("DOWNLOAD_WORKERS", "4")))
+STATE_FILE = 'download_state.json'
+# Have FFmpeg write 16 kHz mono 16-bit WAV, the format the STT backends take;
+# DOWNLOAD_STT_FORMAT=0 keeps the source sample rate and channels
+DOWNLOAD_STT_FORMAT = os.environ.get("DOWNLOAD_STT_FORMAT", "1") != "0"
 
 def sanitize_filename(filename):
     # Rimuovi l'estensione se presente
@@ -21,6 +36,17 @@ def force_rename(src, dst):
         os.remove(dst)
     os.rename(src, dst)
 
+_rename_lock = threading.Lock()
+
+def unique_path(path):
+    """`path`, or `name_2.wav`, `name_3.wav`... when a file is already there."""
+    base, ext = os.path.splitext(path)
+    n = 2
+    while os.path.exists(path):
+        path = f"{base}_{n}{ext}"
+        n += 1
+    return path
+
 def rename_all_wav_files(directory):
     for filename in os.listdir(directory):
         if filename.lower().endswith('.wav'):
@@ -31,52 +57,200 @@ def rename_all_wav_files(directory):
                 force_rename(old_path, new_path)
                 print(f"RINOMINATO: {filename} -> {sanitized}")
 
-def download_and_convert(url, output_dir='ai_learning/audio'):
-    os.makedirs(output_dir, exist_ok=True)
-
-    ydl_opts = {
+def ydl_options(output_dir, stt_format=DOWNLOAD_STT_FORMAT):
+    options = {
         'format': 'bestaudio/best',
-        'outtmpl': os.path.join(output_dir, '%(title)s.%(ext)s'),
+        # Named by video ID while downloading, so parallel downloads of equal titles never share a file
+        'outtmpl': os.path.join(output_dir, '%(id)s.%(ext)s'),
         'postprocessors': [{
             'key': 'FFmpegExtractAudio',
             'preferredcodec': 'wav',
         }],
         'quiet': True,
     }
+    if stt_format:
+        # Resampled once by FFmpeg here, so process_chunk reads the frames as they are
+        options['postprocessor_args'] = {'extractaudio': ['-ar', '16000', '-ac', '1']}
+    return options
+
+def youtube_dl_factory(options):
+    import yt_dlp
+    return yt_dlp.YoutubeDL(options)
+
+class DownloadState:
+    """Per-URL download record, so a rerun skips videos that are already downloaded.
+
+    Entries look like `{'status': 'done', 'file': ...}`, `{'status':
+    'duplicate', 'duplicate_of': ...}` or `{'status': 'failed', 'error':
+    ...}`; failed URLs are tried again. The file is
+    rewritten after every change (temp file + `os.replace`) and may be
+    updated from several worker threads.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.urls: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.urls = json.load(f)
+
+    def is_done(self, url: str) -> bool:
+        return self.urls.get(url, {}).get('status') in ('done', 'duplicate')
+
+    def mark(self, url: str, status: str, **fields) -> None:
+        with self._lock:
+            self.urls[url] = {'status': status, 'updated': time.time(), **fields}
+            state_dir = os.path.dirname(self.path) or '.'
+            os.makedirs(state_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=state_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self.urls, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+class DownloaderPool:
+    """One configured downloader per worker thread, kept open for every URL that thread handles.
+
+    A YoutubeDL instance is not thread-safe, but reusing it within a thread
+    keeps its HTTP connections and extractor setup warm. `factory(options)`
+    builds one (default `yt_dlp.YoutubeDL`); tests pass a fake extractor.
+    """
+
+    def __init__(self, options: Dict, factory: Optional[Callable] = None):
+        self.options = options
+        self.factory = factory or youtube_dl_factory
+        self.created = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stack = ExitStack()
+
+    def get(self):
+        ydl = getattr(self._local, 'ydl', None)
+        if ydl is None:
+            ydl = self.factory(self.options)
+            with self._lock:
+                ydl = self._stack.enter_context(ydl)
+                self.created += 1
+            self._local.ydl = ydl
+        return ydl
 
+    def close(self) -> None:
+        self._stack.close()
+
+    def __enter__(self) -> 'DownloaderPool':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+def _download(url, output_dir, ydl):
+    """Download and convert one URL with `ydl`; return the final WAV path or raise."""
+    info = ydl.extract_info(url, download=True)
+    # FFmpegExtractAudio replaced the downloaded extension with .wav
+    original_path = os.path.splitext(ydl.prepare_filename(info))[0] + '.wav'
+
+    # Rinomina DOPO il download con forza, dal titolo del video
+    final_name = sanitize_filename(f"{info.get('title') or info['id']}.wav")
+    final_path = os.path.join(output_dir, final_name)
+    if not os.path.exists(original_path):
+        raise FileNotFoundError(f"File non trovato - {original_path}")
+    if final_path != original_path:
+        # Two titles can reduce to the same slug: keep both, the fingerprint check catches true copies
+        with _rename_lock:
+            final_path = unique_path(final_path)
+            force_rename(original_path, final_path)
+    return final_path
+
+def download_and_convert(url, output_dir='ai_learning/audio', ydl=None, stt_format=DOWNLOAD_STT_FORMAT):
+    """Download one URL as WAV; returns the file path, or None on error.
+
+    Pass `ydl` to reuse an open downloader, otherwise one is built for this
+    call. With `stt_format` the WAV is 16 kHz mono (see DOWNLOAD_STT_FORMAT).
+    """
+    os.makedirs(output_dir, exist_ok=True)
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
-            original_path = ydl.prepare_filename(info).replace('.webm', '.wav').replace('.m4a', '.wav')
-            
-            # Rinomina DOPO il download con forza
-            final_name = sanitize_filename(os.path.basename(original_path))
-            final_path = os.path.join(output_dir, final_name)
-            
-            if os.path.exists(original_path):
-                force_rename(original_path, final_path)
-                print(f"SCARICATO: {final_name}")
-            else:
-                print(f"ERRORE: File non trovato - {original_path}")
+        if ydl is None:
+            with youtube_dl_factory(ydl_options(output_dir, stt_format)) as ydl:
+                final_path = _download(url, output_dir, ydl)
+        else:
+            final_path = _download(url, output_dir, ydl)
+        print(f"SCARICATO: {os.path.basename(final_path)}")
+        return final_path
     except Exception as e:
         print(f"ERRORE con {url}: {str(e)}")
+        return None
 
-def process_links_from_file(file_path='ai_learning/link.txt'):
+def process_links_from_file(file_path='ai_learning/link.txt', output_dir='ai_learning/audio',
+                            workers=DOWNLOAD_WORKERS, downloader_factory=None, state_path=None,
+                            stt_format=DOWNLOAD_STT_FORMAT, skip_duplicates=SKIP_DUPLICATE_AUDIO,
+                            fingerprints: Optional[FingerprintIndex] = None):
+    """Download every link in `file_path` with `workers` threads, skipping finished URLs.
+
+    Extraction, download and FFmpeg conversion of different videos overlap,
+    and each thread reuses one downloader (see `DownloaderPool`). Per-URL
+    state lives in `download_state.json` next to `file_path`, so URLs
+    downloaded by an earlier run are skipped even after their WAV was
+    transcribed and deleted. With `stt_format` files are written as 16 kHz
+    mono, a fifth of the size of 44.1 kHz stereo, and need no resampling
+    later. With `skip_duplicates` each new WAV is checked against the
+    fingerprint index (`fingerprints`, the shared one by default) and a copy
+    of a lecture already seen is deleted and recorded as 'duplicate'.
+    Returns the number of failed URLs.
+    """
     if not os.path.exists(file_path):
         print(f"ERRORE: File {file_path} non trovato")
-        return
+        return 0
     
     with open(file_path, 'r') as file:
-        links = [line.strip() for line in file if line.strip()]
-    
-    print(f"Trovati {len(links)} link da processare")
-    for i, url in enumerate(links, 1):
-        print(f"\nProcesso link {i}/{len(links)}")
-        download_and_convert(url)
+        links = list(dict.fromkeys(line.strip() for line in file if line.strip()))
+
+    state = DownloadState(state_path or os.path.join(os.path.dirname(file_path), STATE_FILE))
+    pending = [url for url in links if not state.is_done(url)]
+    print(f"Trovati {len(links)} link, {len(links) - len(pending)} già scaricati, "
+          f"{len(pending)} da processare con {workers} download in parallelo")
+    os.makedirs(output_dir, exist_ok=True)
+    if skip_duplicates and fingerprints is None:
+        fingerprints = get_fingerprint_index()
+
+    def download(url):
+        try:
+            final_path = _download(url, output_dir, downloaders.get())
+        except Exception as e:
+            state.mark(url, 'failed', error=str(e))
+            return url, None, e, None
+        original = None
+        if skip_duplicates:
+            try:
+                original = fingerprints.check(final_path)
+            except Exception as e:
+                print(f"ATTENZIONE: impronta audio di {os.path.basename(final_path)} non calcolata: {e}")
+        if original is not None and os.path.abspath(original) != os.path.abspath(final_path):
+            os.remove(final_path)
+            state.mark(url, 'duplicate', duplicate_of=os.path.basename(original))
+            return url, final_path, None, original
+        state.mark(url, 'done', file=os.path.basename(final_path))
+        return url, final_path, None, None
+
+    failed = duplicates = 0
+    with DownloaderPool(ydl_options(output_dir, stt_format), downloader_factory) as downloaders, \
+            ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(download, url) for url in pending]
+        for i, future in enumerate(as_completed(futures), 1):
+            url, final_path, error, original = future.result()
+            if error is not None:
+                failed += 1
+                print(f"[{i}/{len(pending)}] ERRORE con {url}: {error}")
+            elif original is not None:
+                duplicates += 1
+                print(f"[{i}/{len(pending)}] DUPLICATO: {os.path.basename(final_path)} "
+                      f"è già presente come {os.path.basename(original)}, eliminato")
+            else:
+                print(f"[{i}/{len(pending)}] SCARICATO: {os.path.basename(final_path)}")
     
     # Pulizia finale per sicurezza
-    audio_dir = os.path.join(os.path.dirname(file_path), 'audio')
-    rename_all_wav_files(audio_dir)
+    rename_all_wav_files(output_dir)
+    print(f"Download completati: {len(pending) - failed - duplicates}, duplicati: {duplicates}, errori: {failed}")
+    return failed
 
 if __name__ == "__main__":
-    process_links_from_file()
\ No newline at end of file
+    process_links_from_file()
@@ -1,56 +1,194 @@
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-import time
-
-options = Options()
-options.add_argument("--headless=new")  # puoi attivarlo quando tutto funziona
-options.add_argument("--window-size=1920,1080")
-options.add_argument("--disable-blink-features=AutomationControlled")
-options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36")
-
-driver = webdriver.Chrome(options=options)
-
-try:
-    driver.get("https://www.youtube.com/@NovaLectio/videos")
-    
-    wait = WebDriverWait(driver, 10)
-    
-    # Clicca sul bottone (es. accetta cookie) se presente
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import httpx
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Point at a local fixture server to run without YouTube
+YOUTUBE_BASE_URL = os.environ.get("YOUTUBE_BASE_URL", "https://www.youtube.com").rstrip('/')
+CHANNELS = ['@NovaLectio']
+LINKS_FILE = 'ai_learning/links.txt'
+# Safety stop for a channel whose known videos are never reached
+MAX_PAGES = 200
+USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+              "(KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36")
+# Skips the cookie consent page instead of clicking through it
+CONSENT_COOKIES = {'SOCS': 'CAI'}
+
+_VIDEO_ID = re.compile(r'[?&]v=([\w-]{11})')
+_INITIAL_DATA = re.compile(r'(?:var ytInitialData|window\["ytInitialData"\])\s*=\s*')
+_YTCFG = re.compile(r'ytcfg\.set\(\s*(?=\{)')
+
+def known_video_ids(links_file: str) -> Set[str]:
+    """Video IDs already in `links_file`, whatever extra parameters their links carry."""
+    if not os.path.exists(links_file):
+        return set()
+    with open(links_file, 'r', encoding='utf-8') as f:
+        return {match.group(1) for line in f if (match := _VIDEO_ID.search(line))}
+
+def _json_after(html: str, pattern: re.Pattern) -> Iterator[Dict]:
+    decoder = json.JSONDecoder()
+    for match in pattern.finditer(html):
+        try:
+            yield decoder.raw_decode(html, match.end())[0]
+        except json.JSONDecodeError:
+            continue
+
+def parse_channel_page(html: str) -> Tuple[Dict, Dict]:
+    """`ytInitialData` and the merged `ytcfg` settings embedded in a channel page."""
+    data = next(_json_after(html, _INITIAL_DATA), None)
+    if data is None:
+        raise ValueError("ytInitialData not found in the channel page")
+    config = {}
+    for settings in _json_after(html, _YTCFG):
+        config.update(settings)
+    return data, config
+
+def selected_tab(data: Dict) -> Dict:
+    """Content of the selected tab (Videos), so header and other tabs are not walked."""
+    tabs = data.get('contents', {}).get('twoColumnBrowseResultsRenderer', {}).get('tabs', [])
+    for tab in tabs:
+        renderer = tab.get('tabRenderer', {})
+        if renderer.get('selected'):
+            return renderer.get('content', {})
+    return data
+
+def iter_page_items(node) -> Iterator[Tuple[str, str]]:
+    """Yield `('video', video_id)` and `('continuation', token)` in page order.
+
+    Knows the classic `videoRenderer` grid items and the newer
+    `lockupViewModel` ones.
+    """
+    if isinstance(node, dict):
+        renderer = node.get('videoRenderer') or node.get('gridVideoRenderer')
+        if renderer and 'videoId' in renderer:
+            yield 'video', renderer['videoId']
+            return
+        lockup = node.get('lockupViewModel')
+        if lockup and 'contentId' in lockup:
+            if lockup.get('contentType', 'LOCKUP_CONTENT_TYPE_VIDEO') == 'LOCKUP_CONTENT_TYPE_VIDEO':
+                yield 'video', lockup['contentId']
+            return
+        command = node.get('continuationCommand')
+        if command and 'token' in command:
+            yield 'continuation', command['token']
+            return
+        for value in node.values():
+            yield from iter_page_items(value)
+    elif isinstance(node, list):
+        for item in node:
+            yield from iter_page_items(item)
+
+def channel_videos_url(channel: str, base_url: str = YOUTUBE_BASE_URL) -> str:
+    """`@name`, `channel/UC...` or a full channel URL, as the URL of its Videos tab."""
+    if channel.startswith(('http://', 'https://')):
+        channel = re.sub(r'^https?://[^/]+/', '', channel)
+    channel = channel.strip('/')
+    if channel.endswith('/videos'):
+        channel = channel[:-len('/videos')]
+    return f"{base_url}/{channel}/videos"
+
+async def new_channel_videos(client: httpx.AsyncClient, channel: str, known: Set[str],
+                             base_url: str = YOUTUBE_BASE_URL, max_pages: int = MAX_PAGES) -> List[str]:
+    """IDs of the channel's videos newer than the newest known one, newest first.
+
+    The Videos tab lists the newest uploads first. The walk follows the
+    continuation pages and stops at the first video that is already known,
+    so a refresh usually costs a single request.
+    """
+    response = await client.get(channel_videos_url(channel, base_url))
+    response.raise_for_status()
+    data, config = parse_channel_page(response.text)
+    page = selected_tab(data)
+    found, seen = [], set()
+    for page_num in range(1, max_pages + 1):
+        token = None
+        for kind, value in iter_page_items(page):
+            if kind == 'continuation':
+                token = value
+            elif value in known:
+                logger.info(f"{channel}: reached a known video on page {page_num}")
+                return found
+            elif value not in seen:
+                seen.add(value)
+                found.append(value)
+        if token is None:
+            return found
+        response = await client.post(
+            f"{base_url}/youtubei/v1/browse",
+            params={'key': config.get('INNERTUBE_API_KEY', ''), 'prettyPrint': 'false'},
+            json={'context': config.get('INNERTUBE_CONTEXT', {}), 'continuation': token}
+        )
+        response.raise_for_status()
+        page = response.json().get('onResponseReceivedActions', [])
+    logger.warning(f"{channel}: stopped after {max_pages} pages without reaching a known video")
+    return found
+
+async def update_links(channels: List[str] = CHANNELS, links_file: str = LINKS_FILE,
+                       base_url: str = YOUTUBE_BASE_URL, max_pages: int = MAX_PAGES,
+                       client: Optional[httpx.AsyncClient] = None) -> List[str]:
+    """Append the new videos of every channel to `links_file`, oldest first; returns the new links.
+
+    Channels are walked at the same time over one pooled HTTP client. A
+    channel that fails is reported and skipped, the others are still added.
+    """
+    known = known_video_ids(links_file)
+    own_client = client is None
+    client = client or httpx.AsyncClient(
+        headers={'User-Agent': USER_AGENT, 'Accept-Language': 'it-IT,it;q=0.9'},
+        cookies=CONSENT_COOKIES, follow_redirects=True, timeout=30.0,
+        limits=httpx.Limits(max_connections=max(2, len(channels)))
+    )
     try:
-        cookie_button = wait.until(EC.element_to_be_clickable((
-            By.XPATH,
-            '/html/body/c-wiz/div/div/div/div[2]/div[1]/div[3]/div[1]/form[2]/div/div/button/span'
-        )))
-        cookie_button.click()
-        print("✔ Bottone cliccato (es. cookie)")
-        time.sleep(2)  # aspetta il completamento dell'animazione/modal
-    except:
-        print("ℹ Nessun bottone da cliccare (già accettato o layout diverso)")
-
-    time.sleep(5)  # aspetta caricamento video
-
-    # Scroll per caricare più contenuti
-    last_height = driver.execute_script("return document.documentElement.scrollHeight")
-    for _ in range(10):
-        driver.execute_script("window.scrollTo(0, document.documentElement.scrollHeight);")
-        time.sleep(2)
-        new_height = driver.execute_script("return document.documentElement.scrollHeight")
-        if new_height == last_height:
-            break
-        last_height = new_height
-
-    # Trova tutti i link dei video
-    video_links = driver.find_elements(By.CSS_SELECTOR, 'a[href^="/watch?v="]')
-    unique_links = set(link.get_attribute("href") for link in video_links if link.get_attribute("href"))
-
-    print(f"Trovati {len(unique_links)} video:\n")
-    with open("ai_learning/links.txt", "w", encoding="utf-8") as f:
-        for link in unique_links:
-            print(link)
-            f.write(link + "\n")
-
-finally:
-    driver.quit()
\ No newline at end of file
+        results = await asyncio.gather(
+            *(new_channel_videos(client, channel, known, base_url, max_pages) for channel in channels),
+            return_exceptions=True
+        )
+    finally:
+        if own_client:
+            await client.aclose()
+
+    new_links = []
+    for channel, result in zip(channels, results):
+        if isinstance(result, BaseException):
+            print(f"ERRORE con {channel}: {result}")
+            continue
+        print(f"{channel}: {len(result)} nuovi video")
+        for video_id in reversed(result):
+            if video_id not in known:
+                known.add(video_id)
+                new_links.append(f"{base_url}/watch?v={video_id}")
+
+    if new_links:
+        os.makedirs(os.path.dirname(links_file) or '.', exist_ok=True)
+        needs_newline = False
+        if os.path.exists(links_file) and os.path.getsize(links_file):
+            with open(links_file, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b'\n'
+        with open(links_file, 'a', encoding='utf-8') as f:
+            if needs_newline:
+                f.write("\n")
+            for link in new_links:
+                print(link)
+                f.write(link + "\n")
+    return new_links
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Add the new videos of YouTube channels to the links file")
+    parser.add_argument('channels', nargs='*', default=CHANNELS, help="e.g. @NovaLectio")
+    parser.add_argument('--links-file', default=LINKS_FILE)
+    parser.add_argument('--max-pages', type=int, default=MAX_PAGES)
+    args = parser.parse_args()
+    new_links = asyncio.run(update_links(args.channels, args.links_file, max_pages=args.max_pages))
+    print(f"Aggiunti {len(new_links)} link a {args.links_file}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Channel link enumeration against local fixtures: full walk, refresh and incremental update.
+
+Usage: python benchmarks/bench_channel_links.py [--channels 3] [--videos 200] [--latency 0.2] [--fixtures DIR]
+
+Fixtures are laid out as saved pages: `<dir>/<channel>/videos.html` (the
+Videos tab, with ytInitialData and ytcfg) and `<dir>/browse/<token>.json`
+(one continuation response each). They are generated in the shape of
+YouTube's pages, mixing videoRenderer and lockupViewModel items, with a
+channel header and an unselected tab that must be ignored. --fixtures
+serves a directory of real saved pages in the same layout instead and
+only reports what was found. The server waits `latency` seconds per request.
+Checks: a first run appends every video oldest first; a refresh with
+nothing new costs one request per channel; after new uploads only those
+are appended, in publish order.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'ai_learning'))
+
+from youtube_video_to_links import known_video_ids, update_links
+
+PAGE_SIZE = 30
+API_KEY = 'fixture-key'
+
+def video_id(channel: str, n: int) -> str:
+    return hashlib.sha1(f"{channel}/{n}".encode()).hexdigest()[:11]
+
+def token_file(fixtures: str, token: str) -> str:
+    return os.path.join(fixtures, 'browse', hashlib.sha1(token.encode()).hexdigest() + '.json')
+
+def grid_items(channel: str, numbers: list, next_token) -> list:
+    items = []
+    for n in numbers:
+        if n % 2:
+            content = {'videoRenderer': {'videoId': video_id(channel, n), 'title': {'runs': [{'text': f'Lezione {n}'}]}}}
+        else:
+            content = {'lockupViewModel': {'contentId': video_id(channel, n),
+                                           'contentType': 'LOCKUP_CONTENT_TYPE_VIDEO'}}
+        items.append({'richItemRenderer': {'content': content}})
+    if next_token:
+        items.append({'continuationItemRenderer': {'continuationEndpoint': {
+            'continuationCommand': {'token': next_token, 'request': 'CONTINUATION_REQUEST_TYPE_BROWSE'}}}})
+    return items
+
+def write_fixtures(fixtures: str, channel: str, uploads: int) -> None:
+    """Videos tab of a channel with `uploads` videos, numbered in upload order and listed newest first."""
+    numbers = list(range(uploads, 0, -1))
+    pages = [numbers[i:i + PAGE_SIZE] for i in range(0, len(numbers), PAGE_SIZE)] or [[]]
+    tokens = [f"{channel}:{uploads}:{i}" for i in range(1, len(pages))] + [None]
+    os.makedirs(os.path.join(fixtures, channel), exist_ok=True)
+    os.makedirs(os.path.join(fixtures, 'browse'), exist_ok=True)
+    data = {
+        'header': {'pageHeaderRenderer': {'trailer': {'videoRenderer': {'videoId': 'TRAILER0000'}}}},
+        'contents': {'twoColumnBrowseResultsRenderer': {'tabs': [
+            {'tabRenderer': {'title': 'Home', 'selected': False, 'content': {
+                'videoRenderer': {'videoId': 'HOMETAB0000'}}}},
+            {'tabRenderer': {'title': 'Video', 'selected': True, 'content': {
+                'richGridRenderer': {'contents': grid_items(channel, pages[0], tokens[0])}}}},
+        ]}},
+    }
+    config = {'INNERTUBE_API_KEY': API_KEY, 'INNERTUBE_CONTEXT': {'client': {'clientName': 'WEB'}}}
+    with open(os.path.join(fixtures, channel, 'videos.html'), 'w', encoding='utf-8') as f:
+        f.write(f'<html><head><script>ytcfg.set({{"HL": "it"}});</script></head><body>'
+                f'<script>var ytInitialData = {json.dumps(data)};</script>'
+                f'<script>ytcfg.set({json.dumps(config)});</script></body></html>')
+    for i, page in enumerate(pages[1:], 1):
+        response = {'onResponseReceivedActions': [{'appendContinuationItemsAction': {
+            'continuationItems': grid_items(channel, page, tokens[i])}}]}
+        with open(token_file(fixtures, tokens[i - 1]), 'w', encoding='utf-8') as f:
+            json.dump(response, f)
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+    requests = 0
+    lock = threading.Lock()
+    # Saved pages carry YouTube's real key, generated ones API_KEY
+    check_key = True
+
+    def __init__(self, *args, fixtures, **kwargs):
+        self.fixtures = fixtures
+        super().__init__(*args, **kwargs)
+
+    def serve_file(self, path, content_type):
+        with FixtureHandler.lock:
+            FixtureHandler.requests += 1
+        time.sleep(self.latency)
+        if not os.path.isfile(path):
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        with open(path, 'rb') as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        channel = self.path.split('?')[0].strip('/').rsplit('/videos', 1)[0]
+        self.serve_file(os.path.join(self.fixtures, channel, 'videos.html'), 'text/html; charset=utf-8')
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)))
+        if self.check_key and f'key={API_KEY}' not in self.path:
+            self.send_response(403)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.serve_file(token_file(self.fixtures, body['continuation']), 'application/json')
+
+    def log_message(self, *args):
+        pass
+
+def run(channels, links_file, base_url):
+    FixtureHandler.requests = 0
+    start = time.perf_counter()
+    new_links = asyncio.run(update_links(channels, links_file, base_url))
+    return new_links, FixtureHandler.requests, time.perf_counter() - start
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--channels', type=int, default=3)
+    parser.add_argument('--videos', type=int, default=200, help='uploads per channel')
+    parser.add_argument('--latency', type=float, default=0.2, help='server seconds per request')
+    parser.add_argument('--fixtures', help='directory of saved pages to serve instead of generated ones')
+    args = parser.parse_args()
+
+    FixtureHandler.latency = args.latency
+    with tempfile.TemporaryDirectory() as tmp:
+        fixtures = args.fixtures or os.path.join(tmp, 'fixtures')
+        FixtureHandler.check_key = not args.fixtures
+        server = ThreadingHTTPServer(('127.0.0.1', 0), partial(FixtureHandler, fixtures=fixtures))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        links_file = os.path.join(tmp, 'links.txt')
+
+        if args.fixtures:
+            channels = sorted(name for name in os.listdir(fixtures) if name.startswith('@'))
+            new_links, requests, elapsed = run(channels, links_file, base_url)
+            print(f"{len(channels)} saved channels: {len(new_links)} links, {requests} requests, {elapsed:.2f}s")
+            return
+
+        channels = [f'@canale{c}' for c in range(args.channels)]
+        for channel in channels:
+            write_fixtures(fixtures, channel, args.videos)
+        pages = -(-args.videos // PAGE_SIZE)
+
+        new_links, requests, elapsed = run(channels, links_file, base_url)
+        expected = [video_id(channel, n) for channel in channels for n in range(1, args.videos + 1)]
+        with open(links_file, encoding='utf-8') as f:
+            written = [line.split('v=')[1].strip() for line in f]
+        assert written == expected, "first run must list every video once, oldest first"
+        assert requests == len(channels) * pages, requests
+        print(f"First run: {len(new_links)} links from {len(channels)} channels, {requests} requests, "
+              f"{elapsed:.2f}s ({len(channels) * pages * args.latency:.1f}s if fetched one by one)")
+
+        new_links, requests, elapsed = run(channels, links_file, base_url)
+        assert new_links == [] and requests == len(channels), (len(new_links), requests)
+        print(f"Refresh, nothing new: {requests} requests, {elapsed:.2f}s")
+
+        write_fixtures(fixtures, channels[0], args.videos + 3)
+        new_links, requests, elapsed = run(channels, links_file, base_url)
+        assert [link.split('v=')[1] for link in new_links] == \
+            [video_id(channels[0], n) for n in range(args.videos + 1, args.videos + 4)], new_links
+        assert requests == len(channels), requests
+        assert len(known_video_ids(links_file)) == len(expected) + 3
+        print(f"3 new uploads: {len(new_links)} links appended in publish order, {requests} requests, {elapsed:.2f}s")
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
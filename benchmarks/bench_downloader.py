@@ -0,0 +1,167 @@
+"""Sequential against parallel downloads of a links file, served by a local media server.
+
+Usage: python benchmarks/bench_downloader.py [--videos 24] [--seconds 20] [--workers 4] [--latency 0.3] [--real]
+
+The server hands out synthetic WAVs (see synthetic_audio) over HTTP/1.1
+keep-alive, after `latency` seconds per request to stand in for YouTube's
+extraction round trips. By default a fake extractor fetches them over one
+persistent connection per downloader and sleeps `convert` seconds for the
+FFmpeg step; --real uses yt-dlp itself (generic extractor, needs yt-dlp
+and ffmpeg). Videos come in pairs with the same title. The run checks
+that every video lands once in a file of its own, that each worker opened
+one downloader, and that a second run skips every URL.
+"""
+import argparse
+import hashlib
+import http.client
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+sys.path.insert(0, os.path.join(ROOT, 'ai_learning'))
+
+from synthetic_audio import write_lecture_wav
+from audio_fingerprint import FingerprintIndex
+from wav_audio_video_download import process_links_from_file, youtube_dl_factory
+
+class MediaHandler(SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+    connections = 0
+    requests = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with MediaHandler.lock:
+            MediaHandler.connections += 1
+
+    def do_GET(self):
+        with MediaHandler.lock:
+            MediaHandler.requests += 1
+        time.sleep(self.latency)
+        super().do_GET()
+
+    def log_message(self, *args):
+        pass
+
+class FakeYoutubeDL:
+    """Just enough of yt_dlp.YoutubeDL for process_links_from_file, over one kept-alive connection."""
+
+    convert_seconds = 0.0
+
+    def __init__(self, options):
+        self.options = options
+        self._connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if self._connection is not None:
+            self._connection.close()
+
+    def extract_info(self, url, download=True):
+        parsed = urllib.parse.urlsplit(url)
+        if self._connection is None:
+            self._connection = http.client.HTTPConnection(parsed.hostname, parsed.port)
+        self._connection.request('GET', parsed.path)
+        response = self._connection.getresponse()
+        body = response.read()
+        if response.status != 200:
+            raise RuntimeError(f"HTTP {response.status}")
+        stem = os.path.splitext(os.path.basename(parsed.path))[0]
+        # Two videos per title, as a series re-uploaded under the same name would have
+        info = {'id': stem, 'title': f"Lezione {int(stem) // 2} – Storia", 'ext': 'webm'}
+        with open(self.prepare_filename(info), 'wb') as f:
+            f.write(body)
+        # The FFmpeg step: a separate process in yt-dlp, so it overlaps across threads like a sleep
+        time.sleep(self.convert_seconds)
+        os.replace(self.prepare_filename(info), os.path.splitext(self.prepare_filename(info))[0] + '.wav')
+        return info
+
+    def prepare_filename(self, info):
+        return self.options['outtmpl'] % info
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def run(links_file, output_dir, workers, factory):
+    state_path = os.path.join(os.path.dirname(output_dir), 'download_state.json')
+    fingerprints = FingerprintIndex(os.path.join(os.path.dirname(output_dir), 'fingerprints.sqlite3'))
+    start = time.perf_counter()
+    failed = process_links_from_file(links_file, output_dir, workers, factory, state_path,
+                                     fingerprints=fingerprints)
+    fingerprints.close()
+    return time.perf_counter() - start, failed
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--videos', type=int, default=24)
+    parser.add_argument('--seconds', type=float, default=20, help='length of each video')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.3, help='server seconds per request')
+    parser.add_argument('--convert', type=float, default=0.5, help='fake conversion seconds per video')
+    parser.add_argument('--real', action='store_true', help='download with yt-dlp instead of the fake extractor')
+    args = parser.parse_args()
+
+    MediaHandler.latency = args.latency
+    FakeYoutubeDL.convert_seconds = args.convert
+    factory = youtube_dl_factory if args.real else FakeYoutubeDL
+    created = []
+
+    def counting_factory(options):
+        created.append(threading.get_ident())
+        return factory(options)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        media_dir = os.path.join(tmp, 'media')
+        os.makedirs(media_dir)
+        for n in range(args.videos):
+            write_lecture_wav(os.path.join(media_dir, f'{n:03d}.wav'), args.seconds, 16000, 1, seed=n)
+        server = ThreadingHTTPServer(('127.0.0.1', 0), partial(MediaHandler, directory=media_dir))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        links_file = os.path.join(tmp, 'links.txt')
+        with open(links_file, 'w') as f:
+            for n in range(args.videos):
+                f.write(f"http://127.0.0.1:{server.server_address[1]}/{n:03d}.wav\n")
+
+        results = {}
+        for workers in (1, args.workers):
+            run_dir = os.path.join(tmp, f'workers_{workers}')
+            output_dir = os.path.join(run_dir, 'audio')
+            MediaHandler.connections = MediaHandler.requests = 0
+            created.clear()
+            elapsed, failed = run(links_file, output_dir, workers, counting_factory)
+            wavs = [name for name in os.listdir(output_dir) if name.endswith('.wav')]
+            assert failed == 0 and len(wavs) == args.videos, (failed, len(wavs))
+            if not args.real:
+                # Each file must hold its own video, not the other half of its title pair
+                served = sorted(file_digest(os.path.join(media_dir, name)) for name in os.listdir(media_dir))
+                landed = sorted(file_digest(os.path.join(output_dir, name)) for name in wavs)
+                assert served == landed, "videos with the same title overwrote each other"
+            assert len(created) <= workers and len(set(created)) == len(created), created
+            results[workers] = elapsed
+            print(f"{workers} worker(s): {elapsed:.1f}s, {len(created)} downloaders, "
+                  f"{MediaHandler.requests} requests over {MediaHandler.connections} connections")
+
+            shutil.rmtree(output_dir)
+            MediaHandler.requests = 0
+            elapsed, failed = run(links_file, output_dir, workers, counting_factory)
+            assert MediaHandler.requests == 0 and not os.listdir(output_dir), "rerun downloaded again"
+            print(f"  rerun: {elapsed:.2f}s, every URL skipped")
+        server.shutdown()
+
+    print(f"\nSpeedup with {args.workers} workers: {results[1] / results[args.workers]:.1f}x")
+
+if __name__ == '__main__':
+    main()
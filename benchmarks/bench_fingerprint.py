@@ -0,0 +1,109 @@
+"""Duplicate detection of the audio fingerprint index on synthetic lectures and their copies.
+
+Usage: python benchmarks/bench_fingerprint.py [--lectures 6] [--minutes 10]
+
+Voiced lectures (see synthetic_audio, one seed each) at 44.1 kHz stereo
+are indexed first. Then come, each of which must be flagged as a copy of
+its source: a renamed byte copy; a 16 kHz mono conversion; a cut that
+starts 37.3 s in, ends 20 s early, is 30% quieter and has hiss added. New
+lectures must stay unmatched. A second pass over the directory, as
+`get_audio_files` makes on every run, must answer from the index alone.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+sys.path.insert(0, os.path.join(ROOT, 'ai_learning'))
+
+from audio_fingerprint import FingerprintIndex
+from bench_stt_format import convert_to_stt_format
+from synthetic_audio import write_lecture_wav
+
+def write_cut(src: str, dst: str, start: float, end_trim: float, gain: float, hiss: float) -> None:
+    """Part of `src` from `start` s to `end_trim` s before its end, scaled by `gain`, with white noise added."""
+    with wave.open(src, 'rb') as wf:
+        rate, channels = wf.getframerate(), wf.getnchannels()
+        samples = np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16).reshape(-1, channels)
+    cut = samples[int(start * rate):len(samples) - int(end_trim * rate)].astype(np.float32) * gain
+    cut += np.random.default_rng(1).standard_normal(cut.shape, dtype=np.float32) * hiss * 32767
+    with wave.open(dst, 'wb') as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes(np.clip(cut, -32768, 32767).astype(np.int16).tobytes())
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lectures', type=int, default=6)
+    parser.add_argument('--minutes', type=float, default=10, help='length of each lecture')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        audio_dir = os.path.join(tmp, 'audio')
+        os.makedirs(audio_dir)
+        index = FingerprintIndex(os.path.join(tmp, 'fingerprints.sqlite3'))
+        seconds = args.minutes * 60
+
+        originals = []
+        for n in range(args.lectures):
+            path = os.path.join(audio_dir, f'lezione_{n:02d}.wav')
+            write_lecture_wav(path, seconds, 44100, 2, seed=n, voiced=True)
+            originals.append(path)
+        start = time.perf_counter()
+        for path in originals:
+            assert index.check(path) is None, f"{path} matched before any copy existed"
+        elapsed = time.perf_counter() - start
+        audio_minutes = args.lectures * args.minutes
+        print(f"Indexed {args.lectures} lectures ({audio_minutes:.0f} min at 44.1 kHz stereo) in {elapsed:.1f}s, "
+              f"{elapsed / audio_minutes * 60:.1f}s per audio hour")
+
+        copies = []
+        for n, source in enumerate(originals):
+            kind = ('renamed copy', 'resampled to 16 kHz mono', 'trimmed, quieter, hiss')[n % 3]
+            path = os.path.join(audio_dir, f'copia_{n:02d}.wav')
+            if n % 3 == 0:
+                shutil.copyfile(source, path)
+            elif n % 3 == 1:
+                convert_to_stt_format(source, path)
+            else:
+                write_cut(source, path, 37.3, 20, 0.7, 0.003)
+            copies.append((path, source, kind))
+        fresh = []
+        for n in range(args.lectures, args.lectures + 3):
+            path = os.path.join(audio_dir, f'nuova_{n:02d}.wav')
+            write_lecture_wav(path, seconds, 16000, 1, seed=n, voiced=True)
+            fresh.append(path)
+
+        for path, source, kind in copies:
+            start = time.perf_counter()
+            original = index.check(path)
+            elapsed = time.perf_counter() - start
+            assert original == os.path.abspath(source), (kind, path, original)
+            print(f"  {os.path.basename(path)} ({kind}): duplicate of {os.path.basename(original)}, {elapsed:.2f}s")
+        for path in fresh:
+            assert index.check(path) is None, f"new lecture {path} flagged as a duplicate"
+        print(f"{len(copies)} copies found, {len(fresh)} new lectures left alone")
+
+        files = sorted(os.path.join(audio_dir, name) for name in os.listdir(audio_dir))
+        start = time.perf_counter()
+        results = [index.check(path) for path in files]
+        elapsed = time.perf_counter() - start
+        assert sum(result is not None for result in results) == len(copies)
+        index.close()
+        size_kb = os.path.getsize(os.path.join(tmp, 'fingerprints.sqlite3')) / 1024
+        indexed_hours = (len(originals) + len(fresh)) * args.minutes / 60
+        print(f"Rescan of {len(files)} known files: {elapsed * 1000:.1f} ms "
+              f"({elapsed * 1000 / len(files):.2f} ms per file)")
+        print(f"Index: {size_kb:.0f} KB for {indexed_hours:.1f} h of lectures "
+              f"({size_kb / indexed_hours:.0f} KB per hour)")
+
+if __name__ == '__main__':
+    main()
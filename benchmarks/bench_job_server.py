@@ -0,0 +1,188 @@
+"""Job server on localhost with fake STT and LLM backends: priorities, streaming, duplicates, warm reuse.
+
+Usage: python benchmarks/bench_job_server.py [--lectures 4] [--seconds 120] [--stt-latency 0.05]
+
+The server runs in a background thread with one job at a time, a fake
+STT pool and FakeAsyncClient, on temporary upload and run directories.
+One lecture is uploaded and starts at once. While it runs, three more
+are queued at priority 0, 5 and 0, with a copy of the first lecture and a
+job that is cancelled. Checks:
+- jobs start in priority order;
+- every chunk transcript and summary token reaches the event stream before 'end';
+- a reconnect with Last-Event-ID gets only the missed events, without the
+  token events an ended job no longer keeps;
+- the copy is answered with the first lecture's summary without new STT work;
+- finished lectures can be searched through `GET /search`;
+- only the newest finished jobs are kept (`keep_finished=3` here);
+- bad requests get 4xx answers and a non-loopback host is refused.
+It also reports what a one-shot run pays per file (imports, pool start)
+next to what the server pays once.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+sys.path.insert(0, os.path.join(ROOT, 'ai_learning'))
+
+from synthetic_audio import write_lecture_wav
+
+def start_server(server):
+    """Run `server` on its own event loop thread; returns a function that stops it."""
+    ready = threading.Event()
+    holder = {}
+
+    def run():
+        async def main():
+            holder['loop'] = asyncio.get_running_loop()
+            holder['stop'] = asyncio.Event()
+            async with server:
+                ready.set()
+                await holder['stop'].wait()
+        asyncio.run(main())
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    ready.wait()
+
+    def stop():
+        holder['loop'].call_soon_threadsafe(holder['stop'].set)
+        thread.join()
+    return stop
+
+def import_seconds() -> float:
+    """Wall time of importing the pipeline in a fresh interpreter, as every one-shot run does."""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'import ai_learning'], cwd=os.path.join(ROOT, 'ai_learning'),
+                   check=True, capture_output=True)
+    return time.perf_counter() - start
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lectures', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=120, help='length of each lecture')
+    parser.add_argument('--stt-latency', type=float, default=0.05)
+    args = parser.parse_args()
+    if args.lectures < 4:
+        # The first four lectures each play a part: running, queued twice, cancelled
+        parser.error("--lectures must be at least 4")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update(TRANSCRIPT_CACHE_DIR=os.path.join(tmp, 'stt_cache'), TRACE_DIR=os.path.join(tmp, 'traces'),
+                          LECTURE_INDEX_DB=os.path.join(tmp, 'lecture_index.sqlite3'))
+        from audio_fingerprint import FingerprintIndex
+        from job_server import TOKEN_EVENTS, JobServer, follow_job, is_loopback_host, submit_job
+        from ollama_client import FakeAsyncClient, OllamaClient
+        from speech_to_text import TranscriptionPool
+
+        try:
+            JobServer(host='0.0.0.0')
+            raise AssertionError("a non-loopback host was accepted")
+        except ValueError:
+            pass
+        assert is_loopback_host('localhost'), "localhost was refused as a loopback host"
+
+        sources = os.path.join(tmp, 'sources')
+        os.makedirs(sources)
+        lectures = []
+        for n in range(args.lectures):
+            path = os.path.join(sources, f'Lezione {n}.wav')
+            write_lecture_wav(path, args.seconds, 16000, 1, seed=n, voiced=True)
+            lectures.append(path)
+        copy = os.path.join(sources, 'Lezione 0 (ricaricata).wav')
+        shutil.copyfile(lectures[0], copy)
+
+        stt_pool = TranscriptionPool(processes=2, backend='fake', backend_options={'latency': args.stt_latency})
+        server = JobServer(port=0, workers=1, stt_pool=stt_pool,
+                           client=OllamaClient(client=FakeAsyncClient(tokens_per_second=2000), cache=None),
+                           upload_dir=os.path.join(tmp, 'audio'), runs_dir=os.path.join(tmp, 'runs'),
+                           fingerprints=FingerprintIndex(os.path.join(tmp, 'fingerprints.sqlite3')),
+                           keep_finished=3)
+        start = time.perf_counter()
+        stop = start_server(server)
+        print(f"Server up in {time.perf_counter() - start:.2f}s "
+              f"(STT pool {stt_pool.startup_seconds:.2f}s, paid once for every job)")
+        url = server.url
+
+        with httpx.Client(timeout=None) as http:
+            first = submit_job(lectures[0], 0, url, http)
+            submitted = time.perf_counter()
+            time.sleep(0.2)
+            queued = [submit_job(lectures[1], 0, url, http), submit_job(lectures[2], 5, url, http),
+                      submit_job(copy, 0, url, http)]
+            cancelled = submit_job(lectures[3], 0, url, http)
+            assert http.delete(f"{url}/jobs/{cancelled['id']}").json()['status'] == 'cancelled'
+            assert http.delete(f"{url}/jobs/{first['id']}").status_code == 409, "running job was cancelled"
+            assert http.post(f"{url}/jobs", content=b'not a wav', headers={'Content-Type': 'audio/wav'}).status_code == 400
+            assert http.post(f"{url}/jobs", json={'url': 'file:///etc/passwd'}).status_code == 400
+            assert http.get(f"{url}/jobs/nope").status_code == 404
+
+            events, first_transcript = [], None
+            for event in follow_job(first['id'], url, client=http):
+                events.append(event)
+                if event['event'] == 'chunk_transcribed' and first_transcript is None:
+                    first_transcript = time.perf_counter() - submitted
+            kinds = [event['event'] for event in events]
+            end = events[-1]['data']
+            assert kinds[-1] == 'end' and end['status'] == 'done', end
+            transcribed = [event['data'] for event in events if event['event'] == 'chunk_transcribed']
+            summarized = {event['data']['chunk'] for event in events if event['event'] == 'chunk_summarized'}
+            assert transcribed and len(transcribed) == transcribed[0]['total_chunks'] == len(summarized)
+            for chunk in summarized:
+                tokens = ''.join(event['data']['text'] for event in events
+                                 if event['event'] == 'summary_token' and event['data']['chunk'] == chunk)
+                full = next(event['data']['text'] for event in events
+                            if event['event'] == 'chunk_summarized' and event['data']['chunk'] == chunk)
+                assert tokens == full, f"streamed tokens of chunk {chunk} differ from its summary"
+            refined = ''.join(event['data']['text'] for event in events if event['event'] == 'refine_token')
+            assert refined and refined == end['result'], "refinement tokens differ from the result"
+            print(f"Job 1: {len(transcribed)} chunks, {len(events)} events, first transcript after "
+                  f"{first_transcript:.2f}s, done in {end['finished'] - end['started']:.2f}s")
+
+            replay = list(follow_job(first['id'], url, after=len(events) - 3, client=http))
+            assert [event['id'] for event in replay] == [event['id'] for event in events[-3:]
+                                                         if event['event'] not in TOKEN_EVENTS]
+            assert replay[-1]['event'] == 'end' and replay[-2]['event'] == 'refined', replay
+            kept = server.jobs[first['id']].events
+            assert len(kept) < len(events) and not any(event['event'] in TOKEN_EVENTS for event in kept)
+            print(f"Job 1 keeps {len(kept)} of its {len(events)} events once ended")
+
+            finals = [list(follow_job(job['id'], url, client=http))[-1]['data'] for job in queued]
+            order = sorted(finals, key=lambda job: job['started'])
+            assert [job['priority'] for job in order] == [5, 0, 0], order
+            assert order[1]['name'].startswith('lezione_1'), order
+            duplicate = finals[2]
+            assert duplicate['status'] == 'duplicate' and duplicate['result'] == end['result'], duplicate
+            assert all(job['status'] == 'done' for job in finals[:2]), finals
+            print(f"Queued jobs ran by priority: {', '.join(job['name'] for job in order)}")
+            print(f"Copy answered as a duplicate in {(duplicate['finished'] - duplicate['started']) * 1000:.0f} ms")
+            word = max(transcribed[0]['text'].split(), key=len).strip('.,;:')
+            hits = http.get(f"{url}/search", params={'q': word, 'kind': 'transcript'}).json()
+            assert hits and all(hit['kind'] == 'transcript' and hit['start_seconds'] is not None for hit in hits), hits
+            assert http.get(f"{url}/search").status_code == 400
+            assert http.get(f"{url}/search", params={'q': word, 'kind': 'nope'}).status_code == 400
+            print(f"Search for '{word}': {len(hits)} passages, top in {hits[0]['lecture']} "
+                  f"chunk {hits[0]['chunk_num']}")
+            # Five jobs ended: the cancelled one and job 1 went first and are forgotten
+            assert http.get(f"{url}/jobs/{first['id']}").status_code == 404
+            assert http.get(f"{url}/jobs/{cancelled['id']}").status_code == 404
+            assert sorted(job['id'] for job in http.get(f"{url}/jobs").json()) == sorted(job['id'] for job in queued)
+            health = http.get(f"{url}/health").json()
+            assert health['queued'] == 0 and health['running'] == 0, health
+        stop()
+
+        imports = import_seconds()
+        print(f"One-shot runs would pay {imports:.2f}s of imports and {stt_pool.startup_seconds:.2f}s "
+              f"of pool start per file; the server paid them once for {len(queued) + 1} jobs")
+
+if __name__ == '__main__':
+    main()
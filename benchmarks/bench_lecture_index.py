@@ -0,0 +1,155 @@
+"""Build, update and query time of the lecture search index on a synthetic library.
+
+Usage: python benchmarks/bench_lecture_index.py [--lectures 1000] [--chunks 24] [--queries 100]
+
+Each synthetic lecture is a run directory with a transcript store and a
+refined summary. A lecture has `--chunks` chunks of 150 s, each with a
+375-word transcript and a 90-word summary, drawn from a Zipf-distributed
+Italian-like vocabulary (accented words included). Unique marker words
+are planted in random chunks. Checks:
+- a full `update` indexes every lecture and a second one reads none;
+- each marker's top hit is its lecture, chunk and audio offset;
+- accent-free queries find accented words;
+- an edited lecture, a new one and a removed one are picked up
+  incrementally, and the edited lecture's old words are gone.
+Query latency is reported per query type, with the index size.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'ai_learning'))
+
+from lecture_index import LectureIndex
+from transcript_store import TranscriptStore
+
+COMMON = ('di', 'che', 'la', 'il', 'e', 'un', 'in', 'non', 'per', 'una', 'della', 'quindi', 'questo',
+          'anche', 'come', 'storia', 'filosofia', 'concetto', 'autore', 'opera', 'teoria', 'idea')
+ACCENTED = ('città', 'perché', 'libertà', 'verità', 'società', 'però', 'così', 'già', 'più', 'virtù')
+CHUNK_SECONDS = 150.0
+
+def vocabulary(size: int, rng: np.random.Generator) -> np.ndarray:
+    syllables = ['ba', 'ce', 'di', 'fo', 'gu', 'la', 'me', 'no', 'pi', 'ro', 'sa', 'te', 'vi', 'zo', 'stra', 'gli']
+    words = list(COMMON) + list(ACCENTED)
+    seen = set(words)
+    while len(words) < size:
+        word = ''.join(rng.choice(syllables, rng.integers(2, 5)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return np.array(words, dtype=object)
+
+def write_library(runs_dir: str, lectures: int, chunks: int, rng: np.random.Generator, words: np.ndarray):
+    """Write the run directories; returns `{marker: (lecture, chunk_num)}`."""
+    weights = 1 / np.arange(1, len(words) + 1) ** 1.1
+    weights /= weights.sum()
+    markers = {}
+    for n in range(lectures):
+        run_dir = os.path.join(runs_dir, f'lezione_{n:04d}')
+        draws = iter(words[rng.choice(len(words), chunks * 465 + 200, p=weights)])
+        with TranscriptStore.open(run_dir, batch_rows=64) as store:
+            store.set_info(total_chunks=chunks)
+            for num in range(1, chunks + 1):
+                text = [next(draws) for _ in range(375)]
+                if rng.random() < 0.1:
+                    marker = f"kx{len(markers)}vq"
+                    text[rng.integers(375)] = marker
+                    markers[marker] = (f'lezione_{n:04d}', num)
+                store.add_chunk(num, ' '.join(text) + '.', (num - 1) * CHUNK_SECONDS, num * CHUNK_SECONDS,
+                                timings={'stt': 1.0})
+                store.add_summary(num, ' '.join(next(draws) for _ in range(90)) + '.')
+        with open(os.path.join(run_dir, 'refined_summary.txt'), 'w', encoding='utf-8') as f:
+            f.write(' '.join(next(draws) for _ in range(200)) + '.')
+    return markers
+
+def timed(index: LectureIndex, queries, **kwargs):
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(index.search(query, **kwargs))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.array(latencies), results
+
+def report(name: str, latencies: np.ndarray) -> None:
+    print(f"  {name:<26} p50 {np.percentile(latencies, 50):6.2f} ms  p95 {np.percentile(latencies, 95):6.2f} ms  "
+          f"max {latencies.max():6.2f} ms  ({len(latencies)} queries)")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lectures', type=int, default=1000)
+    parser.add_argument('--chunks', type=int, default=24, help='150 s chunks per lecture')
+    parser.add_argument('--queries', type=int, default=100, help='queries per type')
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        runs_dir = os.path.join(tmp, 'runs')
+        words = vocabulary(20000, rng)
+        start = time.perf_counter()
+        markers = write_library(runs_dir, args.lectures, args.chunks, rng, words)
+        hours = args.lectures * args.chunks * CHUNK_SECONDS / 3600
+        print(f"Library: {args.lectures} lectures, {hours:.0f} h of audio, {len(markers)} markers "
+              f"(written in {time.perf_counter() - start:.1f}s)")
+
+        index = LectureIndex(os.path.join(tmp, 'lecture_index.sqlite3'))
+        start = time.perf_counter()
+        counts = index.update(runs_dir)
+        index.optimize()
+        build = time.perf_counter() - start
+        assert counts == {'indexed': args.lectures, 'current': 0, 'pruned': 0}, counts
+        stats = index.stats()
+        print(f"Full index: {build:.1f}s ({build / args.lectures * 1000:.1f} ms per lecture), "
+              f"{stats['passages']} passages, {stats['bytes'] / 1024 / 1024:.0f} MB")
+        start = time.perf_counter()
+        counts = index.update(runs_dir)
+        assert counts == {'indexed': 0, 'current': args.lectures, 'pruned': 0}, counts
+        print(f"Update with nothing changed: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+        print("Query latency:")
+        marker_names = list(markers)[:args.queries]
+        latencies, results = timed(index, marker_names, limit=3)
+        for marker, hits in zip(marker_names, results):
+            lecture, chunk_num = markers[marker]
+            top = hits[0]
+            assert (top['lecture'], top['kind'], top['chunk_num']) == (lecture, 'transcript', chunk_num), (marker, top)
+            assert top['start_seconds'] == (chunk_num - 1) * CHUNK_SECONDS and f"[{marker}]" in top['snippet']
+        report("rare word (marker)", latencies)
+        report("common word", timed(index, rng.choice(COMMON[15:], args.queries))[0])
+        pairs = [f"{a} {b}" for a, b in words[rng.integers(30, 300, (args.queries, 2))]]
+        report("two mid-frequency words", timed(index, pairs)[0])
+        report("prefix", timed(index, [f"{word[:4]}*" for word in words[rng.integers(50, 5000, args.queries)]])[0])
+        report("phrase (FTS5 syntax)",
+               timed(index, [f'"{a} {b}"' for a, b in words[rng.integers(0, 200, (args.queries, 2))]], raw=True)[0])
+        report("one lecture only", timed(index, rng.choice(COMMON[15:], args.queries),
+                                         lecture=f'lezione_{args.lectures // 2:04d}')[0])
+        report("refined summaries only", timed(index, rng.choice(COMMON[15:], args.queries), kind='refined')[0])
+        latencies, results = timed(index, ['citta liberta', 'perche verita'])
+        assert '[città]' in results[0][0]['snippet'] and '[perché]' in results[1][0]['snippet'], results
+
+        # Incremental: one lecture edited, one added, one removed
+        shutil.copytree(os.path.join(runs_dir, 'lezione_0001'), os.path.join(runs_dir, 'lezione_nuova'))
+        marker, (lecture, chunk_num) = next(iter(markers.items()))
+        with TranscriptStore.open(os.path.join(runs_dir, lecture)) as store:
+            store.add_chunk(chunk_num, "trascrizione corretta con la parola nuovissima", 0.0, CHUNK_SECONDS)
+        removed = f'lezione_{args.lectures - 1:04d}'
+        shutil.rmtree(os.path.join(runs_dir, removed))
+        start = time.perf_counter()
+        counts = index.update(runs_dir, prune=True)
+        elapsed = time.perf_counter() - start
+        assert counts == {'indexed': 2, 'current': args.lectures - 2, 'pruned': 1}, counts
+        assert [hit['lecture'] for hit in index.search(marker)] in ([], ['lezione_nuova']), \
+            "edited lecture still matches its old text"
+        assert [hit['lecture'] for hit in index.search('nuovissima')] == [lecture]
+        assert not index.search('storia', lecture=removed), "removed lecture still indexed"
+        assert index.search('storia', lecture='lezione_nuova')
+        print(f"Incremental update (1 edited, 1 new, 1 removed): {elapsed * 1000:.0f} ms")
+        index.close()
+
+if __name__ == '__main__':
+    main()
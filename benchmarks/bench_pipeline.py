@@ -0,0 +1,286 @@
+"""Offline end-to-end throughput of the pipeline against local STT and Ollama stand-ins.
+
+Usage: python benchmarks/bench_pipeline.py [--scale 1] [--scenario stt ...] [--out report.json]
+                                           [--compare baseline.json] [--threshold 0.2]
+
+Synthetic lectures (see synthetic_audio) of varied length, sample rate and
+pause share go through each scenario, every one in its own subprocess and
+working directory. STT goes through GoogleBackend to the recognize_google
+stand-in and summaries to the Ollama stand-in (see fake_services); the LLM
+response cache is off and the transcript cache starts empty.
+
+- stt: python/speech_to_text.transcribe_audio_file on every file
+- main: python/main.py stages one after the other, transcribe_audio_file,
+  summarize_text and refine_final_summary
+- main_streaming: python/main.py transcribe_and_summarize then
+  refine_final_summary, the path main() takes
+- batch: ai_learning.main over all files at once
+
+The JSON report (default benchmarks/results/pipeline-<commit>.json) holds,
+per scenario, wall time, seconds of audio processed per second, peak RSS,
+p50/p95 per traced stage and the request counts seen by the stand-ins.
+With --compare, scenarios slower than the baseline by more than
+--threshold are listed and the exit status is 1.
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from fake_services import add_arguments, services_from_args
+from synthetic_audio import write_lecture_wav
+
+# name, seconds, sample rate, channels, share of pauses
+CORPUS = (
+    ('short_16k_mono', 90, 16000, 1, 0.1),
+    ('lecture_44k_stereo', 600, 44100, 2, 0.25),
+    ('pauses_48k_stereo', 300, 48000, 2, 0.5),
+    ('no_pauses_22k_mono', 120, 22050, 1, 0.0),
+)
+SCENARIOS = {
+    'stt': 'python',
+    'main': 'python',
+    'main_streaming': 'python',
+    'batch': 'ai_learning',
+}
+RESULT_PREFIX = 'BENCH_RESULT '
+
+async def scenario_stt(wav_paths):
+    from speech_to_text import transcribe_audio_file
+    for i, path in enumerate(wav_paths):
+        if not await transcribe_audio_file(path, output_dir=f"text/{i}"):
+            return False
+    return True
+
+async def scenario_main(wav_paths):
+    import main
+    from speech_to_text import transcribe_audio_file
+    from tracing import get_tracer
+    tracer = get_tracer()
+    for path in wav_paths:
+        with tracer.span('transcribe'):
+            if not await transcribe_audio_file(path):
+                return False
+        with tracer.span('summarize'):
+            await main.summarize_text("")
+        with tracer.span('refine'):
+            await main.refine_final_summary()
+        if not os.path.exists("text/refined_summary.txt"):
+            return False
+    return True
+
+async def scenario_main_streaming(wav_paths):
+    import main
+    from tracing import get_tracer
+    tracer = get_tracer()
+    for path in wav_paths:
+        with tracer.span('transcribe_summarize'):
+            if not await main.transcribe_and_summarize(path):
+                return False
+        with tracer.span('refine'):
+            await main.refine_final_summary()
+        if not os.path.exists("text/refined_summary.txt"):
+            return False
+    return True
+
+async def scenario_batch(wav_paths):
+    import ai_learning
+    os.makedirs('ai_learning/audio', exist_ok=True)
+    for path in wav_paths:
+        shutil.copy(path, 'ai_learning/audio')
+    await ai_learning.main()
+    refined = glob.glob('ai_learning/runs/*/refined_summary.txt')
+    return len(refined) == len(wav_paths)
+
+def stage_stats(trace_dir: str) -> dict:
+    """count, total, p50 and p95 seconds per stage from the JSON-lines traces."""
+    durations = {}
+    for path in glob.glob(os.path.join(trace_dir, '*.jsonl')):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                span = json.loads(line)
+                durations.setdefault(span['stage'], []).append(span['seconds'])
+    stats = {}
+    for stage, values in sorted(durations.items()):
+        values.sort()
+        stats[stage] = {
+            'count': len(values),
+            'total': round(sum(values), 3),
+            'p50': round(values[len(values) // 2], 4),
+            'p95': round(values[min(len(values) - 1, int(len(values) * 0.95))], 4),
+        }
+    return stats
+
+def run_scenario(name: str, wav_paths: list) -> None:
+    """Child side: run one scenario in the current directory and print its result line."""
+    sys.path.insert(0, os.path.join(ROOT, SCENARIOS[name]))
+    scenario = globals()[f'scenario_{name}']
+
+    async def run():
+        from ollama_client import close_client
+        from tracing import close_tracer
+        try:
+            return await scenario(wav_paths)
+        finally:
+            await close_client()
+            close_tracer()
+
+    start = time.perf_counter()
+    ok = asyncio.run(run())
+    elapsed = time.perf_counter() - start
+    peak_kb = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    print(RESULT_PREFIX + json.dumps({
+        'ok': bool(ok),
+        'wall_seconds': round(elapsed, 3),
+        'peak_rss_mb': round(peak_kb / 1024, 1),
+        'stages': stage_stats('traces'),
+    }))
+
+def child_env(services, args) -> dict:
+    env = dict(os.environ)
+    env.pop('METRICS_PORT', None)
+    env.update({
+        'OLLAMA_HOST': services.url,
+        'NO_PROXY': '127.0.0.1,localhost',
+        'LLM_CACHE': '0',
+        'TRACE_DIR': 'traces',
+        'TRANSCRIPT_CACHE_DIR': 'cache/transcripts',
+        'OLLAMA_NUM_PARALLEL': str(args.parallel),
+    })
+    if args.stt == 'google':
+        env['STT_BACKEND'] = 'google'
+        env['STT_BACKEND_OPTIONS'] = json.dumps({'endpoint': services.stt_endpoint})
+    else:
+        env['STT_BACKEND'] = 'fake'
+        env['STT_BACKEND_OPTIONS'] = json.dumps({'latency': args.stt_latency,
+                                                 'realtime_factor': args.stt_realtime_factor,
+                                                 'error_rate': args.stt_error_rate})
+    return env
+
+def git_revision() -> dict:
+    def git(*command):
+        return subprocess.run(['git', *command], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    return {'commit': git('rev-parse', 'HEAD') or None,
+            'dirty': bool(git('status', '--porcelain', '--untracked-files=no'))}
+
+def compare(report: dict, baseline: dict, threshold: float) -> list:
+    """Print wall time and throughput against `baseline`; return the scenarios that regressed."""
+    regressions = []
+    print(f"\nAgainst {(baseline.get('commit') or 'baseline')[:10]}:")
+    for key in ('config', 'corpus', 'cpus'):
+        if baseline.get(key) != report[key]:
+            print(f"Warning: {key} differs from the baseline, timings may not be comparable")
+    for name, result in report['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before or not before.get('ok'):
+            continue
+        if not result.get('ok'):
+            regressions.append(name)
+            print(f"{name:>16}: passed in the baseline, fails now  REGRESSION")
+            continue
+        ratio = result['wall_seconds'] / before['wall_seconds']
+        regressed = ratio > 1 + threshold
+        if regressed:
+            regressions.append(name)
+        print(f"{name:>16}: {before['wall_seconds']:.1f}s -> {result['wall_seconds']:.1f}s "
+              f"({ratio - 1:+.0%}), audio/s {before['audio_per_second']:.1f} -> "
+              f"{result['audio_per_second']:.1f}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplies the length of every file')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='run only these scenarios (repeatable)')
+    parser.add_argument('--stt', choices=['google', 'fake'], default='google',
+                        help='GoogleBackend against the HTTP stand-in, or the in-process FakeBackend')
+    parser.add_argument('--parallel', type=int, default=4, help='OLLAMA_NUM_PARALLEL for the pipeline')
+    parser.add_argument('--out', help='report path')
+    parser.add_argument('--compare', help='earlier report to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed slowdown before a regression')
+    parser.add_argument('--run', choices=sorted(SCENARIOS), help=argparse.SUPPRESS)
+    parser.add_argument('--wav', action='append', help=argparse.SUPPRESS)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.run:
+        run_scenario(args.run, args.wav)
+        return
+
+    revision = git_revision()
+    report = {
+        **revision,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'config': {key: value for key, value in vars(args).items()
+                   if key not in ('run', 'wav', 'out', 'compare', 'scenario')},
+        'corpus': [],
+        'scenarios': {},
+    }
+    with tempfile.TemporaryDirectory() as tmp, services_from_args(args) as services:
+        wav_paths = []
+        for seed, (name, seconds, rate, channels, silence) in enumerate(CORPUS):
+            path = os.path.join(tmp, f'{name}.wav')
+            write_lecture_wav(path, seconds * args.scale, rate, channels, silence, seed)
+            wav_paths.append(path)
+            report['corpus'].append({'name': name, 'seconds': seconds * args.scale, 'rate': rate,
+                                     'channels': channels, 'silence_ratio': silence})
+        audio_seconds = sum(item['seconds'] for item in report['corpus'])
+        print(f"Corpus: {len(wav_paths)} files, {audio_seconds / 60:.1f} min of audio")
+
+        for name in args.scenario or list(SCENARIOS):
+            workdir = os.path.join(tmp, name)
+            os.makedirs(workdir)
+            services.reset_stats()
+            command = [sys.executable, os.path.abspath(__file__), '--run', name]
+            for path in wav_paths:
+                command += ['--wav', path]
+            # python/speech_to_text asks whether to delete the source: always keep it
+            process = subprocess.run(command, cwd=workdir, env=child_env(services, args),
+                                     input='n\n' * 100, capture_output=True, text=True)
+            # The prompt of input() has no newline, so the result can share its line
+            lines = [line.split(RESULT_PREFIX, 1)[1] for line in process.stdout.splitlines()
+                     if RESULT_PREFIX in line]
+            if not lines:
+                error = (process.stderr.strip().splitlines() or ['no output'])[-1]
+                report['scenarios'][name] = {'ok': False, 'error': error}
+                print(f"{name:>16}: failed - {error}")
+                continue
+            result = json.loads(lines[-1])
+            result['audio_per_second'] = round(audio_seconds / result['wall_seconds'], 2)
+            result['services'] = dict(services.stats)
+            report['scenarios'][name] = result
+            print(f"{name:>16}: {'ok' if result['ok'] else 'FAILED'}, {result['wall_seconds']:.1f}s, "
+                  f"{result['audio_per_second']:.1f}s of audio/s, peak RSS {result['peak_rss_mb']:.0f} MB, "
+                  f"{services.stats['stt_requests']} STT and {services.stats['llm_requests']} LLM requests")
+
+    out = args.out or os.path.join(ROOT, 'benchmarks', 'results',
+                                   f"pipeline-{(revision['commit'] or 'unknown')[:10]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport: {out}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"Slower than the baseline by more than {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Per-chunk CPU time and output agreement of to_mono_16k against pydub set_frame_rate/set_channels.
+
+Usage: python benchmarks/bench_resample.py [--seconds 150] [--rate 44100] [--channels 2] [--repeat 5]
+
+Also checks that 8-, 16-, 24- and 32-bit PCM of the same signal decode
+to the same int16 samples.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'ai_learning'))
+
+from audio_dsp import pcm_to_array, resample_poly, to_mono_16k
+
+def synthetic_speechlike(seconds: float, rate: int, channels: int) -> np.ndarray:
+    """A few voice-band tones with a slow envelope and some noise, as int16 `(frames, channels)`."""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * rate)) / rate
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 0.7 * t)
+    signal = sum(np.sin(2 * np.pi * f * t) / (i + 1) for i, f in enumerate((180, 420, 950, 2300)))
+    signal = envelope * signal + 0.05 * rng.standard_normal(len(t))
+    stereo = np.stack([signal * (1 - 0.1 * c) for c in range(channels)], axis=1)
+    return (stereo / np.abs(stereo).max() * 20000).astype(np.int16)
+
+def pydub_path(samples: np.ndarray, rate: int) -> np.ndarray:
+    from pydub import AudioSegment
+    segment = AudioSegment(data=samples.tobytes(), sample_width=2, frame_rate=rate, channels=samples.shape[1])
+    return np.frombuffer(segment.set_frame_rate(16000).set_channels(1).raw_data, dtype=np.int16)
+
+def best_of(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.process_time()
+        fn()
+        timings.append(time.process_time() - start)
+    return min(timings)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=150)
+    parser.add_argument('--rate', type=int, default=44100)
+    parser.add_argument('--channels', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    samples = synthetic_speechlike(args.seconds, args.rate, args.channels)
+    reference = pydub_path(samples, args.rate)
+    ours = to_mono_16k(samples, args.rate)
+
+    # Correctness: same length (within a sample of rounding) and high SNR against the old output
+    assert abs(len(reference) - len(ours)) <= 2, (len(reference), len(ours))
+    n = min(len(reference), len(ours))
+    ref = reference[:n].astype(np.float64)
+    err = ref - ours[:n].astype(np.float64)
+    snr_db = 10 * np.log10(np.sum(ref ** 2) / max(np.sum(err ** 2), 1e-12))
+    correlation = np.corrcoef(ref, ours[:n])[0, 1]
+    assert correlation > 0.99, correlation
+
+    # Every PCM width pydub accepts decodes to the same int16 samples
+    wide = samples.astype(np.int32) << 16
+    encodings = {1: ((samples >> 8) + 128).astype(np.uint8).tobytes(), 2: samples.tobytes(),
+                 3: wide.view(np.uint8).reshape(-1, 4)[:, 1:].tobytes(), 4: wide.tobytes()}
+    for width, raw in encodings.items():
+        decoded = pcm_to_array(raw, width, args.channels)
+        expected = (samples >> 8) << 8 if width == 1 else samples
+        assert np.array_equal(decoded, expected), f"{width * 8}-bit PCM decoded wrong"
+
+    old = best_of(lambda: pydub_path(samples, args.rate), args.repeat)
+    new = best_of(lambda: to_mono_16k(samples, args.rate), args.repeat)
+    engine = 'scipy resample_poly' if resample_poly is not None else 'numpy interp'
+    print(f"Chunk: {args.seconds:.0f}s at {args.rate} Hz, {args.channels} ch; resampler: {engine}")
+    print(f"Agreement with pydub: correlation {correlation:.5f}, SNR {snr_db:.1f} dB, "
+          f"lengths {len(reference)}/{len(ours)}")
+    print(f"pydub:       {old * 1000:.1f} ms CPU per chunk")
+    print(f"to_mono_16k: {new * 1000:.1f} ms CPU per chunk ({old / max(new, 1e-9):.1f}x)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Peak memory and time of split_audio against the old whole-file AudioSegment split.
+
+Usage: python benchmarks/bench_split_audio.py [--minutes 30] [--rate 44100] [--channels 2]
+
+Each variant runs in its own subprocess so its peak RSS is measured in isolation.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'ai_learning'))
+
+def write_synthetic_wav(path: str, minutes: float, rate: int, channels: int) -> None:
+    """Pseudo-random 16-bit PCM written one second at a time."""
+    block = bytes((i * 7919) % 256 for i in range(rate * channels * 2))
+    with wave.open(path, 'wb') as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        for _ in range(int(minutes * 60)):
+            wf.writeframes(block)
+
+def legacy_split(file_path: str, chunk_length_ms: int = 150000) -> list:
+    """The pre-streaming split_audio: whole file in one AudioSegment, then sliced."""
+    from pydub import AudioSegment
+    audio = AudioSegment.from_wav(file_path)
+    return [audio[i:i + chunk_length_ms] for i in range(0, len(audio), chunk_length_ms)]
+
+def streaming_split(file_path: str) -> list:
+    """Current split_audio, plus reading every window the way a worker would."""
+    from speech_to_text import read_window, split_audio
+    windows = split_audio(file_path)
+    for window in windows:
+        read_window(window)
+    return windows
+
+def run_variant(variant: str, wav_path: str) -> None:
+    split = legacy_split if variant == 'legacy' else streaming_split
+    start = time.perf_counter()
+    chunks = split(wav_path)
+    elapsed = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({'variant': variant, 'chunks': len(chunks), 'seconds': elapsed, 'peak_rss_mb': peak_kb / 1024}))
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--minutes', type=float, default=30)
+    parser.add_argument('--rate', type=int, default=44100)
+    parser.add_argument('--channels', type=int, default=2)
+    parser.add_argument('--variant', choices=['legacy', 'streaming'], help=argparse.SUPPRESS)
+    parser.add_argument('--wav', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        run_variant(args.variant, args.wav)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        wav_path = os.path.join(tmp, 'synthetic.wav')
+        write_synthetic_wav(wav_path, args.minutes, args.rate, args.channels)
+        size_mb = os.path.getsize(wav_path) / 1024 / 1024
+        print(f"Synthetic WAV: {args.minutes} min, {args.rate} Hz, {args.channels} ch, {size_mb:.0f} MB")
+        for variant in ('legacy', 'streaming'):
+            out = subprocess.run(
+                [sys.executable, __file__, '--variant', variant, '--wav', wav_path],
+                capture_output=True, text=True, check=True
+            ).stdout.strip().splitlines()[-1]
+            result = json.loads(out)
+            print(f"{variant:>10}: {result['seconds']:.2f}s, peak RSS {result['peak_rss_mb']:.0f} MB, "
+                  f"{result['chunks']} chunks")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Disk footprint and STT-side processing time of a full-rate download against a 16 kHz mono one.
+
+Usage: python benchmarks/bench_stt_format.py [--minutes 30] [--rate 44100] [--channels 2]
+
+One synthetic lecture (see synthetic_audio) is written at the full rate
+and converted to 16 kHz mono, as DOWNLOAD_STT_FORMAT has FFmpeg do. Both
+then go through the STT side without the recognizer: the silence-aware
+split, then every chunk through process_chunk with a zero-latency
+FakeBackend and an empty transcript cache of its own. The 16 kHz mono file must skip
+resampling entirely and give the recognizer the same number of chunks.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import wave
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+sys.path.insert(0, os.path.join(ROOT, 'ai_learning'))
+
+def convert_to_stt_format(src: str, dst: str) -> None:
+    """Downmix and resample `src` to 16 kHz mono, ten seconds at a time."""
+    from audio_dsp import pcm_to_array, to_mono_16k
+    with wave.open(src, 'rb') as wf_in, wave.open(dst, 'wb') as wf_out:
+        wf_out.setnchannels(1)
+        wf_out.setsampwidth(2)
+        wf_out.setframerate(16000)
+        block = wf_in.getframerate() * 10
+        while raw := wf_in.readframes(block):
+            samples = pcm_to_array(raw, wf_in.getsampwidth(), wf_in.getnchannels())
+            wf_out.writeframes(to_mono_16k(samples, wf_in.getframerate()).tobytes())
+
+def run_stt_side(path: str, cache_dir: str) -> dict:
+    import speech_to_text
+    from transcript_cache import TranscriptCache
+    from vad import segment_on_silence
+    # The module-level cache read its directory at import; each run gets a fresh one
+    speech_to_text.transcript_cache = TranscriptCache(cache_dir)
+    start = time.perf_counter()
+    windows = segment_on_silence(path)
+    split_seconds = time.perf_counter() - start
+    stages = {}
+    for i, window in enumerate(windows, 1):
+        result = speech_to_text.process_chunk({'chunk': window, 'chunk_num': i,
+                                               'total_chunks': len(windows),
+                                               'backend': 'fake', 'backend_options': {}})
+        for stage, (_, seconds) in result['timings'].items():
+            stages[stage] = stages.get(stage, 0.0) + seconds
+    return {'chunks': len(windows), 'split': split_seconds, **stages}
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--minutes', type=float, default=30)
+    parser.add_argument('--rate', type=int, default=44100)
+    parser.add_argument('--channels', type=int, default=2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        from synthetic_audio import write_lecture_wav
+        full_rate = os.path.join(tmp, 'full_rate.wav')
+        stt_ready = os.path.join(tmp, 'stt_ready.wav')
+        write_lecture_wav(full_rate, args.minutes * 60, args.rate, args.channels)
+        convert_to_stt_format(full_rate, stt_ready)
+
+        results = {}
+        for name, path in (('full rate', full_rate), ('16 kHz mono', stt_ready)):
+            results[name] = result = run_stt_side(path, os.path.join(tmp, name, 'cache'))
+            size_mb = os.path.getsize(path) / 1024 / 1024
+            total = sum(seconds for stage, seconds in result.items() if stage != 'chunks')
+            print(f"{name:>12}: {size_mb:6.0f} MB on disk, {result['chunks']} chunks, {total:.2f}s "
+                  f"(split {result['split']:.2f}s, read {result.get('audio_read', 0):.2f}s, "
+                  f"resample {result.get('resample', 0):.2f}s)")
+
+        assert 'resample' not in results['16 kHz mono'], "16 kHz mono chunks were resampled"
+        assert results['16 kHz mono']['chunks'] == results['full rate']['chunks']
+        assert 'stt' in results['16 kHz mono'], "16 kHz mono chunks came from the transcript cache"
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""Speed, peak memory and properties of iter_chunks against the old paragraph-only split.
+
+Usage: python benchmarks/bench_text_chunker.py [--mb 20] [--max-tokens 1500] [--overlap 100] [--cases 200]
+
+Transcripts are synthetic: Google STT style (lowercase, no punctuation,
+no paragraphs) and punctuated text with paragraphs. Before timing, random
+cases check that every chunk fits the budget, that chunks are non-empty,
+that without overlap they reproduce the text exactly, that with overlap
+each chunk only repeats the end of the previous one, and that cuts land on
+sentence ends whenever the sentences fit.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'ai_learning'))
+
+from text_chunker import DEFAULT_CHARS_PER_TOKEN, iter_chunks
+
+VOCABULARY = ('allora', 'lezione', 'oggi', 'parliamo', 'della', 'filosofia', 'di', 'kant', 'critica',
+              'ragione', 'pura', 'quindi', 'il', 'concetto', 'trascendentale', 'è', 'molto', 'importante',
+              'perché', 'spiega', 'come', 'conosciamo', 'mondo', 'esperienza', 'sensibile', 'intelletto')
+
+def synthetic_transcript(n_chars: int, rng: random.Random, punctuated: bool) -> str:
+    parts = []
+    size = 0
+    while size < n_chars:
+        sentence = ' '.join(rng.choice(VOCABULARY) for _ in range(rng.randint(4, 40)))
+        if punctuated:
+            sentence = sentence.capitalize() + rng.choice('..!?')
+            sentence += '\n\n' if rng.random() < 0.1 else ' '
+        else:
+            sentence += ' '
+        parts.append(sentence)
+        size += len(sentence)
+    return ''.join(parts)
+
+def legacy_split(text: str, max_chars: int = 4000) -> list:
+    """The old split_text_into_chunks: paragraphs only."""
+    chunks, current, current_length = [], [], 0
+    for para in text.split('\n\n'):
+        if current_length + len(para) > max_chars and current:
+            chunks.append('\n\n'.join(current))
+            current, current_length = [], 0
+        current.append(para)
+        current_length += len(para) + 2
+    if current:
+        chunks.append('\n\n'.join(current))
+    return chunks
+
+def estimate(text: str) -> int:
+    return int(len(text) / DEFAULT_CHARS_PER_TOKEN) + 1
+
+def check_properties(cases: int, seed: int = 0) -> None:
+    rng = random.Random(seed)
+    for case in range(cases):
+        punctuated = rng.random() < 0.5
+        text = synthetic_transcript(rng.randint(0, 20000), rng, punctuated)
+        if rng.random() < 0.05:
+            text += 'x' * rng.randint(1, 3000)
+        max_tokens = rng.randint(8, 600)
+        overlap = rng.choice([0, 0, rng.randint(0, max_tokens - 1)])
+        chunks = list(iter_chunks(text, max_tokens, overlap))
+        context = f"case {case}: max_tokens={max_tokens} overlap={overlap} punctuated={punctuated}"
+
+        assert all(chunks), context
+        assert all(estimate(chunk) <= max_tokens for chunk in chunks), context
+        # Compared without whitespace, since a word longer than a whole chunk is cut inside
+        squeezed = ''.join(text.split())
+        pieces = [''.join(chunk.split()) for chunk in chunks]
+        if overlap == 0:
+            assert ''.join(pieces) == squeezed, context
+        else:
+            position = 0
+            for piece in pieces:
+                # Each chunk starts at or before the previous end and carries on past it
+                start = squeezed.rfind(piece, 0, position + len(piece))
+                assert start >= 0 and start + len(piece) > position, context
+                position = start + len(piece)
+            assert position == len(squeezed), context
+        longest = max((len(s) for s in text.replace('\n\n', ' ').split('. ')), default=0)
+        if punctuated and longest < max_tokens * DEFAULT_CHARS_PER_TOKEN / 2 and 'x' * 5 not in text:
+            assert all(chunk[-1] in '.!?' for chunk in chunks), context
+
+def measure(fn, text: str):
+    """Result and wall time of `fn(text)`, then its peak traced allocation in a second run."""
+    start = time.perf_counter()
+    result = fn(text)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    fn(text)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 1024 / 1024
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mb', type=float, default=20)
+    parser.add_argument('--max-tokens', type=int, default=1500)
+    parser.add_argument('--overlap', type=int, default=100)
+    parser.add_argument('--cases', type=int, default=200)
+    args = parser.parse_args()
+
+    check_properties(args.cases)
+    print(f"Properties hold on {args.cases} random cases")
+
+    rng = random.Random(1)
+    max_chars = int(args.max_tokens * DEFAULT_CHARS_PER_TOKEN)
+    for punctuated in (False, True):
+        text = synthetic_transcript(int(args.mb * 1024 * 1024), rng, punctuated)
+        style = 'punctuated' if punctuated else 'STT (no punctuation)'
+        print(f"\n{len(text) / 1024 / 1024:.0f} MB {style} transcript, budget {args.max_tokens} tokens")
+        for name, fn in (
+            ('legacy split', lambda t: legacy_split(t, max_chars)),
+            ('iter_chunks', lambda t: sum(1 for _ in iter_chunks(t, args.max_tokens))),
+            (f'iter_chunks overlap {args.overlap}', lambda t: sum(1 for _ in iter_chunks(t, args.max_tokens, args.overlap))),
+        ):
+            result, elapsed, peak = measure(fn, text)
+            if isinstance(result, list):
+                oversized = sum(1 for chunk in result if len(chunk) > max_chars)
+                result = f"{len(result)} chunks, {oversized} over budget"
+            else:
+                result = f"{result} chunks"
+            print(f"{name:>24}: {elapsed:.2f}s ({len(text) / 1024 / 1024 / elapsed:.0f} MB/s), "
+                  f"peak extra memory {peak:.1f} MB, {result}")
+
+if __name__ == '__main__':
+    main()
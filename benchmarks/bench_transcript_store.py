@@ -0,0 +1,213 @@
+"""Per-lecture transcript store against the old one-file-per-chunk layout, and resuming an old run.
+
+Usage: python benchmarks/bench_transcript_store.py [--lectures 16] [--chunks 120] [--minutes 20]
+
+Write load: `--lectures` lectures are written at once, one thread each,
+the way a batch does. Each chunk gets a transcript and then a summary.
+The old layout writes `chunk_NNN.txt` and `summary_NNN.txt`, and rewrites
+the manifest after each of them as `JobManifest.mark_chunk` did. At the
+end it writes `chunks_metadata.json` and runs the `os.listdir` cleanup.
+The store adds rows, flushing in batches. Both variants then read
+random chunks back by number.
+
+Resume: a synthetic lecture is transcribed once to learn its chunks.
+A run directory in the old layout is then built by hand, with a
+manifest holding per-chunk maps, the first half of the chunks and
+summaries for the first quarter. `process_audio_file` must take the old
+files over, transcribe only the second half and summarize only the
+chunks without a summary. The store must end with every chunk, its audio
+offsets and its summary.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+sys.path.insert(0, os.path.join(ROOT, 'ai_learning'))
+
+from synthetic_audio import write_lecture_wav
+
+def replace_json(path: str, data) -> None:
+    """Temp file + `os.replace`, as the manifest was written for every chunk."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+def legacy_lecture(work_dir: str, chunks, lock: threading.Lock) -> None:
+    manifest = {'total_chunks': len(chunks), 'chunks': {'transcribed': {}, 'summarized': {}}}
+    manifest_path = os.path.join(work_dir, 'manifest.json')
+    chunk_files = []
+    for num, (text, summary) in enumerate(chunks, 1):
+        chunk_file = os.path.join(work_dir, f"chunk_{num:03d}.txt")
+        with open(chunk_file, 'w', encoding='utf-8') as f:
+            f.write(text)
+        chunk_files.append(chunk_file)
+        with lock:
+            manifest['chunks']['transcribed'][str(num)] = chunk_file
+            replace_json(manifest_path, manifest)
+        summary_file = os.path.join(work_dir, f"summary_{num:03d}.txt")
+        with open(summary_file, 'w', encoding='utf-8') as f:
+            f.write(summary)
+        with lock:
+            manifest['chunks']['summarized'][str(num)] = summary_file
+            replace_json(manifest_path, manifest)
+    with open(os.path.join(work_dir, 'chunks_metadata.json'), 'w') as f:
+        json.dump({'total_chunks': len(chunks), 'processed_chunks': len(chunks), 'chunk_files': chunk_files}, f)
+
+def store_lecture(work_dir: str, chunks, lock: threading.Lock) -> None:
+    from transcript_store import TranscriptStore
+    with TranscriptStore.open(work_dir) as store:
+        store.set_info(total_chunks=len(chunks))
+        for num, (text, summary) in enumerate(chunks, 1):
+            store.add_chunk(num, text, (num - 1) * 150.0, num * 150.0, timings={'stt': 1.2}, cached=False)
+            store.add_summary(num, summary, 3.4)
+
+def legacy_read(work_dir: str, num: int) -> str:
+    with open(os.path.join(work_dir, f"chunk_{num:03d}.txt"), 'r', encoding='utf-8') as f:
+        return f.read()
+
+def dir_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+def write_load(tmp: str, lectures: int, chunks_per_lecture: int) -> None:
+    from transcript_store import STORE_BATCH_ROWS, TranscriptStore
+    rng = random.Random(0)
+    words = ('lezione', 'storia', 'filosofia', 'concetto', 'esempio', 'quindi', 'autore', 'teoria')
+    corpus = [[(' '.join(rng.choice(words) for _ in range(375)), ' '.join(rng.choice(words) for _ in range(90)))
+               for _ in range(chunks_per_lecture)] for _ in range(lectures)]
+    results = {}
+    for name, write in (('legacy files', legacy_lecture), ('store', store_lecture)):
+        base = os.path.join(tmp, name.replace(' ', '_'))
+        dirs = [os.path.join(base, f'lezione_{n:03d}') for n in range(lectures)]
+        for work_dir in dirs:
+            os.makedirs(work_dir)
+        threads = [threading.Thread(target=write, args=(work_dir, chunks, threading.Lock()))
+                   for work_dir, chunks in zip(dirs, corpus)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        files = sum(len(os.listdir(work_dir)) for work_dir in dirs)
+        size = dir_bytes(base)
+
+        picks = [(rng.randrange(lectures), rng.randrange(1, chunks_per_lecture + 1)) for _ in range(500)]
+        start = time.perf_counter()
+        if name == 'store':
+            stores = [TranscriptStore.open(work_dir) for work_dir in dirs]
+            texts = [stores[n].chunk(num)['text'] for n, num in picks]
+            for store in stores:
+                store.close()
+        else:
+            texts = [legacy_read(dirs[n], num) for n, num in picks]
+        read_ms = (time.perf_counter() - start) * 1000 / len(picks)
+        assert texts == [corpus[n][num - 1][0] for n, num in picks], f"{name}: wrong chunk read back"
+
+        start = time.perf_counter()
+        if name == 'legacy files':
+            # The cleanup write_final_summary ran on every lecture
+            for work_dir in dirs:
+                for file in os.listdir(work_dir):
+                    if file != 'manifest.json':
+                        os.remove(os.path.join(work_dir, file))
+        cleanup = time.perf_counter() - start
+        results[name] = elapsed
+        print(f"  {name:>12}: {elapsed:.2f}s to write, {files} files ({files / lectures:.0f} per lecture), "
+              f"{size / 1024 / 1024:.1f} MB, random chunk read {read_ms:.3f} ms, cleanup {cleanup * 1000:.0f} ms")
+    rows = lectures * chunks_per_lecture * 2
+    print(f"{lectures} lectures x {chunks_per_lecture} chunks in parallel ({rows} rows, store batches of "
+          f"{STORE_BATCH_ROWS}): store {results['legacy files'] / results['store']:.1f}x faster")
+
+def resume_old_run(tmp: str, minutes: float) -> None:
+    from ai_learning import process_audio_file
+    from ollama_client import FakeAsyncClient, OllamaClient
+    from speech_to_text import TranscriptionPool
+    from transcript_store import STORE_FILE, TranscriptStore
+
+    audio = os.path.join(tmp, 'lezione.wav')
+    write_lecture_wav(audio, minutes * 60, 16000, 1, seed=3, voiced=True)
+    keep = os.path.join(tmp, 'lezione_copia.wav')
+    shutil.copyfile(audio, keep)
+
+    with TranscriptionPool(processes=2, backend='fake') as pool:
+        def run(run_dir: str):
+            events = []
+            client = OllamaClient(client=FakeAsyncClient(first_token_latency=0.0, tokens_per_second=5000),
+                                  cache=None)
+            ok = asyncio.run(process_audio_file(audio, run_dir, stt_pool=pool, client=client,
+                                                on_event=lambda kind, data: events.append((kind, data))))
+            assert ok, f"run in {run_dir} failed"
+            return events
+
+        first = run(os.path.join(tmp, 'runs', 'fresh'))
+        with TranscriptStore.open(os.path.join(tmp, 'runs', 'fresh')) as store:
+            chunks = store.chunks()
+        total = len(chunks)
+        assert total >= 4 and all(chunk['end_seconds'] > chunk['start_seconds'] for chunk in chunks), chunks
+        assert chunks[-1]['end_seconds'] <= minutes * 60 + 1e-6
+        assert sum(kind == 'chunk_transcribed' for kind, _ in first) == total
+
+        # The same lecture, stopped half way through by a run of the old layout
+        old = os.path.join(tmp, 'runs', 'old')
+        os.makedirs(old)
+        transcribed, summarized = total // 2, total // 4
+        manifest = {'audio_file': audio, 'audio_seconds': minutes * 60, 'total_chunks': total,
+                    'stages': {stage: {'done': stage == 'downloaded'}
+                               for stage in ('downloaded', 'transcribed', 'summarized', 'refined')},
+                    'chunks': {'transcribed': {}, 'summarized': {}}}
+        for chunk in chunks[:transcribed]:
+            num = chunk['chunk_num']
+            path = os.path.join(old, f"chunk_{num:03d}.txt")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(chunk['text'])
+            manifest['chunks']['transcribed'][str(num)] = path
+            if num <= summarized:
+                path = os.path.join(old, f"summary_{num:03d}.txt")
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(f"riassunto salvato {num}")
+                manifest['chunks']['summarized'][str(num)] = path
+        with open(os.path.join(old, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+        shutil.copyfile(keep, audio)
+
+        resumed = run(old)
+    stt = sorted(data['chunk'] for kind, data in resumed if kind == 'chunk_transcribed')
+    llm = sorted({data['chunk'] for kind, data in resumed if kind == 'summary_token'})
+    assert stt == [chunk['chunk_num'] for chunk in chunks[transcribed:]], stt
+    assert llm == [chunk['chunk_num'] for chunk in chunks[summarized:]], llm
+    assert sorted(os.listdir(old)) == sorted(['manifest.json', 'refined_summary.txt', STORE_FILE]), os.listdir(old)
+    with TranscriptStore.open(old) as store:
+        stored = store.chunks()
+        assert store.total_chunks == total
+    assert [chunk['text'] for chunk in stored] == [chunk['text'] for chunk in chunks]
+    assert all(chunk['summary'] for chunk in stored)
+    assert stored[0]['summary'] == "riassunto salvato 1"
+    assert stored[-1]['start_seconds'] == chunks[-1]['start_seconds']
+    print(f"Old run resumed: {summarized} summaries and {transcribed} transcripts of {total} chunks taken over, "
+          f"STT for chunks {stt[0]}-{stt[-1]}, LLM for chunks {llm[0]}-{llm[-1]}; "
+          f"run dir left with {', '.join(sorted(os.listdir(old)))}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lectures', type=int, default=16)
+    parser.add_argument('--chunks', type=int, default=120, help='chunks per lecture in the write load')
+    parser.add_argument('--minutes', type=float, default=20, help='length of the resumed lecture')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update(TRANSCRIPT_CACHE_DIR=os.path.join(tmp, 'stt_cache'), TRACE_DIR=os.path.join(tmp, 'traces'))
+        write_load(tmp, args.lectures, args.chunks)
+        resume_old_run(tmp, args.minutes)
+
+if __name__ == '__main__':
+    main()
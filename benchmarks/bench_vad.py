@@ -0,0 +1,65 @@
+"""Silence-aware split on lectures with pauses, dense speech and one constant level of noise.
+
+Usage: python benchmarks/bench_vad.py [--minutes 5]
+
+Each case is a 16 kHz mono WAV run through segment_on_silence. Checks:
+- a lecture with pauses is cut into chunks and has some silence trimmed;
+- dense speech without pauses keeps nearly all of its audio;
+- noise at one constant level, which has no quiet floor to measure, is
+  kept whole instead of being dropped as silence.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+sys.path.insert(0, os.path.join(ROOT, 'ai_learning'))
+
+from synthetic_audio import write_lecture_wav
+from vad import segment_on_silence
+
+def write_constant_noise(path: str, seconds: float, level: float = 0.1) -> None:
+    rng = np.random.default_rng(0)
+    with wave.open(path, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(16000)
+        for _ in range(int(seconds)):
+            block = rng.standard_normal(16000, dtype=np.float32) * level
+            wf.writeframes((np.clip(block, -1, 1) * 32767).astype(np.int16).tobytes())
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--minutes', type=float, default=5)
+    args = parser.parse_args()
+    seconds = args.minutes * 60
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cases = {'lecture with pauses': os.path.join(tmp, 'pauses.wav'),
+                 'dense speech': os.path.join(tmp, 'dense.wav'),
+                 'constant noise': os.path.join(tmp, 'noise.wav')}
+        write_lecture_wav(cases['lecture with pauses'], seconds, 16000, 1, silence_ratio=0.3)
+        write_lecture_wav(cases['dense speech'], seconds, 16000, 1, silence_ratio=0.0)
+        write_constant_noise(cases['constant noise'], seconds)
+
+        kept = {}
+        for name, path in cases.items():
+            start = time.perf_counter()
+            windows = segment_on_silence(path)
+            elapsed = time.perf_counter() - start
+            kept[name] = sum(n for window in windows for _, n in window['ranges']) / (seconds * 16000)
+            print(f"{name:>20}: {len(windows)} chunks, {kept[name]:.0%} of the audio kept, "
+                  f"split in {elapsed * 1000:.0f} ms")
+
+        assert kept['lecture with pauses'] < 0.95, "no silence trimmed from a lecture with pauses"
+        assert kept['dense speech'] > 0.95, "dense speech was trimmed as silence"
+        assert kept['constant noise'] == 1.0, "audio at a constant level was dropped as silence"
+
+if __name__ == '__main__':
+    main()
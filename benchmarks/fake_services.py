@@ -0,0 +1,249 @@
+"""Local stand-ins for the Google Web Speech API and the Ollama chat API.
+
+Usage: python benchmarks/fake_services.py [--port 11500] [--stt-latency 0.3] [--tokens-per-second 200] ...
+
+One threaded HTTP server answers both:
+
+- POST /speech-api/v2/recognize, what recognize_google calls (point
+  GoogleBackend at it with STT_BACKEND_OPTIONS='{"endpoint": ...}'). The
+  transcript is derived from a hash of the FLAC body, about 2.5 words per
+  second of audio; near-silent audio gets an empty result (no speech).
+- POST /api/chat, what ollama.AsyncClient calls (OLLAMA_HOST). The answer
+  is streamed as NDJSON at `tokens_per_second`, `summary_ratio` times as
+  long as the prompt, and ends with Ollama's token counts and durations.
+
+Latency, throughput and error rates are configurable. Every decision is
+derived from a hash of the request, so repeated runs behave the same; a
+retried chat request gets a fresh draw for its error, seeded by the attempt.
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+STT_PATH = '/speech-api/v2/recognize'
+CHAT_PATH = '/api/chat'
+# FLAC of 16 kHz speech is roughly half the size of the raw 32 kB/s PCM
+FLAC_BYTES_PER_SECOND = 16000
+WORDS_PER_SECOND = 2.5
+CHARS_PER_TOKEN = 4
+VOCABULARY = ('lezione', 'storia', 'filosofia', 'concetto', 'esempio', 'quindi', 'autore', 'opera',
+              'periodo', 'teoria', 'importante', 'secolo', 'idea', 'problema', 'ragione', 'critica')
+
+def fake_words(rng: random.Random, count: int, sentence_length: int = 0) -> str:
+    """`count` vocabulary words, with a full stop every `sentence_length` words if given."""
+    words = [rng.choice(VOCABULARY) for _ in range(count)]
+    for i in range(sentence_length - 1, count, sentence_length or count + 1):
+        words[i] += '.'
+    return ' '.join(words)
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        path = self.path.split('?', 1)[0]
+        try:
+            if path == STT_PATH:
+                self.server.services.recognize(self, body)
+            elif path == CHAT_PATH:
+                self.server.services.chat(self, json.loads(body))
+            else:
+                self.reply(404, b'')
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def reply(self, status: int, body: bytes, content_type: str = 'application/json') -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+class FakeServices:
+    """The Google and Ollama stand-ins on one local port, served from a daemon thread.
+
+    `stats` counts requests, failures and tokens per service, and the peak
+    number of chat requests in flight; `reset_stats` starts a new count.
+    """
+
+    def __init__(self, port: int = 0, stt_latency: float = 0.3, stt_realtime_factor: float = 0.02,
+                 stt_error_rate: float = 0.0, first_token_latency: float = 0.2,
+                 tokens_per_second: float = 200.0, llm_error_rate: float = 0.0,
+                 summary_ratio: float = 0.3, max_answer_tokens: int = 400):
+        self.options = {
+            'stt_latency': stt_latency, 'stt_realtime_factor': stt_realtime_factor,
+            'stt_error_rate': stt_error_rate, 'first_token_latency': first_token_latency,
+            'tokens_per_second': tokens_per_second, 'llm_error_rate': llm_error_rate,
+            'summary_ratio': summary_ratio, 'max_answer_tokens': max_answer_tokens,
+        }
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._chat_attempts: Dict[bytes, int] = {}
+        self.reset_stats()
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+        self._server.daemon_threads = True
+        self._server.services = self
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    @property
+    def stt_endpoint(self) -> str:
+        return self.url + STT_PATH
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.stats: Dict[str, float] = {
+                'stt_requests': 0, 'stt_errors': 0, 'stt_audio_seconds': 0.0,
+                'llm_requests': 0, 'llm_errors': 0, 'llm_peak_in_flight': 0,
+                'llm_prompt_tokens': 0, 'llm_completion_tokens': 0,
+            }
+
+    def _count(self, **amounts) -> None:
+        with self._lock:
+            for name, amount in amounts.items():
+                self.stats[name] += amount
+
+    def recognize(self, handler: _Handler, flac: bytes) -> None:
+        rng = random.Random(hashlib.sha256(flac).digest())
+        seconds = len(flac) / FLAC_BYTES_PER_SECOND
+        self._count(stt_requests=1, stt_audio_seconds=seconds)
+        time.sleep(self.options['stt_latency'] + self.options['stt_realtime_factor'] * seconds)
+        if rng.random() < self.options['stt_error_rate']:
+            self._count(stt_errors=1)
+            handler.reply(500, b'')
+            return
+        # Silence compresses to almost nothing and gets no words, like a real no-speech answer
+        transcript = fake_words(rng, int(seconds * WORDS_PER_SECOND))
+        result = [{'alternative': [{'transcript': transcript, 'confidence': 0.9}], 'final': True}] if transcript else []
+        body = '{"result":[]}\n' + json.dumps({'result': result, 'result_index': 0}) + '\n'
+        handler.reply(200, body.encode(), 'application/json; charset=utf-8')
+
+    def chat(self, handler: _Handler, request: Dict) -> None:
+        with self._lock:
+            self.stats['llm_requests'] += 1
+            self._in_flight += 1
+            self.stats['llm_peak_in_flight'] = max(self.stats['llm_peak_in_flight'], self._in_flight)
+        try:
+            self._chat(handler, request)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def _chat(self, handler: _Handler, request: Dict) -> None:
+        prompt = ''.join(message.get('content', '') for message in request.get('messages', []))
+        digest = hashlib.sha256(prompt.encode()).digest()
+        with self._lock:
+            attempt = self._chat_attempts[digest] = self._chat_attempts.get(digest, 0) + 1
+        rng = random.Random(digest)
+        prompt_tokens = len(prompt) // CHARS_PER_TOKEN + 1
+        answer_tokens = max(1, min(self.options['max_answer_tokens'],
+                                   int(prompt_tokens * self.options['summary_ratio'])))
+        start = time.perf_counter()
+        time.sleep(self.options['first_token_latency'])
+        if random.Random(digest + bytes([attempt % 256])).random() < self.options['llm_error_rate']:
+            self._count(llm_errors=1)
+            handler.reply(500, json.dumps({'error': 'simulated failure'}).encode())
+            return
+
+        # One vocabulary word is about two tokens
+        words = fake_words(rng, max(1, answer_tokens // 2), sentence_length=12).split(' ')
+        model = request.get('model', 'fake')
+        generation_start = time.perf_counter()
+        if not request.get('stream', True):
+            time.sleep(answer_tokens / self.options['tokens_per_second'])
+        else:
+            handler.send_response(200)
+            handler.send_header('Content-Type', 'application/x-ndjson')
+            handler.send_header('Transfer-Encoding', 'chunked')
+            handler.end_headers()
+            for i, word in enumerate(words):
+                delay = generation_start + 2 * i / self.options['tokens_per_second'] - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                part = {'model': model, 'created_at': '', 'done': False,
+                        'message': {'role': 'assistant', 'content': word + ' '}}
+                handler.write_chunk((json.dumps(part) + '\n').encode())
+        now = time.perf_counter()
+        final = {
+            'model': model, 'created_at': '', 'done': True, 'done_reason': 'stop',
+            'message': {'role': 'assistant',
+                        'content': '' if request.get('stream', True) else ' '.join(words)},
+            'total_duration': int((now - start) * 1e9),
+            'prompt_eval_count': prompt_tokens,
+            'eval_count': answer_tokens,
+            'eval_duration': max(1, int((now - generation_start) * 1e9)),
+        }
+        self._count(llm_prompt_tokens=prompt_tokens, llm_completion_tokens=answer_tokens)
+        if request.get('stream', True):
+            handler.write_chunk((json.dumps(final) + '\n').encode())
+            handler.write_chunk(b'')
+        else:
+            handler.reply(200, json.dumps(final).encode())
+
+    def start(self) -> 'FakeServices':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> 'FakeServices':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """The FakeServices options as command line flags, shared with bench_pipeline."""
+    parser.add_argument('--stt-latency', type=float, default=0.3, help='seconds per STT request')
+    parser.add_argument('--stt-realtime-factor', type=float, default=0.02,
+                        help='extra STT seconds per second of audio')
+    parser.add_argument('--stt-error-rate', type=float, default=0.0)
+    parser.add_argument('--first-token-latency', type=float, default=0.2)
+    parser.add_argument('--tokens-per-second', type=float, default=200.0)
+    parser.add_argument('--llm-error-rate', type=float, default=0.0)
+    parser.add_argument('--summary-ratio', type=float, default=0.3,
+                        help='answer length relative to the prompt')
+    parser.add_argument('--max-answer-tokens', type=int, default=400)
+
+def services_from_args(args: argparse.Namespace, port: int = 0) -> FakeServices:
+    return FakeServices(port, args.stt_latency, args.stt_realtime_factor, args.stt_error_rate,
+                        args.first_token_latency, args.tokens_per_second, args.llm_error_rate,
+                        args.summary_ratio, args.max_answer_tokens)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=11500)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    services = services_from_args(args, args.port)
+    print(f"OLLAMA_HOST={services.url}")
+    print(f"STT_BACKEND=google STT_BACKEND_OPTIONS='{json.dumps({'endpoint': services.stt_endpoint})}'")
+    print("Ctrl+C to stop")
+    with services:
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Synthetic lecture-like WAV files for the offline benchmarks.
+
+Usage: python benchmarks/synthetic_audio.py out.wav [--seconds 300] [--rate 44100] [--channels 2] [--silence 0.2] [--voiced]
+
+Speech is stood in for by noise shaped with a syllable-rate envelope, in
+phrases of 2-12 s. Pauses between phrases take `silence_ratio` of the
+time and hold a faint noise floor, as a real room would, so the VAD and
+the silence-aware split see realistic input. The file is written one
+second at a time, so any length fits in constant memory. With `voiced`
+each syllable is a harmonic tone instead, with its own pitch and formant
+mixed with some of the noise, for tools that look at spectral structure.
+"""
+import argparse
+import random
+import wave
+
+import numpy as np
+
+SYLLABLES_PER_SECOND = 4.0
+SPEECH_LEVEL = 0.3
+NOISE_FLOOR = 0.002
+HARMONICS_UP_TO_HZ = 4000
+
+def lecture_schedule(seconds: float, silence_ratio: float, rng: random.Random):
+    """Yield `(is_speech, seconds)` spans adding up to `seconds`, a `silence_ratio` share of them pauses."""
+    remaining = seconds
+    while remaining > 0:
+        phrase = min(remaining, rng.uniform(2, 12))
+        yield True, phrase
+        remaining -= phrase
+        if remaining <= 0 or silence_ratio <= 0:
+            continue
+        pause = min(remaining, phrase * silence_ratio / (1 - silence_ratio) * rng.uniform(0.5, 1.5))
+        yield False, pause
+        remaining -= pause
+
+def voiced_block(t: np.ndarray, pitches: np.ndarray, formants: np.ndarray,
+                 noise: np.ndarray) -> np.ndarray:
+    """Harmonic syllables at times `t` (seconds into the phrase), one pitch and formant per syllable."""
+    syllable = np.minimum((t * SYLLABLES_PER_SECOND).astype(int), len(pitches) - 1)
+    f0, formant = pitches[syllable], formants[syllable]
+    block = np.zeros(len(t), dtype=np.float32)
+    for k in range(1, int(HARMONICS_UP_TO_HZ / pitches.min()) + 1):
+        freq = k * f0
+        weight = np.where(freq < HARMONICS_UP_TO_HZ, np.exp(-((freq - formant) / 600) ** 2) + 0.1 / k, 0)
+        block += (weight * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+    return block / (np.abs(block).max() + 1e-9) * 2 + 0.3 * noise
+
+def write_lecture_wav(path: str, seconds: float, rate: int = 44100, channels: int = 2,
+                      silence_ratio: float = 0.2, seed: int = 0, voiced: bool = False) -> None:
+    """Write `seconds` of synthetic lecture audio as 16-bit PCM; the same seed gives the same file."""
+    if not 0 <= silence_ratio < 1:
+        raise ValueError("silence_ratio must be at least 0 and below 1")
+    rng = random.Random(seed)
+    noise = np.random.default_rng(seed)
+    with wave.open(path, 'wb') as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        for is_speech, span in lecture_schedule(seconds, silence_ratio, rng):
+            frames = int(span * rate)
+            if is_speech and voiced:
+                syllables = int(span * SYLLABLES_PER_SECOND) + 1
+                pitches = np.array([rng.uniform(100, 220) for _ in range(syllables)])
+                formants = np.array([rng.uniform(500, 2500) for _ in range(syllables)])
+            for offset in range(0, frames, rate):
+                n = min(rate, frames - offset)
+                block = noise.standard_normal(n, dtype=np.float32)
+                if is_speech:
+                    t = (offset + np.arange(n, dtype=np.float32)) / rate
+                    if voiced:
+                        block = voiced_block(t, pitches, formants, block)
+                    block *= SPEECH_LEVEL * np.sin(np.pi * SYLLABLES_PER_SECOND * t) ** 2
+                else:
+                    block *= NOISE_FLOOR
+                pcm = (np.clip(block, -1, 1) * 32767).astype(np.int16)
+                wf.writeframes(np.repeat(pcm, channels).tobytes())
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path')
+    parser.add_argument('--seconds', type=float, default=300)
+    parser.add_argument('--rate', type=int, default=44100)
+    parser.add_argument('--channels', type=int, default=2)
+    parser.add_argument('--silence', type=float, default=0.2, help='share of the time spent in pauses')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--voiced', action='store_true', help='harmonic syllables instead of shaped noise')
+    args = parser.parse_args()
+    write_lecture_wav(args.path, args.seconds, args.rate, args.channels, args.silence, args.seed, args.voiced)
+    print(f"Wrote {args.path}: {args.seconds:.0f}s, {args.rate} Hz, {args.channels} ch, "
+          f"{args.silence:.0%} pauses")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+from math import gcd
+
+import numpy as np
+
+try:
+    from scipy.signal import resample_poly
+except ImportError:
+    resample_poly = None
+
+TARGET_RATE = 16000
+_DTYPES = {1: np.uint8, 2: np.int16, 3: np.uint8, 4: np.int32}
+
+def pcm_to_array(raw_data: bytes, sample_width: int, channels: int) -> np.ndarray:
+    """Interleaved PCM bytes as a `(frames, channels)` int16 array.
+
+    8-bit (unsigned), 24-bit and 32-bit samples are scaled to 16 bits;
+    16-bit data is viewed without a copy.
+    """
+    if sample_width not in _DTYPES:
+        raise ValueError(f"Unsupported sample width: {sample_width} bytes")
+    samples = np.frombuffer(raw_data, dtype=_DTYPES[sample_width])
+    if sample_width == 1:
+        samples = ((samples.astype(np.int16) - 128) << 8)
+    elif sample_width == 3:
+        # Little-endian 3-byte samples become the top bytes of an int32
+        padded = np.zeros((len(samples) // 3, 4), dtype=np.uint8)
+        padded[:, 1:] = samples[:len(padded) * 3].reshape(-1, 3)
+        samples = (padded.view('<i4')[:, 0] >> 16).astype(np.int16)
+    elif sample_width == 4:
+        samples = (samples >> 16).astype(np.int16)
+    return samples.reshape(-1, channels)
+
+def downmix(samples: np.ndarray) -> np.ndarray:
+    """Average the channels of a `(frames, channels)` array into float32 mono."""
+    mono = samples[:, 0].astype(np.float32)
+    for channel in range(1, samples.shape[1]):
+        mono += samples[:, channel]
+    if samples.shape[1] > 1:
+        mono *= 1.0 / samples.shape[1]
+    return mono
+
+def to_mono_16k(samples: np.ndarray, sample_rate: int) -> np.ndarray:
+    """Downmix and resample int16 `(frames, channels)` audio to 16 kHz mono int16.
+
+    Channels are averaged like pydub's `set_channels(1)`. Resampling uses
+    scipy's polyphase filter when scipy is installed, otherwise linear
+    interpolation, which matches what `set_frame_rate` did through audioop.
+    The interpolation gathers only the source frames it needs before
+    downmixing them. Audio that is already 16 kHz mono is returned without a copy.
+    """
+    if samples.ndim == 1:
+        samples = samples.reshape(-1, 1)
+    if sample_rate == TARGET_RATE and samples.shape[1] == 1:
+        return samples[:, 0]
+
+    if sample_rate == TARGET_RATE or not len(samples):
+        mono = downmix(samples)
+    elif resample_poly is not None:
+        divisor = gcd(TARGET_RATE, sample_rate)
+        mono = resample_poly(downmix(samples), TARGET_RATE // divisor, sample_rate // divisor)
+        np.clip(mono, -32768, 32767, out=mono)
+    else:
+        out_len = int(len(samples) * TARGET_RATE / sample_rate)
+        positions = np.arange(out_len, dtype=np.float64) * (sample_rate / TARGET_RATE)
+        left = positions.astype(np.int64)
+        fraction = (positions - left).astype(np.float32)
+        right = np.minimum(left + 1, len(samples) - 1)
+        mono = downmix(np.take(samples, left, axis=0))
+        mono += fraction * (downmix(np.take(samples, right, axis=0)) - mono)
+
+    return np.rint(mono, out=mono).astype(np.int16)
@@ -1,10 +1,23 @@
 import sounddevice as sd
 import numpy as np
-import wave
 import threading
 import os
+from live_transcription import RING_SECONDS, RingBuffer, StreamingWavWriter, record_live
 
-def record_audio(filename='audio/output.wav', sample_rate=44100, channels=2):
+# Sample rate and channels the STT backends work at; recording in it skips the resampling step
+STT_SAMPLE_RATE = 16000
+STT_CHANNELS = 1
+
+def record_audio(filename='audio/output.wav', sample_rate=44100, channels=2, live=False, stt_format=False):
+    """Record from the default input until ENTER is pressed.
+
+    Blocks are converted to int16 straight into a preallocated ring and a
+    writer thread streams them to `filename`, so memory stays the same
+    however long the recording runs. With `stt_format` the device is opened
+    at 16 kHz mono, the format the STT backends use. With `live`, audio is
+    transcribed while recording (see live_transcription) and the transcript
+    is in `text/` as soon as this returns.
+    """
     if os.path.exists(filename):
         scelta = input(
             f"\nEsiste già una registrazione salvata come '{filename}'.\n"
@@ -13,14 +26,17 @@ def record_audio(filename='audio/output.wav', sample_rate=44100, channels=2):
         if scelta.lower() != 's':
             print(f"Utilizzo la traccia già registrata: {filename}")
             return filename
-    audio_chunks = []
+    if stt_format:
+        sample_rate, channels = STT_SAMPLE_RATE, STT_CHANNELS
+    if live:
+        return record_audio_live(filename, sample_rate, channels)
+    ring = RingBuffer(RING_SECONDS * sample_rate, channels)
     recording = True
 
     def callback(indata, frames, time, status):
         if status:
             print(status)
-        audio_int16 = (indata * 32767).astype(np.int16)
-        audio_chunks.append(audio_int16.copy())
+        ring.write(indata)
 
     def stop():
         input("Premi INVIO per fermare la registrazione...\n")
@@ -31,20 +47,40 @@ def record_audio(filename='audio/output.wav', sample_rate=44100, channels=2):
     stop_thread.start()
     print("Registrazione avviata...")
 
-    with sd.InputStream(samplerate=sample_rate, channels=channels, dtype=np.float32, callback=callback):
-        while recording:
-            sd.sleep(100)
+    writer = StreamingWavWriter(ring, filename, sample_rate, channels).start()
+    try:
+        with sd.InputStream(samplerate=sample_rate, channels=channels, dtype=np.float32, callback=callback):
+            while recording:
+                sd.sleep(100)
+    finally:
+        frames_written = writer.stop()
     print("Registrazione terminata.")
+    if ring.dropped:
+        print(f"Attenzione: {ring.dropped / sample_rate:.1f}s di audio persi (disco troppo lento)")
 
-    if audio_chunks:
-        audio_data = np.concatenate(audio_chunks, axis=0)
-        with wave.open(filename, 'wb') as wf:
-            wf.setnchannels(channels)
-            wf.setsampwidth(2)
-            wf.setframerate(sample_rate)
-            wf.writeframes(audio_data.tobytes())
+    if frames_written:
         print(f"Audio salvato come {filename}")
         return filename
     else:
+        os.remove(filename)
         print("Nessun audio è stato registrato")
-        return None
\ No newline at end of file
+        return None
+
+def record_audio_live(filename, sample_rate, channels):
+    stop_event = threading.Event()
+
+    def stop():
+        input("Premi INVIO per fermare la registrazione...\n")
+        stop_event.set()
+
+    threading.Thread(target=stop, daemon=True).start()
+    print("Registrazione avviata (trascrizione in tempo reale)...")
+    transcriber = record_live(filename, sd.InputStream, stop_event, sample_rate, channels)
+    print("Registrazione terminata.")
+
+    if transcriber.frames_written:
+        print(f"Audio salvato come {filename}, {transcriber.segments} segmenti trascritti")
+        return filename
+    os.remove(filename)
+    print("Nessun audio è stato registrato")
+    return None
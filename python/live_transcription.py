@@ -0,0 +1,421 @@
+"""Live mode for audio_register: transcribe while the recording is still going.
+
+The input stream callback only copies each block into a `RingBuffer`. A
+`LiveTranscriber` thread drains it, appends the audio to the WAV on disk,
+cuts segments at pauses and hands them to the STT pool, so by the time
+recording stops only the last segment is left to transcribe. Plain
+recordings use the same ring, drained to disk by a `StreamingWavWriter`.
+
+Try it without a microphone by replaying a WAV in real time:
+    STT_BACKEND=fake python python/live_transcription.py lecture.wav [--speed 10]
+"""
+import argparse
+import functools
+import logging
+import os
+import threading
+import time
+import wave
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from audio_dsp import pcm_to_array, to_mono_16k
+from speech_to_text import TranscriptionPool, record_chunk_timings
+from tracing import get_tracer
+from transcript_store import TranscriptStore
+from vad import FRAME_MS, KEEP_SILENCE_MS, MIN_SILENCE_MS, TRIM_SILENCE_MS, frame_energy_db, speech_threshold
+
+logger = logging.getLogger(__name__)
+
+# A segment is cut at the first pause after LIVE_MIN_SEGMENT_S, or hard-cut at LIVE_MAX_SEGMENT_S
+LIVE_MIN_SEGMENT_S = float(os.environ.get("LIVE_MIN_SEGMENT_S", "10"))
+LIVE_MAX_SEGMENT_S = float(os.environ.get("LIVE_MAX_SEGMENT_S", "30"))
+# Audio the ring can hold before the callback starts dropping blocks
+RING_SECONDS = 30
+POLL_SECONDS = 0.05
+# Frame energies the adaptive speech threshold is computed over
+NOISE_HISTORY_S = 30
+# Until this much audio has been heard every frame counts as speech
+WARMUP_S = 1
+
+class RingBuffer:
+    """Single-producer, single-consumer ring of int16 audio frames.
+
+    The audio callback only ever advances `_written` and the consumer only
+    `_read`, each after its copy is complete, so neither side needs a lock.
+    When the consumer falls a whole ring behind, new blocks are dropped
+    and counted in `dropped` rather than blocking the callback.
+    """
+
+    def __init__(self, capacity: int, channels: int):
+        self.capacity = capacity
+        self._data = np.zeros((capacity, channels), dtype=np.int16)
+        self._written = 0
+        self._read = 0
+        self.dropped = 0
+
+    def write(self, block: np.ndarray) -> bool:
+        """Copy a `(frames, channels)` block in; float blocks in [-1, 1] are converted to int16 on the way."""
+        n = len(block)
+        if n > self.capacity - (self._written - self._read):
+            self.dropped += n
+            return False
+        start = self._written % self.capacity
+        first = min(n, self.capacity - start)
+        scale = 32767 if block.dtype.kind == 'f' else 1
+        np.multiply(block[:first], scale, out=self._data[start:start + first], casting='unsafe')
+        np.multiply(block[first:], scale, out=self._data[:n - first], casting='unsafe')
+        self._written += n
+        return True
+
+    def read(self) -> np.ndarray:
+        """Everything written since the last read, as a new array."""
+        n = self._written - self._read
+        start = self._read % self.capacity
+        first = min(n, self.capacity - start)
+        out = np.concatenate((self._data[start:start + first], self._data[:n - first]))
+        self._read += n
+        return out
+
+    def drain(self, consume: Callable[[np.ndarray], None]) -> int:
+        """Hand everything written since the last read to `consume` without copying.
+
+        `consume` gets at most two views into the ring; they stay valid until
+        it returns, because the producer cannot reuse that space before then.
+        Returns the number of frames drained.
+        """
+        n = self._written - self._read
+        start = self._read % self.capacity
+        first = min(n, self.capacity - start)
+        if first:
+            consume(self._data[start:start + first])
+        if n > first:
+            consume(self._data[:n - first])
+        self._read += n
+        return n
+
+class StreamingWavWriter:
+    """Thread that streams a `RingBuffer` into a WAV file while recording.
+
+    Frames go from the ring straight to disk, so a recording of any length
+    only ever holds the ring in memory. The header is written when `stop`
+    closes the file.
+    """
+
+    def __init__(self, ring: RingBuffer, filename: str, sample_rate: int, channels: int):
+        self.ring = ring
+        self.filename = filename
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frames_written = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._writer = None
+
+    def start(self) -> 'StreamingWavWriter':
+        self._writer = wave.open(self.filename, 'wb')
+        self._writer.setnchannels(self.channels)
+        self._writer.setsampwidth(2)
+        self._writer.setframerate(self.sample_rate)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> int:
+        """Write what is left in the ring, finish the header and return the frames written."""
+        self._stop.set()
+        self._thread.join()
+        return self.frames_written
+
+    def _run(self) -> None:
+        try:
+            while True:
+                stopping = self._stop.is_set()
+                drained = self.ring.drain(self._writer.writeframesraw)
+                self.frames_written += drained
+                if not drained:
+                    if stopping:
+                        break
+                    time.sleep(POLL_SECONDS)
+        finally:
+            self._writer.close()
+
+class WavInputStream:
+    """Stand-in for `sounddevice.InputStream` that plays a WAV file into `callback`.
+
+    Blocks are delivered as float32 from a background thread at the file's
+    real-time pace, or `speed` times faster. `active` turns False once the
+    whole file has been played, like a stream that was stopped.
+    """
+
+    def __init__(self, path: str, samplerate: int, channels: int, dtype=np.float32,
+                 callback: Optional[Callable] = None, blocksize: int = 1024, speed: float = 1.0):
+        with wave.open(path, 'rb') as wf:
+            if (wf.getframerate(), wf.getnchannels()) != (samplerate, channels):
+                raise ValueError(f"{path} is {wf.getframerate()} Hz, {wf.getnchannels()} ch; "
+                                 f"stream asked for {samplerate} Hz, {channels} ch")
+        self.path = path
+        self.samplerate = samplerate
+        self.channels = channels
+        self.callback = callback
+        self.blocksize = blocksize
+        self.speed = speed
+        self.active = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        self.active = True
+        self._thread = threading.Thread(target=self._play, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.active = False
+
+    def __enter__(self) -> 'WavInputStream':
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _play(self) -> None:
+        period = self.blocksize / self.samplerate / self.speed
+        deadline = time.perf_counter()
+        with wave.open(self.path, 'rb') as wf:
+            while not self._stop.is_set():
+                raw_data = wf.readframes(self.blocksize)
+                if not raw_data:
+                    break
+                block = pcm_to_array(raw_data, wf.getsampwidth(), wf.getnchannels()).astype(np.float32)
+                block *= 1 / 32768
+                self.callback(block, len(block), None, None)
+                deadline += period
+                self._stop.wait(max(0.0, deadline - time.perf_counter()))
+        self.active = False
+
+class LiveTranscriber:
+    """Consumer thread of live mode.
+
+    Drains the ring, appends the audio to `filename`, cuts segments at the
+    first pause of at least `MIN_SILENCE_MS` after `min_segment_s` (or at
+    `max_segment_s`) and submits them to `pool`. Leading silence and pauses
+    longer than `TRIM_SILENCE_MS` never reach the recognizer. Transcripts
+    go to a new transcript store in `output_dir` as they come back, with the
+    recording offsets of their segment.
+    """
+
+    def __init__(self, ring: RingBuffer, filename: str, sample_rate: int, channels: int,
+                 pool: TranscriptionPool, output_dir: str = "text",
+                 min_segment_s: float = LIVE_MIN_SEGMENT_S, max_segment_s: float = LIVE_MAX_SEGMENT_S):
+        self.ring = ring
+        self.filename = filename
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.pool = pool
+        self.output_dir = output_dir
+        self.frame_len = max(1, sample_rate * FRAME_MS // 1000)
+        self.min_segment_frames = int(min_segment_s * 1000 // FRAME_MS)
+        self.max_segment_frames = int(max_segment_s * 1000 // FRAME_MS)
+        self.frames_written = 0
+        self.segments = 0
+        self.transcripts: Dict[int, Optional[str]] = {}
+        self.store: Optional[TranscriptStore] = None
+        self._history = deque(maxlen=NOISE_HISTORY_S * 1000 // FRAME_MS)
+        self._pending = np.empty((0, channels), dtype=np.int16)
+        self._segment: List[np.ndarray] = []
+        self._segment_start = 0
+        self._position = 0
+        self._offsets: Dict[int, tuple] = {}
+        self._speech_frames = 0
+        self._silent_run = 0
+        self._submitted_at: Dict[int, float] = {}
+        self._results = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self._writer = None
+
+    def start(self) -> 'LiveTranscriber':
+        self.store = TranscriptStore.open(self.output_dir)
+        self.store.clear()
+        self.store.set_info(audio_file=self.filename)
+        self._writer = wave.open(self.filename, 'wb')
+        self._writer.setnchannels(self.channels)
+        self._writer.setsampwidth(2)
+        self._writer.setframerate(self.sample_rate)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> List[str]:
+        """Flush the last segment, wait for every transcript and close the transcript store.
+
+        Returns the transcripts in recording order.
+        """
+        self._stop.set()
+        self._thread.join()
+        start = time.perf_counter()
+        with self._results:
+            self._results.wait_for(lambda: len(self.transcripts) == self.segments)
+        logger.info(f"Live transcript complete {time.perf_counter() - start:.1f}s after recording stopped")
+
+        self.store.set_info(total_chunks=self.segments)
+        self.store.close()
+        return [self.transcripts[num] for num in sorted(self.transcripts) if self.transcripts[num]]
+
+    def _run(self) -> None:
+        try:
+            while True:
+                stopping = self._stop.is_set()
+                block = self.ring.read()
+                if len(block):
+                    self._consume(block)
+                elif stopping:
+                    break
+                else:
+                    time.sleep(POLL_SECONDS)
+            self._cut()
+        finally:
+            self._writer.close()
+
+    def _consume(self, block: np.ndarray) -> None:
+        self._writer.writeframesraw(block)
+        self.frames_written += len(block)
+
+        samples = np.concatenate((self._pending, block)) if len(self._pending) else block
+        n_frames = len(samples) // self.frame_len
+        self._pending = samples[n_frames * self.frame_len:]
+        energy = frame_energy_db(samples, self.frame_len)
+        self._history.extend(energy.tolist())
+        warm = len(self._history) * FRAME_MS >= WARMUP_S * 1000
+        threshold = speech_threshold(np.fromiter(self._history, dtype=np.float32)) if warm else None
+
+        min_silence = MIN_SILENCE_MS // FRAME_MS
+        keep = max(1, KEEP_SILENCE_MS // FRAME_MS)
+        trim = TRIM_SILENCE_MS // FRAME_MS
+        # Recording position of the first frame in `samples`
+        base = self.frames_written - len(samples)
+        for i, level in enumerate(energy):
+            frame = samples[i * self.frame_len:(i + 1) * self.frame_len]
+            frame_start = base + i * self.frame_len
+            self._position = frame_start + self.frame_len
+            if threshold is None or level > threshold:
+                self._speech_frames += 1
+                self._silent_run = 0
+            else:
+                self._silent_run += 1
+            if self._speech_frames == 0:
+                # Nothing said yet: only keep a short lead-in
+                self._segment = self._segment[-(keep - 1):] if keep > 1 else []
+                self._segment_start = frame_start - len(self._segment) * self.frame_len
+            elif self._silent_run > trim:
+                continue
+            if not self._segment:
+                self._segment_start = frame_start
+            self._segment.append(frame)
+            length = len(self._segment)
+            if (length >= self.max_segment_frames
+                    or (length >= self.min_segment_frames and self._silent_run >= min_silence)):
+                self._cut()
+
+    def _cut(self) -> None:
+        """Send the current segment to STT if anything was said in it, then start a new one."""
+        if self._segment and self._speech_frames:
+            self.segments += 1
+            chunk_num = self.segments
+            pcm = to_mono_16k(np.concatenate(self._segment), self.sample_rate).tobytes()
+            self._offsets[chunk_num] = (self._segment_start / self.sample_rate, self._position / self.sample_rate)
+            self._submitted_at[chunk_num] = time.perf_counter()
+            self.pool.submit({
+                'pcm': pcm,
+                'chunk_num': chunk_num,
+                'backend': self.pool.backend,
+                'backend_options': self.pool.backend_options
+            }, self._on_result)
+            logger.info(f"Live segment {chunk_num}: {len(pcm) / 32000:.1f}s sent to STT")
+        self._segment = []
+        self._speech_frames = 0
+        self._silent_run = 0
+
+    def _on_result(self, result: Dict) -> None:
+        chunk_num = result['chunk_num']
+        elapsed = time.perf_counter() - self._submitted_at[chunk_num]
+        get_tracer().record('stt_chunk', elapsed, chunk=chunk_num, live=True)
+        record_chunk_timings(result, live=True)
+        if result['text']:
+            start, end = self._offsets[chunk_num]
+            self.store.add_chunk(chunk_num, result['text'], start, end, cached=result['cached'], timings={
+                stage: round(seconds, 4) for stage, (_, seconds) in result.get('timings', {}).items()
+            })
+            logger.info(f"Live segment {chunk_num} transcribed in {elapsed:.1f}s")
+        with self._results:
+            self.transcripts[chunk_num] = result['text']
+            self._results.notify_all()
+
+def record_live(filename: str, stream_factory: Callable, stop_event: threading.Event,
+                sample_rate: int = 44100, channels: int = 2, pool: Optional[TranscriptionPool] = None,
+                output_dir: str = "text") -> LiveTranscriber:
+    """Record from `stream_factory` (`sounddevice.InputStream` or `WavInputStream`) with live transcription.
+
+    Recording stops when `stop_event` is set or the stream goes inactive.
+    Returns the stopped `LiveTranscriber`, with its transcript saved.
+    """
+    own_pool = pool is None
+    if own_pool:
+        pool = TranscriptionPool().start()
+    ring = RingBuffer(RING_SECONDS * sample_rate, channels)
+
+    def callback(indata, frames, time, status):
+        if status:
+            print(status)
+        ring.write(indata)
+
+    transcriber = LiveTranscriber(ring, filename, sample_rate, channels, pool, output_dir).start()
+    try:
+        with stream_factory(samplerate=sample_rate, channels=channels, dtype=np.float32,
+                            callback=callback) as stream:
+            while stream.active and not stop_event.wait(0.1):
+                pass
+    finally:
+        transcriber.stop()
+        if own_pool:
+            pool.close()
+    if ring.dropped:
+        logger.warning(f"Live mode fell behind: {ring.dropped / sample_rate:.1f}s of audio dropped")
+    return transcriber
+
+def load_live_transcript(audio_file: str, output_dir: str = "text") -> Optional[Dict]:
+    """`{'total_chunks', 'processed_chunks', 'audio_file'}` of the transcript live mode
+    left in `output_dir` for `audio_file`, if it is still there."""
+    with TranscriptStore.open(output_dir) as store:
+        if not os.path.exists(store.path) or store.info('audio_file') != audio_file:
+            return None
+        return {'total_chunks': store.total_chunks, 'processed_chunks': len(store.chunks()),
+                'audio_file': audio_file}
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay a WAV through live mode as if it were being recorded")
+    parser.add_argument('wav')
+    parser.add_argument('--speed', type=float, default=1.0, help="playback speed, 1 = real time")
+    parser.add_argument('--output', default='audio/live_replay.wav')
+    parser.add_argument('--output-dir', default='text')
+    args = parser.parse_args()
+
+    with wave.open(args.wav, 'rb') as wf:
+        sample_rate, channels = wf.getframerate(), wf.getnchannels()
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    start = time.perf_counter()
+    transcriber = record_live(
+        args.output, functools.partial(WavInputStream, args.wav, speed=args.speed), threading.Event(),
+        sample_rate, channels, output_dir=args.output_dir
+    )
+    print(f"{transcriber.segments} segments, {transcriber.frames_written / sample_rate:.0f}s recorded "
+          f"in {time.perf_counter() - start:.1f}s")
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,31 @@
 from audio_register import record_audio
 from speech_to_text import transcribe_audio_file
+from live_transcription import load_live_transcript
 import asyncio
 import os
-from ollama import AsyncClient
-from typing import Optional
+from ollama_client import OllamaClient, get_client, close_client
+from summary_tree import reduce_text
+from tracing import get_tracer, close_tracer
+from transcript_store import TranscriptStore
+from typing import List, Optional, Tuple
 import logging
 import time
 from datetime import timedelta
-import json
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Chunk summaries sent to Ollama at the same time; match the server's OLLAMA_NUM_PARALLEL
+MAX_PARALLEL_REQUESTS = max(1, int(os.environ.get("OLLAMA_NUM_PARALLEL", "4")))
+MAX_CHUNK_RETRIES = 3
+RETRY_BACKOFF_SECONDS = 2.0
+# Transcribed chunks allowed to wait for the summarizer before transcription pauses
+STT_MAX_AHEAD = 4
+# Transcribe while recording instead of after; LIVE_TRANSCRIPTION=1 to enable
+LIVE_TRANSCRIPTION = os.environ.get("LIVE_TRANSCRIPTION", "0") == "1"
+# Record at 16 kHz mono, the STT format, instead of 44.1 kHz stereo
+RECORD_STT_FORMAT = os.environ.get("RECORD_STT_FORMAT", "0") == "1"
+
 SYSTEM_PROMPT = """
 Sei un assistente virtuale esperto nel riassumere testi lunghi in modo chiaro, accurato e informativo.
 
@@ -34,130 +48,147 @@ Sei un assistente virtuale esperto nel riassumere testi lunghi in modo chiaro, a
 9. Concludi con una frase che sintetizzi l'importanza, l'impatto o lo stato attuale dell'argomento.
 """
 
-def split_text_into_chunks(text: str, max_chars: int = 4000) -> list[str]:
-    """Split text into chunks while preserving sentence structure."""
-    paragraphs = text.split('\n\n')
-    chunks = []
-    current_chunk = []
-    current_length = 0
-    
-    for para in paragraphs:
-        if current_length + len(para) > max_chars and current_chunk:
-            chunks.append('\n\n'.join(current_chunk))
-            current_chunk = []
-            current_length = 0
-        
-        current_chunk.append(para)
-        current_length += len(para) + 2
-    if current_chunk:
-        chunks.append('\n\n'.join(current_chunk))
-    
-    return chunks
-
-async def summarize_chunk(chunk_file: str, chunk_num: int, total_chunks: int) -> str:
-    """Summarize a single chunk of text."""
-    with open(chunk_file, 'r', encoding='utf-8') as f:
-        chunk_text = f.read()
-    
+async def summarize_chunk(chunk_text: str, chunk_num: int, total_chunks: int,
+                          client: Optional[OllamaClient] = None, store: Optional[TranscriptStore] = None) -> str:
+    """Summarize a single chunk of text. Errors are raised so the caller can retry."""
     messages = [
         {'role': 'system', 'content': SYSTEM_PROMPT},
         {'role': 'user', 'content': f'Questo è il chunk {chunk_num}/{total_chunks}. '
                                   f'Raccogli le informazioni chiave: {chunk_text}'}
     ]
     
+    logger.info(f"Summarizing chunk {chunk_num}/{total_chunks}")
+    start = time.perf_counter()
+    summary_text = await (client or get_client()).chat(messages)
+    if store is not None:
+        with get_tracer().span('file_io', op='write_summary', chunk=chunk_num):
+            store.add_summary(chunk_num, summary_text, time.perf_counter() - start)
+
+    # Chunks finish out of order, so print each summary whole instead of streaming tokens
+    print(f"\nChunk {chunk_num}/{total_chunks}:")
+    print("-" * 50)
+    print(summary_text, flush=True)
+    return summary_text
+
+async def summarize_chunk_with_retry(semaphore: asyncio.Semaphore, chunk_text: str, chunk_num: int,
+                                     total_chunks: int, client: Optional[OllamaClient] = None,
+                                     max_retries: int = MAX_CHUNK_RETRIES,
+                                     store: Optional[TranscriptStore] = None) -> str:
+    """Summarize a chunk under the shared in-flight limit, retrying only this chunk on failure."""
+    for attempt in range(1, max_retries + 1):
+        try:
+            with get_tracer().span('llm_queue_wait', chunk=chunk_num):
+                await semaphore.acquire()
+            try:
+                return await summarize_chunk(chunk_text, chunk_num, total_chunks, client, store)
+            finally:
+                semaphore.release()
+        except Exception as e:
+            logger.warning(f"Chunk {chunk_num}: attempt {attempt}/{max_retries} failed - {e}")
+            if attempt < max_retries:
+                await asyncio.sleep(RETRY_BACKOFF_SECONDS * attempt)
+    logger.error(f"Summarization error for chunk {chunk_num}: giving up after {max_retries} attempts")
+    return ""
+
+def write_final_summary(summaries: List[str]) -> None:
+    """Write the combined chunk summaries and remove the temporary files, transcript store included."""
+    print("\n\nFinal Combined Summary:")
+    print("=" * 80)
+    print('\n\n'.join(summaries))
+    
+    with open("text/final_summary.txt", 'w', encoding='utf-8') as f:
+        f.write('\n\n'.join(summaries))
+    print("\nCleaning up temporary files...")
     try:
-        print(f"\nProcessing chunk {chunk_num}/{total_chunks}:")
-        print("-" * 50)
-        
-        summary = []
-        async for part in await AsyncClient().chat(
-            model='llama3.2:latest',
-            messages=messages,
-            stream=True
-        ):
-            content = part['message']['content']
-            summary.append(content)
-            print(content, end='', flush=True)
-        summary_text = ''.join(summary)
-        summary_file = f"text/summary_{chunk_num:03d}.txt"
-        with open(summary_file, 'w', encoding='utf-8') as f:
-            f.write(summary_text)
+        keep_files = {'final_summary.txt', 'refined_summary.txt'}
+        for file in os.listdir("text"):
+            if file not in keep_files:
+                file_path = os.path.join("text", file)
+                if os.path.isfile(file_path):
+                    os.remove(file_path)
         
-        return summary_text
+        logger.info("Temporary files cleaned up successfully")
     except Exception as e:
-        logger.error(f"Summarization error for chunk {chunk_num}: {e}")
-        return ""
+        logger.error(f"Error cleaning up temporary files: {e}")
 
-async def summarize_text(text: str) -> None:
-    """Generate summary using Ollama API, processing text chunks sequentially."""
+async def summarize_text(text: str, max_parallel: int = MAX_PARALLEL_REQUESTS,
+                         client: Optional[OllamaClient] = None) -> None:
+    """Summarize every chunk in the transcript store of `text/`, up to `max_parallel` at once."""
     try:
-        with open("text/chunks_metadata.json", 'r') as f:
-            metadata = json.load(f)
-        summaries = []
-        for i, chunk_file in enumerate(metadata['chunk_files'], 1):
-            summary = await summarize_chunk(chunk_file, i, metadata['total_chunks'])
-            summaries.append(summary)
-        print("\n\nFinal Combined Summary:")
-        print("=" * 80)
-        print('\n\n'.join(summaries))
-        
-        with open("text/final_summary.txt", 'w', encoding='utf-8') as f:
-            f.write('\n\n'.join(summaries))
-        print("\nCleaning up temporary files...")
-        try:
-            for chunk_file in metadata['chunk_files']:
-                if os.path.exists(chunk_file):
-                    os.remove(chunk_file)
-            os.remove("text/chunks_metadata.json")
-            keep_files = {'final_summary.txt', 'refined_summary.txt'}
-            for file in os.listdir("text"):
-                if file not in keep_files:
-                    file_path = os.path.join("text", file)
-                    if os.path.isfile(file_path):
-                        os.remove(file_path)
-            
-            logger.info("Temporary files cleaned up successfully")
-        except Exception as e:
-            logger.error(f"Error cleaning up temporary files: {e}")
-            
+        with TranscriptStore.open("text") as store:
+            chunks = store.chunks()
+            total_chunks = store.total_chunks or len(chunks)
+            semaphore = asyncio.Semaphore(max_parallel)
+            summaries = await asyncio.gather(*(
+                summarize_chunk_with_retry(semaphore, chunk['text'], chunk['chunk_num'], total_chunks, client,
+                                           store=store)
+                for chunk in chunks
+            ))
+        write_final_summary(summaries)
     except Exception as e:
         logger.error(f"Error in summarization process: {e}")
 
-async def refine_final_summary(summary_file: str = "text/final_summary.txt") -> None:
-    """Refine the final summary by processing it in smaller chunks."""
+async def summarize_stream(queue: asyncio.Queue, max_parallel: int = MAX_PARALLEL_REQUESTS,
+                           client: Optional[OllamaClient] = None,
+                           store: Optional[TranscriptStore] = None) -> List[Tuple[int, str, str]]:
+    """Summarize chunks as the transcription stage puts them on `queue`, until `None` arrives.
+
+    A chunk is only taken off the queue when a request slot is free, so a busy
+    LLM lets the queue fill up and holds the transcription side back.
+    Summaries are added to `store` when one is given.
+    Returns `(chunk_num, chunk_text, summary)` in chunk order.
+    """
+    semaphore = asyncio.Semaphore(max_parallel)
+    free_slots = asyncio.Semaphore(max_parallel)
+    tasks = {}
+    while True:
+        await free_slots.acquire()
+        item = await queue.get()
+        if item is None:
+            free_slots.release()
+            break
+        chunk_num, total_chunks, chunk_text = item
+        task = asyncio.create_task(
+            summarize_chunk_with_retry(semaphore, chunk_text, chunk_num, total_chunks, client, store=store)
+        )
+        task.add_done_callback(lambda _: free_slots.release())
+        tasks[chunk_num] = (chunk_text, task)
+    await asyncio.gather(*(task for _, task in tasks.values()))
+    return [(num, tasks[num][0], tasks[num][1].result()) for num in sorted(tasks)]
+
+async def transcribe_and_summarize(audio_path: str, max_ahead: int = STT_MAX_AHEAD,
+                                   client: Optional[OllamaClient] = None) -> bool:
+    """Run transcription and chunk summarization as overlapping stages.
+
+    At most `max_ahead` transcribed chunks wait for the summarizer before the
+    transcription side is paused.
+    """
+    queue = asyncio.Queue(maxsize=max_ahead)
+    store = TranscriptStore.open("text")
+    store.clear()
+    summarizer = asyncio.create_task(summarize_stream(queue, client=client, store=store))
+    try:
+        transcribed = await transcribe_audio_file(audio_path, queue=queue, store=store)
+    finally:
+        await queue.put(None)
+        try:
+            results = await summarizer
+        finally:
+            store.close()
+    if not transcribed:
+        return False
+    write_final_summary([summary for _, _, summary in results])
+    return True
+
+async def refine_final_summary(summary_file: str = "text/final_summary.txt",
+                               client: Optional[OllamaClient] = None) -> None:
+    """Refine the final summary into one text through a token-aware reduction tree."""
     try:
         with open(summary_file, 'r', encoding='utf-8') as f:
             text = f.read()
-        chunks = split_text_into_chunks(text)
-        print(f"\nRefining summary in {len(chunks)} chunks...")
-        
-        refined_chunks = []
-        for i, chunk in enumerate(chunks, 1):
-            print(f"\nProcessing chunk {i}/{len(chunks)}:")
-            print("=" * 50)
-            
-            messages = [
-                {'role': 'system', 'content': """Sei un editor esperto. Il tuo compito è:
-1. Rimuovere tutte le ripetizioni di concetti e informazioni
-2. Eliminare frasi incomplete o poco chiare
-3. Mantenere la coerenza tra i paragrafi
-4. Preservare tutte le informazioni uniche e rilevanti
-5. Migliorare la leggibilità del testo"""},
-                {'role': 'user', 'content': f'Riorganizza e pulisci questo testo:\n\n{chunk}'}
-            ]
-            
-            refined_chunk = []
-            async for part in await AsyncClient().chat(
-                model='llama3.2:latest',
-                messages=messages,
-                stream=True
-            ):
-                content = part['message']['content']
-                refined_chunk.append(content)
-                print(content, end='', flush=True)
-            
-            refined_chunks.append(''.join(refined_chunk))
-        final_refined_text = '\n\n'.join(refined_chunks)
+        final_refined_text = await reduce_text(text, client, asyncio.Semaphore(MAX_PARALLEL_REQUESTS))
+        if not final_refined_text.strip():
+            raise ValueError("the reduction returned an empty summary")
         with open("text/refined_summary.txt", 'w', encoding='utf-8') as f:
             f.write(final_refined_text)
         
@@ -186,32 +217,45 @@ async def main() -> None:
     
     try:
         record_start = time.time()
-        if not (audio_file := record_audio()):
+        if not (audio_file := record_audio(live=LIVE_TRANSCRIPTION, stt_format=RECORD_STT_FORMAT)):
             logger.error("Audio recording failed")
             return
         record_time = time.time() - record_start
         
+        # Chunks are summarized while the rest of the recording is still being transcribed
         transcribe_start = time.time()
-        if not await transcribe_audio_file(audio_file):
+        if LIVE_TRANSCRIPTION and load_live_transcript(audio_file):
+            # Already transcribed during recording, only the summaries are left
+            await summarize_text("")
+        elif not await transcribe_and_summarize(audio_file):
             logger.error("Transcription failed")
             return
         transcribe_time = time.time() - transcribe_start
 
         summarize_start = time.time()
-        await summarize_text("")
         await refine_final_summary()
         summarize_time = time.time() - summarize_start
         
         total_time = time.time() - total_start
+        tracer = get_tracer()
+        tracer.record('record', record_time, record_start)
+        tracer.record('transcribe_summarize', transcribe_time, transcribe_start)
+        tracer.record('refine', summarize_time, summarize_start)
+        tracer.record('total', total_time, total_start)
         
         print("\n\nTiming Statistics:")
         print(f"Recording time: {str(timedelta(seconds=int(record_time)))}")
-        print(f"Transcription time: {str(timedelta(seconds=int(transcribe_time)))}")
-        print(f"Summarization time: {str(timedelta(seconds=int(summarize_time)))}")
+        print(f"Transcription + summary time: {str(timedelta(seconds=int(transcribe_time)))}")
+        print(f"Refinement time: {str(timedelta(seconds=int(summarize_time)))}")
         print(f"Total execution time: {str(timedelta(seconds=int(total_time)))}")
+        print(get_client().stats.report())
+        print(get_tracer().report())
 
     except Exception as e:
         logger.error(f"Application error: {e}")
+    finally:
+        await close_client()
+        close_tracer()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
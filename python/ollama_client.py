@@ -0,0 +1,255 @@
+import asyncio
+import logging
+import os
+import time
+import weakref
+from typing import AsyncIterator, Dict, List, Optional
+
+import httpx
+from ollama import AsyncClient
+from llm_cache import ResponseCache, replay, request_key
+from text_chunker import DEFAULT_CHARS_PER_TOKEN
+from tracing import DURATION_BUCKETS, Histogram, get_tracer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = os.environ.get("OLLAMA_MODEL", "llama3.2:latest")
+DEFAULT_POOL_SIZE = max(1, int(os.environ.get("OLLAMA_POOL_SIZE", os.environ.get("OLLAMA_NUM_PARALLEL", "4"))))
+KEEPALIVE_EXPIRY_SECONDS = 120.0
+# Context window requested from Ollama; summary_tree sizes its requests to fit in it
+CONTEXT_TOKENS = int(os.environ.get("OLLAMA_NUM_CTX", "4096"))
+# Set LLM_CACHE=0 to always call the model
+USE_RESPONSE_CACHE = os.environ.get("LLM_CACHE", "1") != "0"
+
+class ClientStats:
+    """Counters for requests sent through the shared client."""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.new_connections = 0
+        self.reused_connections = 0
+        self.cache_hits = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        # Smallest characters-per-token ratio seen; prompt prefix caching only ever makes it look larger
+        self.chars_per_token: Optional[float] = None
+        # Fixed-size, so a client kept for a server's whole life does not grow with every request
+        self.latencies = Histogram(DURATION_BUCKETS)
+
+    def request_started(self) -> None:
+        self.requests += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def request_finished(self, latency: float, failed: bool = False) -> None:
+        self.in_flight -= 1
+        self.latencies.observe(latency)
+        if failed:
+            self.errors += 1
+
+    def record_tokens(self, prompt_chars: int, prompt_tokens: int, completion_tokens: int) -> None:
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        ratio = prompt_chars / prompt_tokens
+        self.chars_per_token = ratio if self.chars_per_token is None else min(self.chars_per_token, ratio)
+
+    def report(self) -> str:
+        """Human readable one-block summary for the timing statistics."""
+        latencies = self.latencies
+        if not latencies.count:
+            return f"LLM requests: 0 (cache hits: {self.cache_hits})"
+        return (
+            f"LLM requests: {self.requests} (errors: {self.errors}, peak in flight: {self.peak_in_flight}, "
+            f"cache hits: {self.cache_hits})\n"
+            f"LLM connections: {self.new_connections} new, {self.reused_connections} reused\n"
+            f"LLM tokens: {self.prompt_tokens} prompt, {self.completion_tokens} completion\n"
+            f"LLM latency: avg {latencies.sum / latencies.count:.2f}s, p50 {latencies.percentile(0.5):.2f}s, "
+            f"p95 {latencies.percentile(0.95):.2f}s, max {latencies.max:.2f}s"
+        )
+
+class OllamaClient:
+    """Long-lived Ollama client shared by the whole pipeline.
+
+    Wraps a single `ollama.AsyncClient` whose httpx pool keeps connections alive
+    between chunks, and is the one place where model name and options are set.
+    """
+
+    def __init__(self, model: str = DEFAULT_MODEL, options: Optional[Dict] = None,
+                 host: Optional[str] = None, pool_size: int = DEFAULT_POOL_SIZE,
+                 client: Optional[AsyncClient] = None, cache: Optional[ResponseCache] = None):
+        self.model = model
+        self.options = options or {}
+        self.cache = cache
+        self.stats = ClientStats()
+        self._seen_streams = weakref.WeakSet()
+        self._client = client or AsyncClient(
+            host=host,
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size,
+                keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS
+            ),
+            event_hooks={'response': [self._track_connection]}
+        )
+
+    async def _track_connection(self, response: httpx.Response) -> None:
+        """Count whether the response came over a pooled or a freshly opened connection."""
+        stream = response.extensions.get("network_stream")
+        if stream is None:
+            return
+        try:
+            if stream in self._seen_streams:
+                self.stats.reused_connections += 1
+                return
+            self._seen_streams.add(stream)
+        except TypeError:
+            pass
+        self.stats.new_connections += 1
+
+    @property
+    def chars_per_token(self) -> float:
+        """Ratio measured from the prompt token counts Ollama reports, or a conservative default before the first one."""
+        return self.stats.chars_per_token or DEFAULT_CHARS_PER_TOKEN
+
+    def count_tokens(self, text: str) -> int:
+        """Estimated prompt tokens for `text`."""
+        return int(len(text) / self.chars_per_token) + 1
+
+    async def chat_stream(self, messages: List[Dict]) -> AsyncIterator[str]:
+        """Stream the content of a chat response piece by piece.
+
+        Responses already in the cache are replayed without calling the model;
+        cache reads and writes run in an executor, off the event loop.
+        Time to first token, total time and generation tokens/s are traced.
+        """
+        key = None
+        if self.cache is not None:
+            key = request_key(self.model, messages, self.options)
+            cached = await asyncio.get_event_loop().run_in_executor(None, self.cache.get, key)
+            if cached is not None:
+                self.stats.cache_hits += 1
+                get_tracer().count('llm_cache_hits')
+                async for piece in replay(cached):
+                    yield piece
+                return
+
+        tracer = get_tracer()
+        start = time.perf_counter()
+        first_token = None
+        failed = False
+        parts = []
+        self.stats.request_started()
+        try:
+            async for part in await self._client.chat(
+                model=self.model,
+                messages=messages,
+                options=self.options or None,
+                stream=True
+            ):
+                content = part['message']['content']
+                parts.append(content)
+                if first_token is None and content:
+                    first_token = time.perf_counter() - start
+                    tracer.record('llm_first_token', first_token, model=self.model)
+                if part.get('done') and part.get('prompt_eval_count'):
+                    self.stats.record_tokens(sum(len(m['content']) for m in messages),
+                                             part['prompt_eval_count'], part.get('eval_count') or 0)
+                    tracer.count('llm_prompt_tokens', part['prompt_eval_count'])
+                    tracer.count('llm_completion_tokens', part.get('eval_count') or 0)
+                    if part.get('eval_count') and part.get('eval_duration'):
+                        # Ollama reports generation time in nanoseconds
+                        tracer.observe('llm_tokens_per_second', part['eval_count'] / (part['eval_duration'] / 1e9))
+                yield content
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stats.request_finished(elapsed, failed)
+            tracer.record('llm_total', elapsed, model=self.model, error=failed,
+                          chars=sum(len(piece) for piece in parts))
+        response = ''.join(parts)
+        if key is not None and response.strip():
+            await asyncio.get_event_loop().run_in_executor(None, self.cache.put, key, response)
+
+    async def chat(self, messages: List[Dict]) -> str:
+        """Return the full content of a chat response."""
+        return ''.join([content async for content in self.chat_stream(messages)])
+
+    async def warm_up(self) -> None:
+        """Have Ollama load the model now, with the empty chat request it treats as a load, not at the first chunk."""
+        start = time.perf_counter()
+        try:
+            await self._client.chat(model=self.model, messages=[])
+            logger.info(f"Model {self.model} loaded in {time.perf_counter() - start:.2f}s")
+        except Exception as e:
+            logger.warning(f"Could not preload {self.model}: {e}")
+
+    async def aclose(self) -> None:
+        if self.cache is not None:
+            await asyncio.get_event_loop().run_in_executor(None, self.cache.close)
+        close = getattr(self._client, 'close', None)
+        if close is not None:
+            await close()
+
+class FakeAsyncClient:
+    """Local stand-in for `ollama.AsyncClient`, for tests and offline runs.
+
+    Streams the first `answer_words` words of the last message back, after
+    `first_token_latency` seconds and at `tokens_per_second`, and ends with
+    the token counts Ollama reports. Pass it as `OllamaClient(client=...)`.
+    """
+
+    def __init__(self, first_token_latency: float = 0.05, tokens_per_second: float = 200.0,
+                 answer_words: int = 60):
+        self.first_token_latency = first_token_latency
+        self.tokens_per_second = tokens_per_second
+        self.answer_words = answer_words
+        self.requests = 0
+
+    async def _stream(self, messages: List[Dict]) -> AsyncIterator[Dict]:
+        self.requests += 1
+        prompt = ' '.join(m['content'] for m in messages)
+        words = (messages[-1]['content'].split(':', 1)[-1].split() if messages else [])[:self.answer_words]
+        start = time.perf_counter()
+        await asyncio.sleep(self.first_token_latency)
+        for i, word in enumerate(words):
+            if i:
+                await asyncio.sleep(1 / self.tokens_per_second)
+            yield {'message': {'role': 'assistant', 'content': word + ' '}, 'done': False}
+        yield {'message': {'role': 'assistant', 'content': ''}, 'done': True,
+               'prompt_eval_count': len(prompt) // 4 + 1, 'eval_count': len(words),
+               'eval_duration': int((time.perf_counter() - start) * 1e9)}
+
+    async def chat(self, model: str, messages: Optional[List[Dict]] = None, options: Optional[Dict] = None,
+                   stream: bool = False, **kwargs):
+        if stream:
+            return self._stream(messages or [])
+        parts = [part async for part in self._stream(messages or [])]
+        return {**parts[-1], 'message': {'role': 'assistant',
+                                         'content': ''.join(p['message']['content'] for p in parts)}}
+
+    async def close(self) -> None:
+        pass
+
+_shared_client: Optional[OllamaClient] = None
+
+def get_client() -> OllamaClient:
+    """Return the process-wide client, creating it on first use."""
+    global _shared_client
+    if _shared_client is None:
+        _shared_client = OllamaClient(options={'num_ctx': CONTEXT_TOKENS},
+                                      cache=ResponseCache() if USE_RESPONSE_CACHE else None)
+        logger.info(f"Ollama client ready (model: {_shared_client.model}, pool size: {DEFAULT_POOL_SIZE}, "
+                    f"context: {CONTEXT_TOKENS} tokens)")
+    return _shared_client
+
+async def close_client() -> None:
+    """Close the shared client; the next `get_client` call opens a new one."""
+    global _shared_client
+    if _shared_client is not None:
+        await _shared_client.aclose()
+        _shared_client = None
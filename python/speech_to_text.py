@@ -1,11 +1,23 @@
-import speech_recognition as sr
 import logging
-from pydub import AudioSegment
-from typing import List, Optional, Dict, Tuple
+from typing import Callable, List, Optional, Dict, Set, Tuple
 import os
 from multiprocessing import Pool, cpu_count
+from queue import Empty, SimpleQueue
 import json
 import asyncio
+import concurrent.futures
+import contextlib
+import itertools
+import threading
+import time
+import wave
+import numpy as np
+from audio_dsp import TARGET_RATE, pcm_to_array, to_mono_16k
+from transcript_cache import TranscriptCache, cache_key
+from stt_backends import NoSpeechError, TranscriptionError, get_backend
+from vad import segment_on_silence
+from tracing import get_tracer
+from transcript_store import TranscriptStore
 
 logging.basicConfig(
     level=logging.INFO,
@@ -13,95 +25,417 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def split_audio(file_path: str, chunk_length_ms: int = 150000) -> List[AudioSegment]:
-    """Split audio file into manageable chunks."""
+# Engine used by process_chunk, see stt_backends.BACKENDS; options are JSON keyword arguments
+STT_BACKEND = os.environ.get("STT_BACKEND", "google")
+STT_BACKEND_OPTIONS = json.loads(os.environ.get("STT_BACKEND_OPTIONS", "{}"))
+transcript_cache = TranscriptCache()
+# Cut chunks at pauses and trim long silences; STT_SILENCE_SPLIT=0 restores fixed 150 s cuts
+SILENCE_AWARE_SPLIT = os.environ.get("STT_SILENCE_SPLIT", "1") != "0"
+# How often a transcription thread blocked on results or on the queue checks for cancellation
+STOP_POLL_SECONDS = 0.5
+
+def split_audio(file_path: str, chunk_length_ms: int = 150000) -> List[Dict]:
+    """Split audio file into manageable chunks.
+
+    Only the WAV header is read here. Each chunk is a small window
+    `{'path', 'start_frame', 'num_frames'}` that the worker reads itself,
+    so memory stays flat whatever the file length and nothing large is
+    pickled to the Pool.
+    """
     try:
-        audio = AudioSegment.from_wav(file_path)
-        return [audio[i:i + chunk_length_ms] 
-                for i in range(0, len(audio), chunk_length_ms)]
+        with wave.open(file_path, 'rb') as wf:
+            total_frames = wf.getnframes()
+            frames_per_chunk = max(1, wf.getframerate() * chunk_length_ms // 1000)
+        return [{'path': file_path, 'start_frame': start,
+                 'num_frames': min(frames_per_chunk, total_frames - start)}
+                for start in range(0, total_frames, frames_per_chunk)]
     except Exception as e:
         logger.error(f"Error splitting audio: {str(e)}")
         return []
 
-def process_chunk(chunk_data: Dict) -> Optional[str]:
-    """Process individual audio chunk with multiprocessing support."""
-    chunk = chunk_data['chunk']
+def read_window_raw(window: Dict) -> Tuple[bytes, int, int, int]:
+    """Read one chunk window from disk as stored, seeking straight to its first frame.
+
+    Windows from `segment_on_silence` carry `ranges`; only those spans are
+    read and joined, so trimmed silence never reaches the recognizer.
+    Returns `(frames, sample_rate, channels, sample_width)`.
+    """
+    spans = window.get('ranges') or [(window['start_frame'], window['num_frames'])]
+    with wave.open(window['path'], 'rb') as wf:
+        parts = []
+        for start_frame, num_frames in spans:
+            wf.setpos(start_frame)
+            parts.append(wf.readframes(num_frames))
+        return b''.join(parts), wf.getframerate(), wf.getnchannels(), wf.getsampwidth()
+
+def read_window(window: Dict) -> Tuple[np.ndarray, int]:
+    """Samples of one chunk window as a `(frames, channels)` int16 array, and the sample rate."""
+    raw, sample_rate, channels, sample_width = read_window_raw(window)
+    return pcm_to_array(raw, sample_width, channels), sample_rate
+
+def window_seconds(window: Dict, sample_rate: int) -> Tuple[float, float]:
+    """Audio a chunk window covers, as `(start, end)` seconds from the start of its file."""
+    spans = window.get('ranges') or [(window['start_frame'], window['num_frames'])]
+    return spans[0][0] / sample_rate, (spans[-1][0] + spans[-1][1]) / sample_rate
+
+def is_stt_format(sample_rate: int, channels: int, sample_width: int) -> bool:
+    """16 kHz mono 16-bit: the PCM the backends take, usable without decoding or resampling."""
+    return (sample_rate, channels, sample_width) == (TARGET_RATE, 1, 2)
+
+def process_chunk(chunk_data: Dict) -> Dict:
+    """Process individual audio chunk with multiprocessing support.
+
+    The STT backend named in `chunk_data` is loaded once per worker process
+    and reused for every chunk that worker handles. Live segments carry
+    their 16 kHz mono audio as `pcm` instead of a file window, and windows
+    of files already in the STT format are passed on as read.
+    Returns `{'chunk_num', 'text', 'cached', 'timings'}`; `text` is None when
+    nothing was transcribed and `timings` maps each stage to its
+    `(wall-clock start, seconds)`, for the parent to trace (see `record_chunk_timings`).
+    """
     chunk_num = chunk_data['chunk_num']
-    total_chunks = chunk_data['total_chunks']
+    total_chunks = chunk_data.get('total_chunks') or '?'
+    timings = {}
+    result = {'chunk_num': chunk_num, 'text': None, 'cached': False, 'timings': timings}
+
+    def timed(stage, fn, *args):
+        start_wall, start = time.time(), time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            timings[stage] = (start_wall, time.perf_counter() - start)
     
     try:
-        recognizer = sr.Recognizer()
-        recognizer.energy_threshold = 300
-        recognizer.dynamic_energy_threshold = True
-        
-        processed_chunk = (chunk
-                         .set_frame_rate(16000)
-                         .set_channels(1))
-        audio_data = sr.AudioData(
-            processed_chunk.raw_data,
-            sample_rate=16000,
-            sample_width=2
-        )
-        text = recognizer.recognize_google(audio_data, language="it-IT")
+        backend = get_backend(chunk_data.get('backend', STT_BACKEND),
+                              chunk_data.get('backend_options', STT_BACKEND_OPTIONS))
+        pcm = chunk_data.get('pcm')
+        if pcm is None:
+            raw, rate, channels, width = timed('audio_read', read_window_raw, chunk_data['chunk'])
+            if is_stt_format(rate, channels, width):
+                pcm = raw
+            else:
+                pcm = timed('resample', lambda: to_mono_16k(pcm_to_array(raw, width, channels), rate).tobytes())
+        key = cache_key(pcm, backend.settings())
+        cached_text = timed('cache_lookup', transcript_cache.get, key)
+        if cached_text is not None:
+            logger.info(f"Chunk {chunk_num}/{total_chunks} loaded from transcript cache")
+            result.update(text=cached_text or None, cached=True)
+            return result
+
+        try:
+            text = timed('stt', backend.transcribe, pcm)
+        except NoSpeechError:
+            transcript_cache.put(key, "")
+            raise
+        transcript_cache.put(key, text)
         logger.info(f"Chunk {chunk_num}/{total_chunks} transcribed successfully")
-        return text
-    except sr.UnknownValueError:
+        result['text'] = text
+    except NoSpeechError:
         logger.warning(f"Chunk {chunk_num}: Speech not understood")
-    except sr.RequestError as e:
-        logger.error(f"Chunk {chunk_num}: API error - {str(e)}")
+    except TranscriptionError as e:
+        logger.error(f"Chunk {chunk_num}: {str(e)}")
     except Exception as e:
         logger.error(f"Chunk {chunk_num}: Unexpected error - {str(e)}")
-    return None
+    return result
+
+def record_chunk_timings(result: Dict, **attrs) -> None:
+    """Trace the per-stage timings a worker returned with a chunk result."""
+    tracer = get_tracer()
+    for stage, (start, seconds) in result.get('timings', {}).items():
+        tracer.record(stage, seconds, start, chunk=result['chunk_num'], **attrs)
+
+def _init_worker(backend: str, backend_options: Dict) -> None:
+    """Pool initializer: load the STT backend before the first chunk arrives."""
+    get_backend(backend, backend_options)
+
+def _worker_ready(_: int) -> int:
+    return os.getpid()
+
+class TranscriptionPool:
+    """Long-lived STT worker pool, shared by every file of a batch.
+
+    Workers are forked once and warmed up by `_init_worker`, so backend
+    models and recognizers survive from one file to the next. Startup and
+    teardown times are kept for the timing statistics.
+    """
+
+    def __init__(self, processes: Optional[int] = None, backend: Optional[str] = None,
+                 backend_options: Optional[Dict] = None):
+        self.processes = processes or max(1, cpu_count() - 1)
+        self.backend = backend or STT_BACKEND
+        if backend_options is None:
+            backend_options = STT_BACKEND_OPTIONS if self.backend == STT_BACKEND else {}
+        self.backend_options = backend_options
+        self.startup_seconds = 0.0
+        self.teardown_seconds = 0.0
+        self._pool = None
+
+    def start(self) -> 'TranscriptionPool':
+        start = time.perf_counter()
+        self._pool = Pool(processes=self.processes, initializer=_init_worker,
+                          initargs=(self.backend, self.backend_options))
+        # Round-trip one trivial task per worker so startup includes the warm-up
+        self._pool.map(_worker_ready, range(self.processes), chunksize=1)
+        self.startup_seconds = time.perf_counter() - start
+        logger.info(f"STT pool: {self.processes} workers ({self.backend}) ready in {self.startup_seconds:.2f}s")
+        return self
+
+    def submit(self, chunk: Dict, callback: Callable[[Dict], None]) -> None:
+        def failed(error: BaseException) -> None:
+            logger.error(f"Chunk {chunk['chunk_num']}: worker error - {error}")
+            callback({'chunk_num': chunk['chunk_num'], 'text': None, 'cached': False})
+
+        self._pool.apply_async(process_chunk, (chunk,), callback=callback, error_callback=failed)
 
-async def process_and_save_chunks(chunks: List[Dict], output_dir: str = "text") -> List[Tuple[int, str]]:
-    """Process chunks and save them sequentially."""
-    os.makedirs(output_dir, exist_ok=True)
+    def close(self) -> None:
+        if self._pool is None:
+            return
+        start = time.perf_counter()
+        self._pool.close()
+        self._pool.join()
+        self._pool = None
+        self.teardown_seconds = time.perf_counter() - start
+        logger.info(f"STT pool closed in {self.teardown_seconds:.2f}s")
+
+    def timing_report(self) -> str:
+        return (f"STT pool startup: {self.startup_seconds:.2f}s, "
+                f"teardown: {self.teardown_seconds:.2f}s ({self.processes} workers)")
+
+    def __enter__(self) -> 'TranscriptionPool':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+class _Stopped(Exception):
+    """Raised in the transcription thread once its `process_and_save_chunks` call is cancelled."""
+
+async def process_and_save_chunks(chunks: List[Dict], output_dir: str = "text",
+                                  queue: Optional[asyncio.Queue] = None,
+                                  on_chunk_saved: Optional[Callable[[int, str, int], None]] = None,
+                                  pool: Optional[TranscriptionPool] = None,
+                                  store: Optional[TranscriptStore] = None,
+                                  stt_slot: Optional[asyncio.Semaphore] = None
+                                  ) -> List[Tuple[int, str]]:
+    """Process chunks and save them as they finish, handing them on in chunk order.
+
+    Chunks go to `pool` (or a pool created just for this call) a few at a
+    time and come back in completion order. Each one is added to `store`
+    (by default the transcript store of `output_dir`) with the audio offsets
+    in its `offset` and reported through `on_chunk_saved(chunk_num, text,
+    total_chunks)` as soon as it arrives, then reordered. When `queue` is
+    given, saved chunks are put on it in order as `(chunk_num, total_chunks,
+    text)` so a consumer can summarize while transcription is still running.
+    A full queue stops further chunks being submitted. `stt_slot` is held
+    while chunks are being transcribed and given up while the thread waits
+    on a full queue, so a slow summarizer does not keep other files out of
+    the pool. Cancelling the call stops the transcription thread at its next
+    wait and waits for it to exit.
+    """
+    own_store = store is None
+    if own_store:
+        store = TranscriptStore.open(output_dir)
     processed_chunks = []
-    num_processes = max(1, cpu_count() - 1)
-    logger.info(f"Processing with {num_processes} cores")
+    total_chunks = chunks[0]['total_chunks'] if chunks else 0
     loop = asyncio.get_event_loop()
-    
-    with Pool(processes=num_processes) as pool:
-        for i, result in enumerate(pool.imap(process_chunk, chunks), 1):
-            if result:
-                chunk_file = os.path.join(output_dir, f"chunk_{i:03d}.txt")
-                with open(chunk_file, "w", encoding="utf-8") as f:
-                    f.write(result)
-                processed_chunks.append((i, chunk_file))
-                logger.info(f"Saved chunk {i} to {chunk_file}")
-    metadata = {
-        "total_chunks": len(chunks),
-        "processed_chunks": len(processed_chunks),
-        "chunk_files": [f[1] for f in processed_chunks]
-    }
-    with open(os.path.join(output_dir, "chunks_metadata.json"), "w") as f:
-        json.dump(metadata, f, indent=2)
-    
+    cache_hits = []
+    tracer = get_tracer()
+    source = os.path.basename(chunks[0]['chunk']['path']) if chunks else None
+    offsets = {chunk['chunk_num']: chunk['offset'] for chunk in chunks if chunk.get('offset')}
+    stop = threading.Event()
+    holds_slot = False
+
+    async def hand_on(item: Tuple[int, int, str]) -> None:
+        nonlocal holds_slot
+        if stt_slot is None or not queue.full():
+            await queue.put(item)
+            return
+        stt_slot.release()
+        holds_slot = False
+        await queue.put(item)
+        await stt_slot.acquire()
+        holds_slot = True
+
+    def wait_for(get):
+        """`get(timeout)` retried until it returns, or _Stopped once the call is cancelled."""
+        while True:
+            try:
+                return get(STOP_POLL_SECONDS)
+            except (Empty, concurrent.futures.TimeoutError):
+                if stop.is_set():
+                    raise _Stopped()
+
+    def run_pool(stt_pool: TranscriptionPool) -> None:
+        # Chunks submitted but not yet saved; bounds how far STT can run ahead.
+        # apply_async rather than a lazily fed imap, whose generator would hold the
+        # pool's single task-handler thread and stall other files sharing the pool.
+        max_in_flight = stt_pool.processes * 2
+        arrived = SimpleQueue()
+        pending = iter(chunks)
+        order = [chunk['chunk_num'] for chunk in chunks]
+        ready = {}
+        submitted = {}
+        next_index = 0
+        in_flight = 0
+
+        def submit(chunk: Dict) -> None:
+            submitted[chunk['chunk_num']] = time.perf_counter()
+            stt_pool.submit(chunk, arrived.put)
+
+        for chunk in itertools.islice(pending, max_in_flight):
+            submit(chunk)
+            in_flight += 1
+        while in_flight:
+            result = wait_for(lambda timeout: arrived.get(timeout=timeout))
+            in_flight -= 1
+            i = result['chunk_num']
+            cache_hits.append(result['cached'])
+            tracer.record('stt_chunk', time.perf_counter() - submitted.pop(i), chunk=i,
+                          file=source, cached=result['cached'])
+            record_chunk_timings(result, file=source)
+            if result['text']:
+                start, end = offsets.get(i, (None, None))
+                with tracer.span('file_io', op='write_chunk', chunk=i, file=source):
+                    store.add_chunk(i, result['text'], start, end, cached=result['cached'], timings={
+                        stage: round(seconds, 4) for stage, (_, seconds) in result.get('timings', {}).items()
+                    })
+                logger.info(f"Saved chunk {i} to {store.path}")
+                if on_chunk_saved is not None:
+                    on_chunk_saved(i, result['text'], total_chunks)
+            ready[i] = result['text']
+            while next_index < len(order) and order[next_index] in ready:
+                num = order[next_index]
+                next_index += 1
+                if ready[num] is None:
+                    continue
+                processed_chunks.append((num, ready[num]))
+                if queue is not None:
+                    # Time blocked here is backpressure from the summarizer
+                    with tracer.span('stt_queue_wait', chunk=num, file=source):
+                        put = asyncio.run_coroutine_threadsafe(
+                            hand_on((num, total_chunks, ready[num])), loop
+                        )
+                        try:
+                            wait_for(lambda timeout: put.result(timeout))
+                        except _Stopped:
+                            put.cancel()
+                            raise
+            next_chunk = next(pending, None)
+            if next_chunk is not None:
+                submit(next_chunk)
+                in_flight += 1
+
+    def run_with_own_pool() -> None:
+        with TranscriptionPool(backend=chunks[0].get('backend'),
+                               backend_options=chunks[0].get('backend_options')) as own_pool:
+            run_pool(own_pool)
+        logger.info(own_pool.timing_report())
+
+    try:
+        if chunks:
+            store.set_info(total_chunks=total_chunks)
+            if stt_slot is not None:
+                await stt_slot.acquire()
+                holds_slot = True
+            work = (loop.run_in_executor(None, run_pool, pool) if pool is not None
+                    else loop.run_in_executor(None, run_with_own_pool))
+            try:
+                await asyncio.shield(work)
+            except asyncio.CancelledError:
+                # The thread may be blocked on a queue nobody drains any more
+                stop.set()
+                with contextlib.suppress(_Stopped):
+                    await work
+                raise
+    finally:
+        if holds_slot:
+            stt_slot.release()
+        if own_store:
+            store.close()
+        else:
+            store.flush()
+    hits = sum(cache_hits)
+    logger.info(f"Transcript cache: {hits} hits, {len(cache_hits) - hits} misses")
+    await loop.run_in_executor(None, transcript_cache.evict)
     return processed_chunks
 
-async def transcribe_audio_file(file_path: str) -> bool:
-    """Main transcription function using multiprocessing."""
+async def transcribe_audio_file(file_path: str, queue: Optional[asyncio.Queue] = None,
+                                output_dir: str = "text", skip_chunks: Optional[Set[int]] = None,
+                                on_chunk_saved: Optional[Callable[[int, str, int], None]] = None,
+                                store: Optional[TranscriptStore] = None,
+                                decode_slot: Optional[asyncio.Semaphore] = None,
+                                stt_slot: Optional[asyncio.Semaphore] = None,
+                                backend: Optional[str] = None,
+                                backend_options: Optional[Dict] = None,
+                                pool: Optional[TranscriptionPool] = None) -> bool:
+    """Main transcription function using multiprocessing.
+
+    Pass `queue` to stream saved chunks to a consumer, see `process_and_save_chunks`.
+    Transcripts go to `store`; without one, a new transcript replaces the
+    store of `output_dir`. Chunk numbers in `skip_chunks` were transcribed by
+    an earlier run and are not sent again.
+    `decode_slot` is held while splitting and `stt_slot` while the pool
+    transcribes (see `process_and_save_chunks`), so a batch can bound how
+    many files are in each stage at once.
+    `backend`/`backend_options` pick the STT engine for this run (default:
+    STT_BACKEND and STT_BACKEND_OPTIONS from the environment). Pass a started
+    `pool` to reuse warm workers across files instead of forking new ones.
+    """
     if not os.path.exists(file_path):
         logger.error("File not found")
         return False
 
     try:
-        chunks = split_audio(file_path)
+        async with decode_slot or contextlib.nullcontext():
+            splitter = segment_on_silence if SILENCE_AWARE_SPLIT else split_audio
+            with get_tracer().span('split', file=os.path.basename(file_path)) as span:
+                chunks = await asyncio.get_event_loop().run_in_executor(None, splitter, file_path)
+                if not chunks and splitter is segment_on_silence:
+                    logger.warning("No speech found by the silence-aware split, cutting fixed-length chunks")
+                    chunks = await asyncio.get_event_loop().run_in_executor(None, split_audio, file_path)
+                span['chunks'] = len(chunks)
         if not chunks:
             return False
 
         total_chunks = len(chunks)
+        with wave.open(file_path, 'rb') as wf:
+            sample_rate = wf.getframerate()
+        if pool is not None and backend is None and backend_options is None:
+            backend, backend_options = pool.backend, pool.backend_options
+        backend = backend or STT_BACKEND
+        if backend_options is None:
+            backend_options = STT_BACKEND_OPTIONS if backend == STT_BACKEND else {}
         chunk_data_list = [
             {
                 'chunk': chunk,
                 'chunk_num': i + 1,
-                'total_chunks': total_chunks
+                'total_chunks': total_chunks,
+                'offset': window_seconds(chunk, sample_rate),
+                'backend': backend,
+                'backend_options': backend_options
             }
             for i, chunk in enumerate(chunks)
+            if not skip_chunks or i + 1 not in skip_chunks
         ]
-        processed_chunks = await process_and_save_chunks(chunk_data_list)
+        own_store = store is None
+        if own_store:
+            store = TranscriptStore.open(output_dir)
+            store.clear()
+        try:
+            store.set_info(audio_file=file_path)
+            await process_and_save_chunks(
+                chunk_data_list, output_dir, queue=queue, on_chunk_saved=on_chunk_saved, pool=pool,
+                store=store, stt_slot=stt_slot
+            )
+        finally:
+            if own_store:
+                store.close()
         
-        if input("\nDelete original audio file? (y/n): ").lower().strip() in {'y', 'yes'}:
+        # Ask off the event loop so streamed summaries keep running meanwhile
+        answer = await asyncio.get_event_loop().run_in_executor(
+            None, input, "\nDelete original audio file? (y/n): "
+        )
+        if answer.lower().strip() in {'y', 'yes'}:
             try:
                 os.remove(file_path)
                 logger.info("Original file deleted successfully")
@@ -0,0 +1,185 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LANGUAGE = 'it-IT'
+
+class NoSpeechError(Exception):
+    """The backend heard no recognizable speech; a stable, cacheable result."""
+
+class TranscriptionError(Exception):
+    """The backend failed for this chunk (network, rate limit, engine error)."""
+
+class STTBackend:
+    """Speech-to-text engine used by the Pool workers.
+
+    `load` runs once per worker process (heavy models live here) and
+    `transcribe` once per chunk, on 16 kHz mono int16 PCM.
+    """
+
+    name = 'base'
+
+    def __init__(self, language: str = DEFAULT_LANGUAGE, **options):
+        self.language = language
+        self.options = options
+
+    def settings(self) -> Dict:
+        """Everything that changes the transcript; part of the transcript cache key."""
+        return {'engine': self.name, 'language': self.language, 'sample_rate': 16000, **self.options}
+
+    def load(self) -> None:
+        pass
+
+    def transcribe(self, pcm: bytes) -> str:
+        raise NotImplementedError
+
+class GoogleBackend(STTBackend):
+    """Google Web Speech API through speech_recognition (network round-trip per chunk).
+
+    `endpoint` replaces the API URL, e.g. with the local stand-in of the
+    offline benchmarks (benchmarks/fake_services.py).
+    """
+
+    name = 'google'
+
+    def __init__(self, language: str = DEFAULT_LANGUAGE, energy_threshold: int = 300,
+                 dynamic_energy_threshold: bool = True, endpoint: Optional[str] = None):
+        super().__init__(language, energy_threshold=energy_threshold,
+                         dynamic_energy_threshold=dynamic_energy_threshold)
+        if endpoint:
+            self.options['endpoint'] = endpoint
+        self._sr = None
+        self._recognizer = None
+
+    def load(self) -> None:
+        import speech_recognition as sr
+        self._sr = sr
+        self._recognizer = sr.Recognizer()
+        self._recognizer.energy_threshold = self.options['energy_threshold']
+        self._recognizer.dynamic_energy_threshold = self.options['dynamic_energy_threshold']
+
+    def transcribe(self, pcm: bytes) -> str:
+        audio_data = self._sr.AudioData(pcm, sample_rate=16000, sample_width=2)
+        try:
+            extra = {'endpoint': self.options['endpoint']} if 'endpoint' in self.options else {}
+            return self._recognizer.recognize_google(audio_data, language=self.language, **extra)
+        except self._sr.UnknownValueError:
+            raise NoSpeechError()
+        except self._sr.RequestError as e:
+            raise TranscriptionError(f"API error - {e}")
+
+class VoskBackend(STTBackend):
+    """Offline Kaldi recognizer; `model_path` points to an unpacked Vosk model."""
+
+    name = 'vosk'
+
+    def __init__(self, language: str = DEFAULT_LANGUAGE,
+                 model_path: str = 'models/vosk-model-small-it-0.22'):
+        super().__init__(language, model_path=model_path)
+        self._vosk = None
+        self._model = None
+
+    def load(self) -> None:
+        import vosk
+        vosk.SetLogLevel(-1)
+        self._vosk = vosk
+        self._model = vosk.Model(self.options['model_path'])
+
+    def transcribe(self, pcm: bytes) -> str:
+        recognizer = self._vosk.KaldiRecognizer(self._model, 16000)
+        recognizer.AcceptWaveform(pcm)
+        text = json.loads(recognizer.FinalResult()).get('text', '').strip()
+        if not text:
+            raise NoSpeechError()
+        return text
+
+class FasterWhisperBackend(STTBackend):
+    """Whisper on CPU through faster-whisper (CTranslate2, int8 by default)."""
+
+    name = 'faster-whisper'
+
+    def __init__(self, language: str = DEFAULT_LANGUAGE, model_size: str = 'small',
+                 compute_type: str = 'int8', beam_size: int = 1, cpu_threads: int = 1):
+        super().__init__(language, model_size=model_size, compute_type=compute_type,
+                         beam_size=beam_size, cpu_threads=cpu_threads)
+        self._model = None
+
+    def load(self) -> None:
+        from faster_whisper import WhisperModel
+        self._model = WhisperModel(
+            self.options['model_size'],
+            device='cpu',
+            compute_type=self.options['compute_type'],
+            cpu_threads=self.options['cpu_threads']
+        )
+
+    def transcribe(self, pcm: bytes) -> str:
+        audio = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+        segments, _ = self._model.transcribe(
+            audio,
+            language=self.language.split('-')[0],
+            beam_size=self.options['beam_size']
+        )
+        text = ' '.join(segment.text.strip() for segment in segments).strip()
+        if not text:
+            raise NoSpeechError()
+        return text
+
+class FakeBackend(STTBackend):
+    """Deterministic stand-in for offline benchmarks.
+
+    The transcript is derived from a hash of the PCM, about 2.5 words per
+    second of audio. `latency` adds a fixed delay per chunk and
+    `realtime_factor` a delay proportional to the audio length; a chunk
+    fails with `error_rate` probability, also decided by its hash.
+    """
+
+    name = 'fake'
+    VOCABULARY = ('lezione', 'storia', 'filosofia', 'concetto', 'esempio', 'quindi', 'autore',
+                  'opera', 'periodo', 'teoria', 'importante', 'secolo', 'idea', 'problema')
+
+    def __init__(self, language: str = DEFAULT_LANGUAGE, latency: float = 0.0,
+                 realtime_factor: float = 0.0, error_rate: float = 0.0):
+        super().__init__(language, latency=latency, realtime_factor=realtime_factor,
+                         error_rate=error_rate)
+
+    def transcribe(self, pcm: bytes) -> str:
+        seconds = len(pcm) / 2 / 16000
+        time.sleep(self.options['latency'] + self.options['realtime_factor'] * seconds)
+        rng = random.Random(hashlib.sha256(pcm).digest())
+        if rng.random() < self.options['error_rate']:
+            raise TranscriptionError("simulated failure")
+        words = [rng.choice(self.VOCABULARY) for _ in range(int(seconds * 2.5))]
+        if not words or not np.frombuffer(pcm, dtype=np.int16).any():
+            raise NoSpeechError()
+        return ' '.join(words) + '.'
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (GoogleBackend, VoskBackend, FasterWhisperBackend, FakeBackend)
+}
+
+_loaded_backends: Dict[str, STTBackend] = {}
+
+def get_backend(name: str, options: Optional[Dict] = None) -> STTBackend:
+    """Backend for this process, built and loaded on first use and reused for every later chunk."""
+    key = json.dumps([name, options or {}], sort_keys=True)
+    backend = _loaded_backends.get(key)
+    if backend is None:
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown STT backend '{name}', choose from {sorted(BACKENDS)}")
+        backend = BACKENDS[name](**(options or {}))
+        start = time.perf_counter()
+        backend.load()
+        logger.info(f"STT backend '{name}' loaded in process {os.getpid()} "
+                    f"({time.perf_counter() - start:.2f}s)")
+        _loaded_backends[key] = backend
+    return backend
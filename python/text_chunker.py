@@ -0,0 +1,73 @@
+import re
+from typing import Iterator
+
+# Characters per token assumed when no measured ratio is available
+DEFAULT_CHARS_PER_TOKEN = 3.0
+
+# A paragraph break, or sentence-ending punctuation followed by whitespace
+_BOUNDARY = re.compile(r'\n[ \t]*\n|[.!?…](?=\s)')
+# Greedy: the last such boundary in the searched window
+_LAST_BOUNDARY = re.compile(r'.*(?:\n[ \t]*\n|[.!?…](?=\s))', re.S)
+_LAST_SPACE = re.compile(r'.*\s', re.S)
+_SPACE = re.compile(r'\s')
+
+def _overlap_start(text: str, start: int, cut: int, overlap_chars: int) -> int:
+    """Where the next chunk starts: the first sentence, or failing that word, in the last `overlap_chars` before `cut`."""
+    if overlap_chars <= 0:
+        return cut
+    lo = max(start + 1, cut - overlap_chars)
+    match = _BOUNDARY.search(text, lo, cut) or _SPACE.search(text, lo, cut)
+    return match.end() if match else cut
+
+def iter_chunks(text: str, max_tokens: int, overlap_tokens: int = 0,
+                chars_per_token: float = DEFAULT_CHARS_PER_TOKEN) -> Iterator[str]:
+    """Yield chunks of `text` of at most `max_tokens`, cut at sentence ends where possible.
+
+    Each chunk ends at the last paragraph break or sentence-ending
+    punctuation that fits; with none in reach (an unpunctuated STT
+    transcript, say) it ends at the last whitespace, and a single word
+    longer than a whole chunk is cut where the budget runs out. Consecutive
+    chunks share up to `overlap_tokens`, starting at a sentence when one
+    begins in that stretch. Tokens are estimated as `len / chars_per_token`,
+    rounded up. Every cut is found by one regex scan of the window, so the
+    text is read in linear time and only the yielded chunks are copied.
+    """
+    if not 0 <= overlap_tokens < max_tokens:
+        raise ValueError("overlap_tokens must be at least 0 and smaller than max_tokens")
+    # Rounded-up estimate of a chunk of max_chars must still be within max_tokens
+    max_chars = max(1, int((max_tokens - 1) * chars_per_token))
+    overlap_chars = int(overlap_tokens * chars_per_token)
+    start = covered = 0
+    end = len(text)
+    while end and text[end - 1].isspace():
+        end -= 1
+    while start < end:
+        if end - start <= max_chars:
+            cut = end
+        else:
+            # With overlap the window starts before the previous cut; it must reach new text
+            window_end = start + max_chars
+            match = _LAST_BOUNDARY.match(text, start, window_end)
+            if not match or match.end() <= covered:
+                if start < covered and _LAST_BOUNDARY.match(text, covered, covered + max_chars):
+                    # Rather give up the overlap than cut a sentence in the middle
+                    start = covered
+                    continue
+                match = _LAST_SPACE.match(text, start, window_end)
+            if match and match.end() > covered:
+                cut = match.end()
+            elif start < covered:
+                # The overlap leaves no room for a whole word: drop it for this chunk
+                start = covered
+                continue
+            else:
+                cut = window_end
+        chunk = text[start:cut].strip()
+        if chunk:
+            yield chunk
+        if cut == end:
+            break
+        covered = cut
+        while text[covered].isspace():
+            covered += 1
+        start = _overlap_start(text, start, cut, overlap_chars)
@@ -0,0 +1,191 @@
+import bisect
+import contextlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# JSON-lines trace of every span; TRACE_DIR= (empty) turns the file off
+TRACE_DIR = os.environ.get("TRACE_DIR", "traces")
+# Serve the histograms as Prometheus text on this port, e.g. METRICS_PORT=9464
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+
+DURATION_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+# Observations per histogram kept for percentiles; beyond this they are a uniform sample
+RESERVOIR_SIZE = 1024
+
+class Histogram:
+    """Cumulative-bucket histogram with a running sum, count and max.
+
+    Percentiles come from a reservoir of at most `reservoir_size` values,
+    a uniform sample of everything observed (exact until it fills), so a
+    long-running process holds a fixed amount per histogram.
+    """
+
+    def __init__(self, buckets: tuple, reservoir_size: int = RESERVOIR_SIZE):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = float('-inf')
+        self.reservoir_size = reservoir_size
+        self.reservoir: List[float] = []
+        self._random = random.Random(0)
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        if len(self.reservoir) < self.reservoir_size:
+            self.reservoir.append(value)
+        else:
+            slot = self._random.randrange(self.count)
+            if slot < self.reservoir_size:
+                self.reservoir[slot] = value
+
+    def percentile(self, q: float) -> float:
+        ordered = sorted(self.reservoir)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+class Tracer:
+    """Per-stage spans for the whole pipeline.
+
+    Every span is appended to the JSON-lines trace (when `trace_path` is set)
+    and observed in a per-stage duration histogram. Rates such as LLM
+    tokens/s go to separate histograms through `observe`. Safe to use from
+    the executor and recording threads.
+    """
+
+    def __init__(self, trace_path: Optional[str] = None):
+        self.trace_path = trace_path
+        self.durations: Dict[str, Histogram] = {}
+        self.rates: Dict[str, Histogram] = {}
+        self.counters: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._file = None
+        self._server = None
+        if trace_path:
+            os.makedirs(os.path.dirname(trace_path) or ".", exist_ok=True)
+            self._file = open(trace_path, "a", encoding="utf-8", buffering=1)
+
+    def record(self, stage: str, seconds: float, start: Optional[float] = None, **attrs) -> None:
+        """Record a finished span; `start` is its wall-clock start, defaulting to now minus `seconds`."""
+        start = time.time() - seconds if start is None else start
+        with self._lock:
+            self.durations.setdefault(stage, Histogram(DURATION_BUCKETS)).observe(seconds)
+            if self._file is not None:
+                self._file.write(json.dumps({'stage': stage, 'start': round(start, 6),
+                                             'seconds': round(seconds, 6), **attrs}) + "\n")
+
+    @contextlib.contextmanager
+    def span(self, stage: str, **attrs) -> Iterator[Dict]:
+        """Time the block as one `stage` span; the yielded dict takes extra attributes."""
+        start = time.time()
+        begin = time.perf_counter()
+        try:
+            yield attrs
+        except BaseException:
+            attrs['error'] = True
+            raise
+        finally:
+            self.record(stage, time.perf_counter() - begin, start, **attrs)
+
+    def observe(self, metric: str, value: float) -> None:
+        with self._lock:
+            self.rates.setdefault(metric, Histogram(RATE_BUCKETS)).observe(value)
+
+    def count(self, counter: str, amount: float = 1) -> None:
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def report(self) -> str:
+        """Per-stage table for the timing statistics."""
+        with self._lock:
+            if not self.durations:
+                return "Stages: nothing traced"
+            lines = [f"{'stage':<18}{'count':>7}{'total':>10}{'p50':>9}{'p95':>9}{'max':>9}"]
+            for stage, hist in sorted(self.durations.items()):
+                lines.append(f"{stage:<18}{hist.count:>7}{hist.sum:>9.1f}s"
+                             f"{hist.percentile(0.5):>8.2f}s{hist.percentile(0.95):>8.2f}s{hist.max:>8.2f}s")
+            for metric, hist in sorted(self.rates.items()):
+                lines.append(f"{metric}: p50 {hist.percentile(0.5):.1f}, p5 {hist.percentile(0.05):.1f}, "
+                             f"max {hist.max:.1f}")
+            if self.trace_path:
+                lines.append(f"Trace: {self.trace_path}")
+            return "\n".join(lines)
+
+    def prometheus(self) -> str:
+        """Histograms and counters in the Prometheus text exposition format."""
+        out = []
+        with self._lock:
+            for name, label, histograms in (('pipeline_stage_seconds', 'stage', self.durations),
+                                            ('pipeline_rate', 'metric', self.rates)):
+                out.append(f"# TYPE {name} histogram")
+                for key, hist in sorted(histograms.items()):
+                    cumulative = 0
+                    for bound, count in zip(hist.buckets + ('+Inf',), hist.counts):
+                        cumulative += count
+                        out.append(f'{name}_bucket{{{label}="{key}",le="{bound}"}} {cumulative}')
+                    out.append(f'{name}_sum{{{label}="{key}"}} {hist.sum}')
+                    out.append(f'{name}_count{{{label}="{key}"}} {hist.count}')
+            out.append("# TYPE pipeline_total counter")
+            for counter, value in sorted(self.counters.items()):
+                out.append(f'pipeline_total{{counter="{counter}"}} {value}')
+        return "\n".join(out) + "\n"
+
+    def serve(self, port: int) -> None:
+        """Expose `prometheus()` at http://127.0.0.1:<port>/metrics from a daemon thread."""
+        tracer = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = tracer.prometheus().encode()
+                self.send_response(200 if self.path == "/metrics" else 404)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        logger.info(f"Metrics at http://127.0.0.1:{port}/metrics")
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+_tracer: Optional[Tracer] = None
+
+def get_tracer() -> Tracer:
+    """Return the process-wide tracer, creating it (and the metrics endpoint) on first use."""
+    global _tracer
+    if _tracer is None:
+        trace_path = None
+        if TRACE_DIR:
+            trace_path = os.path.join(TRACE_DIR, time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}.jsonl")
+        _tracer = Tracer(trace_path)
+        if METRICS_PORT:
+            _tracer.serve(METRICS_PORT)
+    return _tracer
+
+def close_tracer() -> None:
+    global _tracer
+    if _tracer is not None:
+        _tracer.close()
+        _tracer = None